@@ -13,4 +13,9 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'sentinelnexus.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Los websockets de consola (noVNC/xterm.js) se atienden fuera de Django
+from submodulos.console import console_router  # noqa: E402
+
+application = console_router(django_application)
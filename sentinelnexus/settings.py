@@ -48,6 +48,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'submodulos.db_routers.PrimaryPinningMiddleware',
+    'submodulos.governor.InteractiveLaneMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -87,6 +89,35 @@ DATABASES = {
     }
 }
 
+# Pool de conexiones de psycopg 3. Django pasa al pool su propia comprobación de salud
+# (check_connection al prestar una conexión) cuando CONN_HEALTH_CHECKS está activo.
+# Con DB_POOL=False se usan conexiones persistentes por hilo.
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if os.environ.get('DB_POOL', 'True').lower() == 'true':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', '10')),
+        },
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', '600'))
+
+# Réplica opcional para las lecturas analíticas (estadísticas y auditoría)
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['submodulos.db_routers.AnalyticsReplicaRouter']
+
+# Segundos que un usuario lee de la principal después de escribir
+DATABASE_REPLICA_LAG = int(os.environ.get('DB_REPLICA_LAG', '5'))
+
 
 # Add these settings for Proxmox
 PROXMOX = {
@@ -104,6 +135,121 @@ if not PROXMOX['host'] or not PROXMOX['user'] or not PROXMOX['password']:
         "Asegúrate de configurar PROXMOX_HOST, PROXMOX_USER y PROXMOX_PASSWORD."
     )
 
+
+# Cache (Redis) compartida entre workers y procesos de recolección
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/1'),
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        },
+    }
+}
+
+
+# Feed incremental de tareas del cluster
+TASK_FEED = {
+    'poll_interval': float(os.environ.get('TASK_FEED_INTERVAL', '5')),
+    'max_tasks': int(os.environ.get('TASK_FEED_MAX_TASKS', '20000')),
+}
+
+
+# Proxy de consola noVNC/xterm.js (ASGI)
+CONSOLE = {
+    'max_sessions_per_node': int(os.environ.get('CONSOLE_MAX_SESSIONS_PER_NODE', '100')),
+    'idle_timeout': int(os.environ.get('CONSOLE_IDLE_TIMEOUT', '900')),
+}
+
+
+# Recolección de métricas por SSH (nodos e invitados)
+SSH_COLLECTOR = {
+    'username': os.environ.get('SSH_COLLECTOR_USER', 'root'),
+    'key_filename': os.environ.get('SSH_COLLECTOR_KEY') or None,
+    'max_parallel_hosts': int(os.environ.get('SSH_COLLECTOR_PARALLEL_HOSTS', '32')),
+    'host_key_policy': os.environ.get('SSH_COLLECTOR_HOST_KEY_POLICY', 'reject'),
+    'known_hosts': os.environ.get('SSH_COLLECTOR_KNOWN_HOSTS') or None,
+}
+
+
+# Historial de configuraciones de VMs
+CONFIG_STORE = {
+    'revalidate_after': int(os.environ.get('CONFIG_REVALIDATE_AFTER', '300')),
+}
+
+
+# Límite de llamadas a Proxmox por nodo (por proceso)
+UPSTREAM_GOVERNOR = {
+    'rate': float(os.environ.get('UPSTREAM_RATE', '20')),
+    'burst': int(os.environ.get('UPSTREAM_BURST', '40')),
+    'max_concurrency': int(os.environ.get('UPSTREAM_MAX_CONCURRENCY', '8')),
+    'interactive_reserve': int(os.environ.get('UPSTREAM_INTERACTIVE_RESERVE', '2')),
+}
+
+# Recolectores distribuidos: reparto de nodos entre workers mediante Redis
+COLLECTORS = {
+    'interval': int(os.environ.get('COLLECTORS_INTERVAL', '300')),
+    'heartbeat': int(os.environ.get('COLLECTORS_HEARTBEAT', '5')),
+    'lease_ttl': int(os.environ.get('COLLECTORS_LEASE_TTL', '20')),
+}
+
+# Sondeo adaptativo del estado de los invitados
+POLL_SCHEDULER = {
+    'min_interval': int(os.environ.get('POLL_MIN_INTERVAL', '10')),
+    'max_interval': int(os.environ.get('POLL_MAX_INTERVAL', '120')),
+    'stopped_interval': int(os.environ.get('POLL_STOPPED_INTERVAL', '600')),
+}
+
+# Invalidación dirigida a partir de cluster/log y cluster/tasks
+CHANGE_DETECTOR = {
+    'poll_interval': float(os.environ.get('CHANGE_DETECTOR_INTERVAL', '5')),
+    'refresh': os.environ.get('CHANGE_DETECTOR_REFRESH', 'True').lower() == 'true',
+}
+
+# Descubrimiento de IPs mediante el agente invitado de QEMU
+IP_DISCOVERY = {
+    'per_node_concurrency': int(os.environ.get('IP_DISCOVERY_PER_NODE', '4')),
+    'deadline': int(os.environ.get('IP_DISCOVERY_DEADLINE', '120')),
+    'ip_ttl': int(os.environ.get('IP_DISCOVERY_TTL', '900')),
+}
+
+# Índice del contenido de los almacenamientos
+STORAGE_INDEX = {
+    'workers': int(os.environ.get('STORAGE_INDEX_WORKERS', '16')),
+    'max_age': int(os.environ.get('STORAGE_INDEX_MAX_AGE', '3600')),
+}
+
+# Inventario y operaciones en bloque de instantáneas
+SNAPSHOTS = {
+    'per_node_concurrency': int(os.environ.get('SNAPSHOTS_PER_NODE', '4')),
+    'task_timeout': int(os.environ.get('SNAPSHOTS_TASK_TIMEOUT', '900')),
+}
+
+# Reequilibrio de carga entre nodos mediante migraciones en caliente
+REBALANCER = {
+    'max_moves': int(os.environ.get('REBALANCER_MAX_MOVES', '10')),
+    'per_node_migrations': int(os.environ.get('REBALANCER_PER_NODE', '1')),
+    'max_parallel': int(os.environ.get('REBALANCER_MAX_PARALLEL', '4')),
+    'cpu_window': int(os.environ.get('REBALANCER_CPU_WINDOW', '900')),
+}
+
+# Sketches de percentiles en los rollups de EstadisticaRecursos
+ROLLUPS = {
+    'alpha': float(os.environ.get('ROLLUPS_ALPHA', '0.01')),
+}
+
+# Búsqueda en memoria sobre el inventario de invitados
+SEARCH = {
+    'min_similarity': float(os.environ.get('SEARCH_MIN_SIMILARITY', '0.4')),
+    'refresh_interval': int(os.environ.get('SEARCH_REFRESH_INTERVAL', '300')),
+}
+
+# Pronósticos de agotamiento de recursos
+FORECASTING = {
+    'history_days': int(os.environ.get('FORECAST_HISTORY_DAYS', '90')),
+    'threshold': float(os.environ.get('FORECAST_THRESHOLD', '100')),
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -25,6 +25,9 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('nodes/<str:node_name>/', views.node_detail, name='node_detail'),
+    path('console/<str:node_name>/<int:vmid>/<str:vm_type>/', views.vm_console, name='vm_console'),
+    path('activity/', views.activity, name='activity'),
+    path('search/', views.search, name='search'),
     path('vms/<str:node_name>/<int:vmid>/', views.vm_detail, name='vm_detail'),
     path('vms/<str:node_name>/<int:vmid>/<str:vm_type>/', views.vm_detail, name='vm_detail_with_type'),
     path('vms/<str:node_name>/<int:vmid>/<str:action>/', views.vm_action, name='vm_action'),
@@ -34,4 +37,14 @@ urlpatterns = [
     path('api/nodes/', views.api_get_nodes, name='api_nodes'),
     path('api/vms/', views.api_get_vms, name='api_vms'),
     path('api/vms/<str:node_name>/<int:vmid>/status/', views.api_vm_status, name='api_vm_status'),
+    path('api/vms/<int:vmid>/config/history/', views.api_vm_config_history, name='api_vm_config_history'),
+    path('api/search/', views.api_search, name='api_search'),
+    path('api/vms/<int:vmid>/snapshots/', views.api_vm_snapshots, name='api_vm_snapshots'),
+    path('api/vms/<int:vmid>/volumes/', views.api_vm_volumes, name='api_vm_volumes'),
+    path('api/storage/', views.api_storage, name='api_storage'),
+    path('api/storage/orphans/', views.api_storage_orphans, name='api_storage_orphans'),
+    path('api/tasks/', views.api_tasks, name='api_tasks'),
+    path('api/forecasts/', views.api_forecasts, name='api_forecasts'),
+    path('api/percentiles/', views.api_percentiles, name='api_percentiles'),
+    path('api/rebalance/plan/', views.api_rebalance_plan, name='api_rebalance_plan'),
 ]
@@ -1,3 +1,284 @@
+import copy
+import json
+
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList, ORDER_VAR, PAGE_VAR
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import (
+    AsignacionRecursosInicial,
+    AuditoriaPeriodo,
+    AuditoriaRecursosCabecera,
+    AuditoriaRecursosDetalle,
+    ConfiguracionVM,
+    EstadisticaPeriodo,
+    EstadisticaRecursos,
+    MaquinaVirtual,
+    Nodo,
+    ProxmoxServer,
+    RecursoFisico,
+    SistemaOperativo,
+    TipoRecurso,
+)
+
+CURSOR_VAR = 'cursor'
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginador que evita COUNT(*) en tablas grandes
+
+    Sin filtros usa `pg_class.reltuples`; con filtros usa la estimación de filas
+    del plan de PostgreSQL. Si la estimación es pequeña se hace el COUNT real.
+    """
+
+    exact_count_threshold = 100000
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate()
+        if estimate is None or estimate < self.exact_count_threshold:
+            return self.object_list.count()
+        return estimate
+
+    def _estimate(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            if not queryset.query.where:
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                    [queryset.model._meta.db_table],
+                )
+                row = cursor.fetchone()
+                # reltuples es -1 si la tabla nunca se ha analizado
+                return int(row[0]) if row and row[0] >= 0 else None
+
+            sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetChangeList(ChangeList):
+    """
+    ChangeList que pagina por clave primaria cuando se ordena por `-pk`
+
+    En lugar de OFFSET, la página siguiente se pide con `?cursor=<pk>` y se
+    resuelve con `pk < cursor ORDER BY pk DESC LIMIT n` sobre el índice primario.
+    Con otra ordenación se usa la paginación normal con conteo estimado.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        self.cursor = getattr(request, 'keyset_cursor', None)
+        self.keyset = ORDER_VAR not in request.GET
+        self.next_cursor = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if self.cursor is not None:
+            queryset = queryset.filter(pk__lt=self.cursor)
+        results = list(queryset[:self.list_per_page + 1])
+        has_next = len(results) > self.list_per_page
+        results = results[:self.list_per_page]
+
+        paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = results
+        self.can_show_all = False
+        self.multi_page = has_next or self.cursor is not None
+        self.paginator = paginator
+        if has_next:
+            self.next_cursor = results[-1].pk
+
+    @property
+    def next_page_url(self):
+        if self.next_cursor is None:
+            return None
+        return self.get_query_string({CURSOR_VAR: self.next_cursor}, [PAGE_VAR])
+
+    @property
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR, PAGE_VAR])
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Base para los modelos con millones de filas (auditoría y estadísticas)
+
+    Combina conteos estimados, paginación por clave, sin conteo total adicional
+    y una jerarquía de fechas que no recorre la tabla para listar los periodos
+    (solo sobre columnas indexadas de la propia tabla, nunca a través de joins).
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    list_per_page = 100
+    change_list_template = 'admin/keyset_change_list.html'
+    # Campos cargados en el listado (None = todos)
+    list_only = None
+    # Campos enteros de `search_fields` que se buscan por igualdad con el término
+    # convertido a número, para que la consulta use su índice
+    numeric_search_fields = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.list_only and request.resolver_match and request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*self.list_only)
+        return queryset
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        if not self.numeric_search_fields:
+            return super().get_search_results(request, queryset, search_term)
+        # La búsqueda estándar compara UPPER(col::text) y recorre toda la tabla
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if not term.isdigit():
+            return queryset.none(), False
+        query = Q()
+        for field in self.numeric_search_fields:
+            query |= Q(**{field: int(term)})
+        return queryset.filter(query), False
+
+    def changelist_view(self, request, extra_context=None):
+        if CURSOR_VAR in request.GET:
+            # El cursor no es un filtro del modelo: la ChangeList recibe una copia de la
+            # petición sin él y la petición original no se modifica
+            params = request.GET.copy()
+            cursor = params.pop(CURSOR_VAR)[-1]
+            request = copy.copy(request)
+            request.GET = params
+            request.keyset_cursor = int(cursor) if cursor.isdigit() else None
+        return super().changelist_view(request, extra_context)
+
+
+@admin.register(TipoRecurso)
+class TipoRecursoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'unidad_medida')
+    search_fields = ('nombre',)
+
+
+@admin.register(SistemaOperativo)
+class SistemaOperativoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'version', 'tipo', 'arquitectura', 'activo')
+    list_filter = ('tipo', 'arquitectura', 'activo')
+    search_fields = ('nombre', 'version')
+
+
+@admin.register(ProxmoxServer)
+class ProxmoxServerAdmin(admin.ModelAdmin):
+    list_display = ('name', 'hostname', 'username', 'verify_ssl', 'is_active', 'updated_at')
+    list_filter = ('is_active',)
+    search_fields = ('name', 'hostname')
+
+
+@admin.register(Nodo)
+class NodoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'hostname', 'ip_address', 'proxmox_server', 'estado', 'ultimo_mantenimiento')
+    list_filter = ('estado', 'proxmox_server')
+    list_select_related = ('proxmox_server',)
+    search_fields = ('nombre', 'hostname', 'ip_address')
+
+
+@admin.register(RecursoFisico)
+class RecursoFisicoAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'nodo', 'tipo_recurso', 'capacidad_total', 'capacidad_disponible', 'estado')
+    list_filter = ('estado', 'tipo_recurso')
+    list_select_related = ('nodo', 'tipo_recurso')
+    search_fields = ('nombre', 'nodo__nombre')
+    raw_id_fields = ('nodo',)
+
+
+@admin.register(MaquinaVirtual)
+class MaquinaVirtualAdmin(admin.ModelAdmin):
+    list_display = ('nombre', 'vmid', 'vm_type', 'nodo', 'ip_address', 'estado', 'is_monitored', 'last_checked')
+    list_filter = ('vm_type', 'estado', 'is_monitored')
+    list_select_related = ('nodo',)
+    search_fields = ('nombre', 'hostname', 'ip_address', '=vmid')
+    raw_id_fields = ('nodo', 'sistema_operativo')
+
+
+@admin.register(AsignacionRecursosInicial)
+class AsignacionRecursosInicialAdmin(admin.ModelAdmin):
+    list_display = ('maquina_virtual', 'recurso', 'cantidad_asignada', 'fecha_asignacion')
+    list_select_related = ('maquina_virtual', 'recurso')
+    raw_id_fields = ('maquina_virtual', 'recurso')
+
+
+@admin.register(AuditoriaPeriodo)
+class AuditoriaPeriodoAdmin(admin.ModelAdmin):
+    list_display = ('periodo_id', 'descripcion', 'fecha_inicio', 'fecha_fin', 'estado')
+    list_filter = ('estado',)
+    date_hierarchy = 'fecha_inicio'
+
+
+@admin.register(EstadisticaPeriodo)
+class EstadisticaPeriodoAdmin(admin.ModelAdmin):
+    list_display = ('periodo_id', 'nivel_agregacion', 'fecha_inicio', 'fecha_fin', 'fecha_calculo', 'sketch_calculado')
+    list_filter = ('nivel_agregacion', 'sketch_calculado')
+    date_hierarchy = 'fecha_inicio'
+
+
+@admin.register(AuditoriaRecursosCabecera)
+class AuditoriaRecursosCabeceraAdmin(LargeTableAdmin):
+    list_display = ('auditoria_cabecera_id', 'maquina_virtual', 'periodo_id', 'fecha_registro', 'estado')
+    list_filter = ('estado',)
+    list_select_related = ('maquina_virtual',)
+    list_only = ('auditoria_cabecera_id', 'maquina_virtual__nombre', 'maquina_virtual__vmid',
+                 'periodo_id', 'fecha_registro', 'estado')
+    raw_id_fields = ('maquina_virtual', 'periodo')
+    date_hierarchy = 'fecha_registro'
+
+
+@admin.register(AuditoriaRecursosDetalle)
+class AuditoriaRecursosDetalleAdmin(LargeTableAdmin):
+    list_display = ('auditoria_detalle_id', 'auditoria_cabecera_id', 'recurso', 'consumo_actual', 'porcentaje_uso')
+    list_filter = ('recurso__tipo_recurso',)
+    list_select_related = ('recurso',)
+    list_only = ('auditoria_detalle_id', 'auditoria_cabecera_id', 'recurso__nombre',
+                 'consumo_actual', 'porcentaje_uso')
+    raw_id_fields = ('auditoria_cabecera', 'recurso')
+    # Sin jerarquía de fechas: exigiría unir con la cabecera sobre toda la tabla.
+    # Se filtra por cabecera (?auditoria_cabecera=<id> o búsqueda exacta por su ID)
+    search_fields = ('=auditoria_cabecera__auditoria_cabecera_id',)
+    numeric_search_fields = ('auditoria_cabecera_id',)
+
+
+@admin.register(EstadisticaRecursos)
+class EstadisticaRecursosAdmin(LargeTableAdmin):
+    list_display = ('estadistica_id', 'periodo_id', 'tipo_recurso', 'tipo_entidad', 'entidad_id',
+                    'uso_promedio', 'uso_maximo', 'uso_minimo')
+    list_filter = ('tipo_entidad', 'tipo_recurso')
+    list_select_related = ('tipo_recurso',)
+    list_only = ('estadistica_id', 'periodo_id', 'tipo_recurso__nombre', 'tipo_entidad', 'entidad_id',
+                 'uso_promedio', 'uso_maximo', 'uso_minimo')
+    raw_id_fields = ('periodo',)
+
 
-# Register your models here.
+@admin.register(ConfiguracionVM)
+class ConfiguracionVMAdmin(LargeTableAdmin):
+    list_display = ('configuracion_id', 'cluster', 'vmid', 'version', 'vm_type', 'nodo', 'digest', 'fecha_registro')
+    list_filter = ('vm_type',)
+    list_only = ('configuracion_id', 'cluster', 'vmid', 'version', 'vm_type', 'nodo', 'digest', 'fecha_registro')
+    search_fields = ('=vmid',)
+    numeric_search_fields = ('vmid',)
+    date_hierarchy = 'fecha_registro'
@@ -0,0 +1,326 @@
+# submodulos/change_detector.py
+from collections import OrderedDict
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .config_store import config_store
+from .ip_discovery import BACKOFF_PREFIX as IP_BACKOFF_PREFIX, IP_CACHE_PREFIX
+from .models import MaquinaVirtual, Nodo
+from .proxmox_service import proxmox_service
+from .responses import bump_version
+from .scheduler import scheduler
+from .snapshots import snapshot_inventory
+from .task_feed import task_feed
+
+logger = logging.getLogger(__name__)
+
+CURSOR_KEY = 'sentinelnexus:changes:log_cursor'
+TASK_CURSOR_KEY = 'sentinelnexus:changes:task_cursor'
+HANDLED_PREFIX = 'sentinelnexus:changes:handled:'
+
+# Tipo de tarea de Proxmox -> tipo de cambio
+TASK_KINDS = {
+    'status': {
+        'qmstart', 'qmstop', 'qmshutdown', 'qmreboot', 'qmreset', 'qmsuspend', 'qmresume', 'qmpause',
+        'vzstart', 'vzstop', 'vzshutdown', 'vzreboot', 'vzsuspend', 'vzresume',
+    },
+    'config': {
+        'qmconfig', 'qmmove', 'qmresize', 'qmtemplate', 'move_volume', 'resize', 'vztemplate',
+    },
+    'snapshot': {'qmsnapshot', 'qmdelsnapshot', 'qmrollback', 'vzsnapshot', 'vzdelsnapshot', 'vzrollback'},
+    'migrate': {'qmigrate', 'vzmigrate', 'hamigrate'},
+    'membership': {'qmcreate', 'qmclone', 'qmrestore', 'qmdestroy', 'vzcreate', 'vzrestore', 'vzdestroy'},
+}
+KIND_BY_TASK = {task_type: kind for kind, types in TASK_KINDS.items() for task_type in types}
+
+LOG_UPID = re.compile(r'\b(starting|end) task (UPID:[^\s]+)')
+LOG_GUEST = re.compile(r'\b(?:VM|CT) (\d+)\b')
+
+
+def _change_detector_settings():
+    """Devuelve la configuración del detector de cambios con valores por defecto"""
+    defaults = {
+        'poll_interval': 5,       # Segundos entre consultas a cluster/log y cluster/tasks
+        'log_max': 200,           # Entradas de cluster/log pedidas en cada consulta
+        'refresh': True,          # Refrescar estado y configuración de las VMs afectadas
+        'handled_ttl': 86400,     # Segundos que se recuerda un evento ya aplicado
+    }
+    defaults.update(getattr(settings, 'CHANGE_DETECTOR', {}))
+    return defaults
+
+
+def parse_upid(upid):
+    """
+    Descompone un UPID de Proxmox
+
+    Formato: UPID:<nodo>:<pid>:<pstart>:<starttime>:<tipo>:<id>:<usuario>:
+
+    Returns:
+        dict | None: {'node', 'type', 'id', 'user', 'starttime'} o None si no es válido
+    """
+    parts = upid.split(':')
+    if len(parts) < 8 or parts[0] != 'UPID':
+        return None
+    try:
+        starttime = int(parts[4], 16)
+    except ValueError:
+        return None
+    return {'node': parts[1], 'type': parts[5], 'id': parts[6], 'user': parts[7], 'starttime': starttime}
+
+
+def _vm_type(task_type):
+    return 'lxc' if task_type.startswith('vz') else 'qemu'
+
+
+class ChangeDetector:
+    """
+    Convierte los eventos del cluster en invalidaciones y refrescos dirigidos
+
+    Sigue `cluster/log` con un cursor propio y lee las tareas del stream del
+    feed de tareas con otro cursor, de modo que recibe los cambios aunque sea
+    otro proceso (follow_tasks) quien consulta `cluster/tasks`. Cada evento
+    aplicado se marca en la caché compartida con `add` (SET NX), así que lo
+    que llega por ambas fuentes o lo que leen varios detectores a la vez se
+    aplica una sola vez.
+
+    Cada evento se traduce en un cambio (nodo, vmid, tipo) y solo se invalida
+    o se vuelve a pedir a Proxmox lo que afecta a esa VM: la configuración y
+    las instantáneas en caché, la IP descubierta, el estado en MaquinaVirtual
+    y la versión del inventario servido por la API. En reposo el coste es una
+    consulta a cada endpoint por intervalo, independiente del número de VMs.
+    """
+
+    def __init__(self, proxmox=None, config=None):
+        self._proxmox = proxmox
+        self.config = config or _change_detector_settings()
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    # Fuentes de eventos
+
+    def _read_log(self):
+        """Entradas de cluster/log posteriores al cursor, de la más antigua a la más reciente"""
+        cursor = cache.get(CURSOR_KEY) or {'time': 0, 'uids': []}
+        try:
+            entries = self.proxmox.cluster.log.get(max=self.config['log_max'])
+        except Exception as e:
+            logger.error(f"Error al obtener el log del cluster: {str(e)}")
+            return []
+
+        seen = set(cursor['uids'])
+        new = [e for e in entries
+               if e.get('time', 0) > cursor['time']
+               or (e.get('time', 0) == cursor['time'] and f"{e.get('node')}:{e.get('uid')}" not in seen)]
+        if entries:
+            last_time = max(e.get('time', 0) for e in entries)
+            if last_time > cursor['time']:
+                seen = set()
+            seen |= {f"{e.get('node')}:{e.get('uid')}" for e in entries if e.get('time', 0) == last_time}
+            cache.set(CURSOR_KEY, {'time': max(last_time, cursor['time']), 'uids': sorted(seen)}, None)
+
+        # Sin cursor previo solo se fija la posición: el historial no implica cambios pendientes
+        if not cursor['time']:
+            return []
+        return sorted(new, key=lambda e: e.get('time', 0))
+
+    def _read_tasks(self):
+        """Tareas escritas en el índice desde la última lectura del detector"""
+        # Mantiene el índice al día; si otro proceso tiene el lock, él escribe en el stream
+        task_feed.poll()
+        last_id, tasks = task_feed.changes_since(cache.get(TASK_CURSOR_KEY))
+        cache.set(TASK_CURSOR_KEY, last_id, None)
+        return tasks
+
+    def events_from_tasks(self, tasks):
+        events = []
+        for task in tasks:
+            phase = 'start' if 'endtime' not in task and 'status' not in task else 'end'
+            event = self._task_event(task.get('upid', ''), task.get('type', ''), task.get('id'),
+                                     task.get('node'), phase)
+            if event:
+                events.append(event)
+        return events
+
+    def events_from_log(self, entries):
+        events = []
+        for entry in entries:
+            message = entry.get('msg', '')
+            match = LOG_UPID.search(message)
+            if match:
+                task = parse_upid(match.group(2))
+                if task:
+                    phase = 'start' if match.group(1) == 'starting' else 'end'
+                    event = self._task_event(match.group(2), task['type'], task['id'], task['node'], phase)
+                    if event:
+                        events.append(event)
+                continue
+            # Mensajes sin tarea que mencionan una VM (p. ej. "update VM 100: -memory 4096")
+            guest = LOG_GUEST.search(message)
+            if guest and entry.get('node') and self._first_time(f"log:{entry['node']}:{entry.get('uid')}"):
+                events.append({'node': entry['node'], 'vmid': int(guest.group(1)), 'vm_type': None,
+                               'kind': 'config', 'phase': 'end'})
+        return events
+
+    def _first_time(self, event_id):
+        """SET NX compartido: True solo para el primer proceso que ve el evento"""
+        return cache.add(f'{HANDLED_PREFIX}{event_id}', 1, self.config['handled_ttl'])
+
+    def _task_event(self, upid, task_type, vmid, node, phase):
+        kind = KIND_BY_TASK.get(task_type)
+        if not kind or not vmid or not str(vmid).isdigit() or not node:
+            return None
+        if not self._first_time(f'{upid}:{phase}'):
+            return None
+        return {'node': node, 'vmid': int(vmid), 'vm_type': _vm_type(task_type), 'kind': kind, 'phase': phase}
+
+    # Aplicación de cambios
+
+    def apply(self, events):
+        """
+        Invalida y refresca solo lo afectado por los eventos
+
+        Returns:
+            dict: Número de VMs afectadas por tipo de cambio
+        """
+        # Un solo cambio por VM y tipo en cada lote
+        changes = OrderedDict()
+        for event in events:
+            changes[(event['node'], event['vmid'], event['kind'])] = event
+        if not changes:
+            return {}
+
+        stale_vmids = {vmid for (_, vmid, kind) in changes if kind in ('config', 'snapshot', 'migrate', 'membership')}
+        restarted = {vmid for (_, vmid, kind) in changes if kind in ('status', 'migrate')}
+        for vmid in stale_vmids:
+            config_store.invalidate(vmid)
+            snapshot_inventory.invalidate(vmid)
+        if restarted:
+            # La IP puede cambiar y un agente que no respondía puede estar ya activo
+            cache.delete_many([f'{IP_CACHE_PREFIX}{vmid}' for vmid in restarted]
+                              + [f'{IP_BACKOFF_PREFIX}{vmid}' for vmid in restarted])
+            # El status/current guardado por el planificador ya no es válido
+            for (node, vmid, kind) in changes:
+                if kind in ('status', 'migrate'):
+                    scheduler.invalidate(node, vmid)
+
+        if self.config['refresh']:
+            finished = [e for e in changes.values() if e['phase'] == 'end']
+            self._refresh_status([e for e in finished if e['kind'] == 'status'])
+            self._refresh_configs([e for e in finished if e['kind'] in ('config', 'snapshot') and e['vm_type']])
+            self._refresh_snapshots([e for e in finished if e['kind'] == 'snapshot'])
+            if any(e['kind'] in ('migrate', 'membership') for e in finished):
+                self._refresh_placement()
+
+        bump_version('inventory')
+        summary = {}
+        for (_, _, kind) in changes:
+            summary[kind] = summary.get(kind, 0) + 1
+        logger.info(f"Cambios aplicados: {summary}")
+        return summary
+
+    def _refresh_status(self, events):
+        """Actualiza MaquinaVirtual.estado con una consulta por VM afectada"""
+        if not events:
+            return
+        statuses = {}
+        for event in events:
+            try:
+                guest = self.proxmox.nodes(event['node'])
+                guest = guest.qemu(event['vmid']) if event['vm_type'] == 'qemu' else guest.lxc(event['vmid'])
+                status = guest.status.current.get()
+                statuses[(event['node'], event['vmid'])] = status.get('status', 'unknown')
+                # Sustituye el estado en caché del planificador por el recién leído
+                scheduler.observe(event['node'], event['vmid'], event['vm_type'], status)
+            except Exception as e:
+                logger.error(f"Error al refrescar el estado de la VM {event['vmid']}: {str(e)}")
+
+        now = timezone.now()
+        changed = []
+        for vm in (MaquinaVirtual.objects
+                   .filter(vmid__in={vmid for _, vmid in statuses})
+                   .select_related('nodo')
+                   .only('vm_id', 'vmid', 'estado', 'last_checked', 'nodo__nombre')):
+            status = statuses.get((vm.nodo.nombre, vm.vmid))
+            if status is None:
+                continue
+            vm.estado = status if status in ('running', 'stopped') else 'unknown'
+            vm.last_checked = now
+            changed.append(vm)
+        MaquinaVirtual.objects.bulk_update(changed, ['estado', 'last_checked'])
+
+    def _refresh_configs(self, events):
+        """Vuelve a pedir la configuración de las VMs afectadas y registra la nueva versión"""
+        for event in events:
+            try:
+                config_store.get_config(event['node'], event['vmid'], event['vm_type'])
+            except Exception as e:
+                logger.error(f"Error al refrescar la configuración de la VM {event['vmid']}: {str(e)}")
+
+    def _refresh_snapshots(self, events):
+        """Vuelve a pedir la lista de instantáneas de las VMs con actividad de instantáneas"""
+        for event in events:
+            try:
+                snapshot_inventory.fetch(event['node'], event['vmid'], event['vm_type'])
+            except Exception as e:
+                logger.error(f"Error al refrescar las instantáneas de la VM {event['vmid']}: {str(e)}")
+
+    def _refresh_placement(self):
+        """
+        Tras migraciones, altas o bajas se reubican las VMs con una sola consulta
+
+        Las tareas de migración no indican el nodo destino, así que se usa
+        cluster/resources una vez por lote en lugar de una vez por VM.
+        """
+        resources = {int(r['vmid']): r for r in proxmox_service.get_cluster_resources('vm')
+                     if r.get('vmid') is not None}
+        nodos = {nodo.nombre: nodo for nodo in Nodo.objects.all()}
+        moved = []
+        for vm in MaquinaVirtual.objects.filter(vmid__in=resources.keys()).select_related('nodo'):
+            resource = resources[vm.vmid]
+            nodo = nodos.get(resource.get('node'))
+            if nodo is not None and vm.nodo_id != nodo.pk:
+                vm.nodo = nodo
+                vm.estado = resource.get('status') if resource.get('status') in ('running', 'stopped') else 'unknown'
+                moved.append(vm)
+        MaquinaVirtual.objects.bulk_update(moved, ['nodo', 'estado'])
+
+    # Bucle principal
+
+    def poll(self):
+        """
+        Lee ambas fuentes una vez y aplica los cambios
+
+        Returns:
+            dict: Número de VMs afectadas por tipo de cambio
+        """
+        events = self.events_from_log(self._read_log())
+        events += self.events_from_tasks(self._read_tasks())
+        return self.apply(events)
+
+    def follow(self, interval=None, stop=None):
+        """
+        Sigue los cambios del cluster de forma continua
+
+        Args:
+            interval (float, optional): Segundos entre consultas
+            stop (callable, optional): Función que devuelve True para detener el bucle
+        """
+        interval = interval or self.config['poll_interval']
+        while not (stop and stop()):
+            started = time.monotonic()
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Error al aplicar cambios del cluster: {str(e)}")
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+
+# Instancia singleton para usar en toda la aplicación
+change_detector = ChangeDetector()
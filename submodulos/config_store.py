@@ -0,0 +1,257 @@
+# submodulos/config_store.py
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import ConfiguracionVM
+from .proxmox_service import proxmox_service
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'sentinelnexus:config:'
+
+
+def _config_store_settings():
+    """Devuelve la configuración del almacén de configuraciones con valores por defecto"""
+    defaults = {
+        'revalidate_after': 300,   # Segundos que una configuración se sirve sin revalidar
+        'cache_timeout': 24 * 3600,
+        'sweep_workers': 16,
+        # Identificador del cluster: los vmid solo son únicos dentro de un cluster
+        'cluster': settings.PROXMOX['host'],
+    }
+    defaults.update(getattr(settings, 'CONFIG_STORE', {}))
+    return defaults
+
+
+def diff_configs(old, new):
+    """
+    Compara dos configuraciones de Proxmox
+
+    Args:
+        old (dict): Configuración anterior
+        new (dict): Configuración nueva
+
+    Returns:
+        dict: Claves añadidas, eliminadas y modificadas (el digest se ignora)
+    """
+    old = {k: v for k, v in (old or {}).items() if k != 'digest'}
+    new = {k: v for k, v in (new or {}).items() if k != 'digest'}
+    return {
+        'added': {k: new[k] for k in sorted(new.keys() - old.keys())},
+        'removed': {k: old[k] for k in sorted(old.keys() - new.keys())},
+        'changed': {k: {'old': old[k], 'new': new[k]}
+                    for k in sorted(old.keys() & new.keys()) if old[k] != new[k]},
+    }
+
+
+class ConfigStore:
+    """
+    Almacén de configuraciones de VMs y contenedores basado en el `digest`
+
+    La última configuración de cada VM se sirve desde caché; pasado
+    `revalidate_after` (o tras `invalidate`) se vuelve a pedir a Proxmox y solo
+    se escribe una nueva versión en ConfiguracionVM si el digest cambió. La
+    caché y el historial se indexan por cluster y vmid, y cada versión lleva un
+    número correlativo único por VM, de modo que dos procesos que registran a
+    la vez el mismo cambio no pueden duplicarlo.
+    """
+
+    def __init__(self, proxmox=None, cluster=None):
+        self._proxmox = proxmox
+        self.config = _config_store_settings()
+        self.cluster = cluster or self.config['cluster']
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    def _fetch(self, node, vmid, vm_type):
+        guest = self.proxmox.nodes(node).qemu(vmid) if vm_type == 'qemu' else self.proxmox.nodes(node).lxc(vmid)
+        return guest.config.get()
+
+    def _key(self, vmid):
+        return f'{CACHE_PREFIX}{self.cluster}:{vmid}'
+
+    def _cache_entry(self, vmid):
+        return cache.get(self._key(vmid))
+
+    def cached_configs(self, vmids):
+        """Entradas en caché de varias VMs en una sola lectura: {vmid: entrada}"""
+        keys = {self._key(vmid): int(vmid) for vmid in vmids}
+        return {keys[key]: entry for key, entry in cache.get_many(list(keys)).items()}
+
+    def _set_cache_entry(self, vmid, node, vm_type, config):
+        cache.set(self._key(vmid), {
+            'node': node,
+            'vm_type': vm_type,
+            'digest': config.get('digest', ''),
+            'config': config,
+            'checked': time.time(),
+        }, self.config['cache_timeout'])
+
+    def invalidate(self, vmid):
+        """Fuerza la revalidación de la configuración de una VM en la próxima lectura"""
+        cache.delete(self._key(vmid))
+
+    def _versions(self, vmid):
+        return ConfiguracionVM.objects.filter(cluster=self.cluster, vmid=vmid)
+
+    def _latest(self, vmid):
+        """(versión, digest) de la última configuración guardada o (0, None)"""
+        return self._versions(vmid).order_by('-version').values_list('version', 'digest').first() or (0, None)
+
+    def record(self, node, vmid, vm_type, config):
+        """
+        Guarda una configuración recién obtenida si su digest es nuevo
+
+        La versión se inserta con el número siguiente al último; si otro proceso
+        insertó ese número antes, la restricción única lo rechaza y se vuelve a
+        comparar con la versión que ganó.
+
+        Returns:
+            bool: True si se creó una nueva versión
+        """
+        entry = self._cache_entry(vmid)
+        digest = config.get('digest', '')
+        created = False
+        if entry is None or entry['digest'] != digest:
+            while True:
+                version, known = self._latest(vmid)
+                if digest == known:
+                    break
+                try:
+                    with transaction.atomic():
+                        ConfiguracionVM.objects.create(cluster=self.cluster, nodo=node, vmid=vmid, vm_type=vm_type,
+                                                       version=version + 1, digest=digest, config=config)
+                    created = True
+                    break
+                except IntegrityError:
+                    continue
+        self._set_cache_entry(vmid, node, vm_type, config)
+        return created
+
+    def get_config(self, node, vmid, vm_type='qemu'):
+        """
+        Devuelve la configuración actual de una VM
+
+        Se sirve desde caché si se validó hace menos de `revalidate_after` segundos
+        y sigue en el mismo nodo; si no, se consulta a Proxmox y se registra.
+        """
+        entry = self._cache_entry(vmid)
+        if (entry and entry['node'] == node
+                and time.time() - entry['checked'] < self.config['revalidate_after']):
+            return entry['config']
+
+        config = self._fetch(node, vmid, vm_type)
+        self.record(node, vmid, vm_type, config)
+        return config
+
+    def history(self, vmid, limit=50):
+        """Versiones guardadas de la configuración de una VM, de la más reciente a la más antigua"""
+        return list(self._versions(vmid).order_by('-version')[:limit])
+
+    def diff(self, vmid, from_id=None, to_id=None):
+        """
+        Diferencias entre dos versiones de la configuración de una VM
+
+        Por defecto compara la versión más reciente con la anterior.
+        """
+        if from_id is None or to_id is None:
+            versions = self.history(vmid, limit=2)
+            if len(versions) < 2:
+                return None
+            newer, older = versions
+        else:
+            versions = {v.pk: v for v in self._versions(vmid).filter(pk__in=[from_id, to_id])}
+            if from_id not in versions or to_id not in versions:
+                return None
+            older, newer = versions[from_id], versions[to_id]
+        return {
+            'from': older.pk,
+            'to': newer.pk,
+            'changes': diff_configs(older.config, newer.config),
+        }
+
+    def sweep(self, guests=None):
+        """
+        Revisa la configuración de todas las VMs del cluster en paralelo
+
+        Los digest conocidos se cargan en una sola consulta y solo las
+        configuraciones cuyo digest cambió se escriben con `bulk_create`. Si
+        otro proceso guardó antes esa misma versión, el conflicto se ignora, no
+        se cuenta como escrita y el siguiente barrido compara con la versión
+        que ganó.
+
+        Args:
+            guests (list, optional): Lista de dicts con 'node', 'vmid' y 'type'.
+                Por defecto se usan los recursos de tipo vm del cluster.
+
+        Returns:
+            int: Número de configuraciones nuevas realmente guardadas
+        """
+        if guests is None:
+            guests = [g for g in proxmox_service.get_cluster_resources('vm') if not g.get('template')]
+        if not guests:
+            return 0
+
+        vmids = [int(g['vmid']) for g in guests]
+        newest = (ConfiguracionVM.objects
+                  .filter(cluster=self.cluster, vmid=OuterRef('vmid'))
+                  .order_by('-version')
+                  .values('version')[:1])
+        latest = {
+            vmid: (version, digest)
+            for vmid, version, digest in ConfiguracionVM.objects
+            .filter(cluster=self.cluster, vmid__in=vmids, version=Subquery(newest))
+            .values_list('vmid', 'version', 'digest')
+        }
+
+        def fetch(guest):
+            try:
+                return guest, self._fetch(guest['node'], guest['vmid'], guest['type'])
+            except Exception as e:
+                logger.error(f"Error al obtener la configuración de {guest['vmid']}: {str(e)}")
+                return guest, None
+
+        changed = []
+        with ThreadPoolExecutor(max_workers=self.config['sweep_workers']) as executor:
+            for guest, config in executor.map(fetch, guests):
+                if config is None:
+                    continue
+                vmid = int(guest['vmid'])
+                version, known = latest.get(vmid, (0, None))
+                if config.get('digest', '') != known:
+                    changed.append(ConfiguracionVM(
+                        cluster=self.cluster, nodo=guest['node'], vmid=vmid, vm_type=guest['type'],
+                        version=version + 1, digest=config.get('digest', ''), config=config,
+                    ))
+                self._set_cache_entry(vmid, guest['node'], guest['type'], config)
+
+        ConfiguracionVM.objects.bulk_create(changed, batch_size=500, ignore_conflicts=True)
+        written = self._written(changed)
+        if written < len(changed):
+            logger.info(f"Barrido de configuraciones: {len(changed) - written} versiones ya las había guardado otro proceso")
+        logger.info(f"Barrido de configuraciones: {written} de {len(guests)} cambiaron")
+        return written
+
+    def _written(self, rows):
+        """Cuántas de las versiones de `rows` quedaron guardadas con su digest"""
+        if not rows:
+            return 0
+        expected = {(row.vmid, row.version, row.digest) for row in rows}
+        stored = ConfiguracionVM.objects.filter(
+            cluster=self.cluster,
+            vmid__in={row.vmid for row in rows},
+            version__in={row.version for row in rows},
+        ).values_list('vmid', 'version', 'digest')
+        return len(expected.intersection(stored))
+
+
+# Instancia singleton para usar en toda la aplicación
+config_store = ConfigStore()
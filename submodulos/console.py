@@ -0,0 +1,293 @@
+# submodulos/console.py
+import asyncio
+import logging
+import secrets
+import ssl
+import time
+from http.cookies import CookieError, SimpleCookie
+from importlib import import_module
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import cache
+import websockets
+
+from .proxmox_service import proxmox_service
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PREFIX = 'sentinelnexus:console:'
+
+CONSOLE_PATH_PREFIX = '/console/ws/'
+
+
+def _console_settings():
+    """Devuelve la configuración del proxy de consola con valores por defecto"""
+    defaults = {
+        'max_sessions_per_node': 100,   # Sesiones simultáneas por nodo y worker
+        'idle_timeout': 900,            # Segundos sin tráfico antes de cerrar la sesión
+        'connect_timeout': 10,          # Segundos para conectar con el nodo
+        'pveproxy_port': 8006,          # Puerto de pveproxy en los nodos
+        'verify_ssl': settings.PROXMOX.get('verify_ssl', False),
+        'token_ttl': 30,                # Segundos de validez del token de un solo uso
+        'write_buffer_limit': 256 * 1024,
+    }
+    defaults.update(getattr(settings, 'CONSOLE', {}))
+    return defaults
+
+
+def _node_address(proxmox, node):
+    """Obtiene la IP de un nodo desde cluster/status (o el host configurado)"""
+    try:
+        for entry in proxmox.cluster.status.get():
+            if entry.get('type') == 'node' and entry.get('name') == node and entry.get('ip'):
+                return entry['ip']
+    except Exception as e:
+        logger.warning(f"No se pudo resolver la IP del nodo {node}: {str(e)}")
+    return settings.PROXMOX['host']
+
+
+def create_console_session(user, node, vmid, vm_type='qemu', kind='vnc', proxmox=None):
+    """
+    Solicita un ticket de consola a Proxmox y registra un token de un solo uso
+
+    `vncproxy` se pide con `websocket=1` (sin TLS propio, apto para noVNC) y
+    `termproxy` escucha solo en localhost del nodo, así que en ambos casos el
+    proxy se conecta al websocket `vncwebsocket` de pveproxy, que retransmite al
+    puerto local. El navegador abre después el websocket con el token; el proxy
+    recupera con él el destino sin volver a consultar Proxmox, igual que el
+    modelo de tokens de websockify.
+
+    Args:
+        user: Usuario de Django que abre la consola
+        node (str): Nombre del nodo
+        vmid (int): ID de la VM
+        vm_type (str): 'qemu' o 'lxc'
+        kind (str): 'vnc' para noVNC o 'term' para xterm.js
+
+    Returns:
+        dict: Token, ticket y puerto de la sesión
+    """
+    proxmox = proxmox or proxmox_service.proxmox
+    auth_ticket, _ = proxmox.get_tokens()
+    if not auth_ticket:
+        raise ValueError("La consola requiere autenticación con usuario y contraseña en Proxmox (PVEAuthCookie)")
+
+    guest = proxmox.nodes(node).qemu(vmid) if vm_type == 'qemu' else proxmox.nodes(node).lxc(vmid)
+    if kind == 'term':
+        result = guest.termproxy.post()
+    else:
+        result = guest.vncproxy.post(websocket=1)
+
+    token = secrets.token_urlsafe(32)
+    session = {
+        'user_id': user.pk,
+        'node': node,
+        'vmid': vmid,
+        'vm_type': vm_type,
+        'kind': kind,
+        'host': _node_address(proxmox, node),
+        'port': int(result['port']),
+        'ticket': result['ticket'],
+        'pve_user': result.get('user', ''),
+        'auth_ticket': auth_ticket,
+    }
+    cache.set(TOKEN_PREFIX + token, session, _console_settings()['token_ttl'])
+    return {'token': token, 'ticket': result['ticket'], 'port': session['port']}
+
+
+class _SessionState:
+    __slots__ = ('last_activity',)
+
+    def __init__(self):
+        self.last_activity = time.monotonic()
+
+    def touch(self):
+        self.last_activity = time.monotonic()
+
+
+class ConsoleProxy:
+    """
+    Proxy ASGI entre el websocket del navegador y el `vncwebsocket` de pveproxy
+
+    Los frames binarios se reenvían tal cual en ambos sentidos, sin copias
+    intermedias ni JSON. El envío hacia el nodo espera cuando su buffer supera
+    `write_buffer_limit`, y la lectura del nodo solo avanza cuando el servidor
+    ASGI acepta el frame anterior (con una cola de pocos frames en el cliente
+    websocket), por lo que la memoria por sesión queda acotada en ambos sentidos.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or _console_settings()
+        self.sessions_per_node = {}
+
+    # Puntos de extensión
+
+    async def authenticate(self, scope):
+        """Devuelve el ID del usuario de la sesión de Django o None"""
+        cookies = SimpleCookie()
+        for name, value in scope.get('headers', []):
+            if name == b'cookie':
+                try:
+                    cookies.load(value.decode('latin-1'))
+                except CookieError:
+                    logger.warning("Cabecera Cookie mal formada en el websocket de consola")
+                    return None
+        morsel = cookies.get(settings.SESSION_COOKIE_NAME)
+        if morsel is None:
+            return None
+
+        engine = import_module(settings.SESSION_ENGINE)
+        session = engine.SessionStore(morsel.value)
+        user_id = await sync_to_async(session.get)(SESSION_KEY)
+        return str(user_id) if user_id is not None else None
+
+    async def resolve_target(self, token):
+        """Consume el token de un solo uso y devuelve la sesión de consola"""
+        key = TOKEN_PREFIX + token
+        target = await cache.aget(key)
+        if target is not None:
+            await cache.adelete(key)
+        return target
+
+    def target_url(self, target):
+        """URL del websocket de pveproxy que retransmite al puerto de consola"""
+        path = 'qemu' if target.get('vm_type', 'qemu') == 'qemu' else 'lxc'
+        query = urlencode({'port': target['port'], 'vncticket': target['ticket']})
+        return (f"wss://{target['host']}:{self.config['pveproxy_port']}"
+                f"/api2/json/nodes/{target['node']}/{path}/{target['vmid']}/vncwebsocket?{query}")
+
+    def _ssl_context(self):
+        context = ssl.create_default_context()
+        if not self.config['verify_ssl']:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return context
+
+    async def open_target(self, target):
+        """Abre el websocket con pveproxy autenticado con la cookie de la cuenta de servicio"""
+        upstream = await websockets.connect(
+            self.target_url(target),
+            ssl=self._ssl_context(),
+            subprotocols=['binary'],
+            extra_headers={'Cookie': f"PVEAuthCookie={target['auth_ticket']}"},
+            open_timeout=self.config['connect_timeout'],
+            max_size=None,
+            max_queue=4,
+            write_limit=self.config['write_buffer_limit'],
+            compression=None,
+        )
+        if target['kind'] == 'term':
+            # termproxy espera "usuario:ticket\n" antes de empezar a retransmitir
+            await upstream.send(f"{target['pve_user']}:{target['ticket']}\n")
+        return upstream
+
+    # ASGI
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'websocket':
+            raise ValueError(f"ConsoleProxy solo acepta websockets, no {scope['type']}")
+
+        message = await receive()
+        if message['type'] != 'websocket.connect':
+            return
+
+        token = scope['path'][len(CONSOLE_PATH_PREFIX):].strip('/')
+        user_id = await self.authenticate(scope)
+        target = await self.resolve_target(token) if token and user_id else None
+        if target is None or str(target['user_id']) != user_id:
+            await send({'type': 'websocket.close', 'code': 4403})
+            return
+
+        node = target['node']
+        if self.sessions_per_node.get(node, 0) >= self.config['max_sessions_per_node']:
+            logger.warning(f"Límite de consolas alcanzado en el nodo {node}")
+            await send({'type': 'websocket.close', 'code': 4429})
+            return
+
+        self.sessions_per_node[node] = self.sessions_per_node.get(node, 0) + 1
+        try:
+            await self._run_session(scope, receive, send, target)
+        finally:
+            self.sessions_per_node[node] -= 1
+
+    async def _run_session(self, scope, receive, send, target):
+        try:
+            upstream = await self.open_target(target)
+        except (OSError, asyncio.TimeoutError, websockets.InvalidHandshake) as e:
+            logger.error(f"Error al conectar con la consola de {target['vmid']} en {target['node']}: {str(e)}")
+            await send({'type': 'websocket.close', 'code': 1011})
+            return
+
+        subprotocols = scope.get('subprotocols') or []
+        accept = {'type': 'websocket.accept'}
+        if 'binary' in subprotocols:
+            accept['subprotocol'] = 'binary'
+        await send(accept)
+
+        state = _SessionState()
+        tasks = [
+            asyncio.ensure_future(self._client_to_node(receive, upstream, state)),
+            asyncio.ensure_future(self._node_to_client(upstream, send, state)),
+            asyncio.ensure_future(self._idle_watchdog(state)),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await upstream.close()
+            try:
+                await send({'type': 'websocket.close', 'code': 1000})
+            except Exception:
+                # El cliente ya cerró el websocket
+                pass
+
+    async def _client_to_node(self, receive, upstream, state):
+        while True:
+            message = await receive()
+            if message['type'] == 'websocket.disconnect':
+                return
+            data = message.get('bytes')
+            if data is None:
+                data = message.get('text', '').encode()
+            if data:
+                # send() espera mientras el buffer de escritura supere write_limit
+                await upstream.send(data)
+                state.touch()
+
+    async def _node_to_client(self, upstream, send, state):
+        try:
+            async for data in upstream:
+                state.touch()
+                await send({'type': 'websocket.send',
+                            'bytes': data if isinstance(data, bytes) else data.encode()})
+        except websockets.ConnectionClosed:
+            return
+
+    async def _idle_watchdog(self, state):
+        timeout = self.config['idle_timeout']
+        while True:
+            remaining = state.last_activity + timeout - time.monotonic()
+            if remaining <= 0:
+                logger.info("Sesión de consola cerrada por inactividad")
+                return
+            await asyncio.sleep(remaining)
+
+
+def console_router(django_app, proxy=None):
+    """
+    Devuelve una aplicación ASGI que envía los websockets de consola al proxy
+    y el resto del tráfico a Django
+    """
+    proxy = proxy or ConsoleProxy()
+
+    async def application(scope, receive, send):
+        if scope['type'] == 'websocket' and scope['path'].startswith(CONSOLE_PATH_PREFIX):
+            return await proxy(scope, receive, send)
+        return await django_app(scope, receive, send)
+
+    return application
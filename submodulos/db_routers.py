@@ -0,0 +1,102 @@
+# submodulos/db_routers.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+
+PIN_COOKIE = 'sn_primary'
+
+# Modelos de solo lectura analítica que pueden leerse desde la réplica
+ANALYTICS_MODELS = {
+    'estadisticaperiodo',
+    'estadisticarecursos',
+    'auditoriaperiodo',
+    'auditoriarecursoscabecera',
+    'auditoriarecursosdetalle',
+}
+
+_pinned = ContextVar('sentinelnexus_primary_pinned', default=False)
+
+# Estado de la petición que atiende PrimaryPinningMiddleware (None fuera de una petición)
+_request_state = ContextVar('sentinelnexus_request_state', default=None)
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextmanager
+def use_primary():
+    """Lee desde la base principal dentro del bloque (lectura tras escritura)"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+class AnalyticsReplicaRouter:
+    """
+    Envía las lecturas analíticas de estadísticas y auditoría a la réplica
+
+    Solo aplica si existe el alias `replica` en DATABASES. Las escrituras van
+    siempre a la principal. Dentro de una petición, escribir un modelo
+    analítico fija el resto de la petición a la principal para que las
+    lecturas siguientes vean lo escrito; otras escrituras (sesión,
+    `last_login`...) no afectan a esas lecturas y no fijan nada. Fuera de una
+    petición (comandos, recolectores) no se fija nada implícitamente: quien
+    necesite leer lo que acaba de escribir usa `use_primary()`.
+    """
+
+    def _is_analytics(self, model):
+        return model._meta.app_label == 'submodulos' and model._meta.model_name in ANALYTICS_MODELS
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_ALIAS in settings.DATABASES and not _pinned.get() and self._is_analytics(model):
+            return REPLICA_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and self._is_analytics(model):
+            # El middleware restaura el valor al terminar la petición
+            state['wrote'] = True
+            _pinned.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica contiene los mismos datos que la principal
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class PrimaryPinningMiddleware:
+    """
+    Decide por petición si las lecturas analíticas pueden ir a la réplica
+
+    Las peticiones que escriben estadísticas o auditoría quedan fijadas a la
+    principal desde esa escritura, y una cookie mantiene esa fijación durante
+    el retraso de replicación configurado para que el usuario vea sus propios
+    cambios en las peticiones siguientes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.lag = getattr(settings, 'DATABASE_REPLICA_LAG', 5)
+
+    def __call__(self, request):
+        state = {'wrote': False}
+        token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        state_token = _request_state.set(state)
+        try:
+            response = self.get_response(request)
+            if state['wrote'] and REPLICA_ALIAS in settings.DATABASES:
+                response.set_cookie(PIN_COOKIE, '1', max_age=self.lag, httponly=True, samesite='Lax')
+            return response
+        finally:
+            _request_state.reset(state_token)
+            _pinned.reset(token)
@@ -0,0 +1,201 @@
+# submodulos/forecasting.py
+from datetime import timedelta
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import EstadisticaRecursos, Nodo, RecursoFisico, TipoRecurso
+
+logger = logging.getLogger(__name__)
+
+FORECAST_CACHE_KEY = 'sentinelnexus:forecasts'
+
+SECONDS_PER_DAY = 86400.0
+
+
+def _forecast_settings():
+    """Devuelve la configuración de pronósticos con valores por defecto"""
+    defaults = {
+        'history_days': 90,       # Ventana de historial usada para ajustar la tendencia
+        'min_samples': 3,         # Mínimo de muestras por entidad para ajustar
+        'threshold': 100.0,       # Porcentaje de uso considerado agotamiento
+        'horizon_days': 365,      # Pronósticos más lejanos se descartan
+        'cache_timeout': 6 * 3600,
+    }
+    defaults.update(getattr(settings, 'FORECASTING', {}))
+    return defaults
+
+
+def load_history(since):
+    """
+    Carga el historial de EstadisticaRecursos de todas las entidades en una sola consulta
+
+    Args:
+        since (datetime): Solo se cargan periodos que terminan después de esta fecha
+
+    Returns:
+        tuple: (claves, grupo, t, uso_promedio, uso_maximo) donde `claves` es la lista de
+            (tipo_entidad, entidad_id, tipo_recurso_id) y `grupo` es el índice de la clave
+            de cada muestra. `t` está expresado en días relativos al momento actual.
+    """
+    rows = (
+        EstadisticaRecursos.objects
+        .filter(periodo__fecha_fin__gte=since)
+        .values_list('tipo_entidad', 'entidad_id', 'tipo_recurso_id',
+                     'periodo__fecha_fin', 'uso_promedio', 'uso_maximo')
+        .iterator(chunk_size=10000)
+    )
+
+    now = time.time()
+    keys = {}
+    grupo, t, promedio, maximo = [], [], [], []
+    for tipo_entidad, entidad_id, tipo_recurso_id, fecha_fin, uso_prom, uso_max in rows:
+        key = (tipo_entidad, entidad_id, tipo_recurso_id)
+        grupo.append(keys.setdefault(key, len(keys)))
+        t.append((fecha_fin.timestamp() - now) / SECONDS_PER_DAY)
+        promedio.append(uso_prom)
+        maximo.append(uso_max)
+
+    return (
+        list(keys),
+        np.asarray(grupo, dtype=np.int64),
+        np.asarray(t, dtype=np.float64),
+        np.asarray(promedio, dtype=np.float64),
+        np.asarray(maximo, dtype=np.float64),
+    )
+
+
+def fit_trends(grupo, t, y, n_groups):
+    """
+    Ajusta una recta por mínimos cuadrados a cada grupo de forma vectorizada
+
+    Las sumas necesarias para la solución cerrada se acumulan con `np.bincount`,
+    por lo que el coste es lineal en el número de muestras sin bucles por entidad.
+
+    Args:
+        grupo (ndarray): Índice de grupo de cada muestra
+        t (ndarray): Tiempo de cada muestra en días (0 = ahora)
+        y (ndarray): Valor observado de cada muestra
+        n_groups (int): Número total de grupos
+
+    Returns:
+        tuple: (n, pendiente, intercepto, r2) por grupo. La pendiente está en
+            puntos porcentuales por día y el intercepto es el valor estimado ahora.
+    """
+    n = np.bincount(grupo, minlength=n_groups).astype(np.float64)
+    sx = np.bincount(grupo, weights=t, minlength=n_groups)
+    sy = np.bincount(grupo, weights=y, minlength=n_groups)
+    sxx = np.bincount(grupo, weights=t * t, minlength=n_groups)
+    sxy = np.bincount(grupo, weights=t * y, minlength=n_groups)
+    syy = np.bincount(grupo, weights=y * y, minlength=n_groups)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var_x = n * sxx - sx * sx
+        var_y = n * syy - sy * sy
+        cov = n * sxy - sx * sy
+        slope = np.where(var_x > 0, cov / var_x, 0.0)
+        intercept = np.where(n > 0, (sy - slope * sx) / n, 0.0)
+        r2 = np.where((var_x > 0) & (var_y > 0), (cov * cov) / (var_x * var_y), 0.0)
+
+    return n, slope, intercept, r2
+
+
+def days_to_threshold(slope, intercept, threshold):
+    """
+    Calcula los días restantes hasta que la tendencia alcance el umbral
+
+    Returns:
+        ndarray: Días hasta el umbral (0 si ya se superó, inf si la tendencia no crece)
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days = np.where(slope > 0, (threshold - intercept) / slope, np.inf)
+    days = np.where(intercept >= threshold, 0.0, days)
+    return days
+
+
+def compute_forecasts(since=None):
+    """
+    Calcula los pronósticos de agotamiento para todas las entidades con historial
+
+    Args:
+        since (datetime, optional): Inicio del historial. Por defecto se usa
+            FORECASTING['history_days'] días hacia atrás.
+
+    Returns:
+        dict: Resultado con la fecha de cálculo y la lista de pronósticos
+            ordenada por días restantes.
+    """
+    config = _forecast_settings()
+    started = time.monotonic()
+    if since is None:
+        since = timezone.now() - timedelta(days=config['history_days'])
+
+    keys, grupo, t, promedio, maximo = load_history(since)
+    n_groups = len(keys)
+    forecasts = []
+
+    if n_groups:
+        # Para el agotamiento se usa el uso máximo (estimación conservadora)
+        n, slope, intercept, r2 = fit_trends(grupo, t, maximo, n_groups)
+        _, slope_avg, intercept_avg, _ = fit_trends(grupo, t, promedio, n_groups)
+        days = days_to_threshold(slope, intercept, config['threshold'])
+
+        valid = n >= config['min_samples']
+        order = np.argsort(days, kind='stable')
+
+        node_ids = {k[1] for k in keys if k[0] == 'nodo'}
+        storage_ids = {k[1] for k in keys if k[0] == 'almacenamiento'}
+        names = {
+            'nodo': dict(Nodo.objects.filter(nodo_id__in=node_ids).values_list('nodo_id', 'nombre')),
+            'almacenamiento': {
+                recurso_id: f'{nodo}/{nombre}'
+                for recurso_id, nodo, nombre in RecursoFisico.objects.filter(recurso_id__in=storage_ids)
+                .values_list('recurso_id', 'nodo__nombre', 'nombre')
+            },
+        }
+        resource_names = dict(TipoRecurso.objects.values_list('tipo_recurso_id', 'nombre'))
+
+        for i in order:
+            if not valid[i]:
+                continue
+            tipo_entidad, entidad_id, tipo_recurso_id = keys[i]
+            remaining = float(days[i])
+            forecasts.append({
+                'tipo_entidad': tipo_entidad,
+                'entidad_id': entidad_id,
+                'entidad': names.get(tipo_entidad, {}).get(entidad_id, str(entidad_id)),
+                'tipo_recurso_id': tipo_recurso_id,
+                'tipo_recurso': resource_names.get(tipo_recurso_id, str(tipo_recurso_id)),
+                'muestras': int(n[i]),
+                'uso_actual': round(float(intercept[i]), 2),
+                'uso_promedio_actual': round(float(intercept_avg[i]), 2),
+                'tendencia_diaria': round(float(slope[i]), 4),
+                'tendencia_promedio_diaria': round(float(slope_avg[i]), 4),
+                'r2': round(float(r2[i]), 3),
+                'dias_restantes': round(remaining, 1) if remaining <= config['horizon_days'] else None,
+            })
+
+    elapsed = time.monotonic() - started
+    logger.info(f"Pronósticos calculados para {len(forecasts)} entidades en {elapsed:.2f}s")
+    return {
+        'calculado': timezone.now().isoformat(),
+        'umbral': config['threshold'],
+        'muestras': int(len(t)),
+        'pronosticos': forecasts,
+    }
+
+
+def refresh_forecasts():
+    """Recalcula los pronósticos y los guarda en caché"""
+    result = compute_forecasts()
+    cache.set(FORECAST_CACHE_KEY, result, _forecast_settings()['cache_timeout'])
+    return result
+
+
+def get_cached_forecasts():
+    """Devuelve los pronósticos en caché o None si aún no se han calculado"""
+    return cache.get(FORECAST_CACHE_KEY)
@@ -0,0 +1,224 @@
+# submodulos/governor.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+import heapq
+import itertools
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Carriles de prioridad: un número menor se atiende antes
+INTERACTIVE = 0
+BACKGROUND = 1
+
+LANE_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+NODE_PATH = re.compile(r'/nodes/([^/?]+)')
+
+_lane = ContextVar('sentinelnexus_upstream_lane', default=BACKGROUND)
+
+
+def _governor_settings():
+    """Devuelve la configuración del limitador de llamadas a Proxmox con valores por defecto"""
+    defaults = {
+        'rate': 20.0,              # Llamadas por segundo y nodo (reposición del bucket)
+        'burst': 40,               # Capacidad del bucket
+        'max_concurrency': 8,      # Llamadas simultáneas por nodo
+        'interactive_reserve': 2,  # Huecos de concurrencia reservados al carril interactivo
+        'timeout': {INTERACTIVE: 10.0, BACKGROUND: 60.0},
+    }
+    defaults.update(getattr(settings, 'UPSTREAM_GOVERNOR', {}))
+    return defaults
+
+
+class UpstreamBusy(Exception):
+    """No se obtuvo turno para llamar a Proxmox dentro del tiempo de espera"""
+
+
+def current_lane():
+    return _lane.get()
+
+
+@contextmanager
+def lane(priority):
+    """Ejecuta las llamadas del bloque en el carril indicado"""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def interactive():
+    return lane(INTERACTIVE)
+
+
+class NodeLimiter:
+    """
+    Bucket de tokens y límite de concurrencia de un nodo
+
+    Las peticiones esperan en una cola ordenada por (carril, llegada), de modo
+    que una petición interactiva adelanta a toda la recolección en segundo plano
+    pendiente. El carril de segundo plano nunca ocupa los últimos
+    `interactive_reserve` huecos de concurrencia.
+    """
+
+    def __init__(self, rate, burst, max_concurrency, interactive_reserve):
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.interactive_reserve = min(interactive_reserve, max_concurrency - 1)
+        self.tokens = float(burst)
+        self.in_flight = 0
+        self.waiting = []
+        self.completed = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.rejected = {INTERACTIVE: 0, BACKGROUND: 0}
+        self._updated = time.monotonic()
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def _concurrency_limit(self, priority):
+        if priority == INTERACTIVE:
+            return self.max_concurrency
+        return self.max_concurrency - self.interactive_reserve
+
+    def acquire(self, priority, timeout):
+        entry = (priority, next(self._sequence))
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            heapq.heappush(self.waiting, entry)
+            try:
+                while True:
+                    self._refill()
+                    if (self.waiting[0] == entry and self.tokens >= 1
+                            and self.in_flight < self._concurrency_limit(priority)):
+                        heapq.heappop(self.waiting)
+                        self.tokens -= 1
+                        self.in_flight += 1
+                        # El siguiente en la cola puede tener ya turno
+                        self._condition.notify_all()
+                        return
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.rejected[priority] += 1
+                        raise UpstreamBusy(f"Sin turno para llamar a Proxmox tras {timeout:.0f}s")
+                    wait = remaining
+                    if self.tokens < 1:
+                        wait = min(wait, (1 - self.tokens) / self.rate)
+                    self._condition.wait(wait)
+            except BaseException:
+                if entry in self.waiting:
+                    self.waiting.remove(entry)
+                    heapq.heapify(self.waiting)
+                    self._condition.notify_all()
+                raise
+
+    def release(self, priority):
+        with self._condition:
+            self.in_flight -= 1
+            self.completed[priority] += 1
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            self._refill()
+            return {
+                'tokens': round(self.tokens, 1),
+                'in_flight': self.in_flight,
+                'waiting': {LANE_NAMES[p]: sum(1 for w in self.waiting if w[0] == p) for p in LANE_NAMES},
+                'completed': {LANE_NAMES[p]: n for p, n in self.completed.items()},
+                'rejected': {LANE_NAMES[p]: n for p, n in self.rejected.items()},
+            }
+
+
+class UpstreamGovernor:
+    """
+    Punto único por el que pasan todas las llamadas HTTP a Proxmox
+
+    `govern` envuelve la sesión de una conexión de proxmoxer: cada petición se
+    asigna al nodo de su ruta (`/nodes/<nodo>/...`, o 'cluster' para el resto)
+    y espera turno en el limitador de ese nodo con la prioridad del carril
+    actual. Las vistas web usan el carril interactivo (ver
+    InteractiveLaneMiddleware) y los comandos y barridos el de segundo plano.
+
+    Los límites son por proceso: con varios procesos, la carga máxima sobre un
+    nodo es la suma de los límites de cada uno.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or _governor_settings()
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, node):
+        limiter = self._limiters.get(node)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(node)
+                if limiter is None:
+                    limiter = NodeLimiter(self.config['rate'], self.config['burst'],
+                                          self.config['max_concurrency'], self.config['interactive_reserve'])
+                    self._limiters[node] = limiter
+        return limiter
+
+    @contextmanager
+    def slot(self, node, priority=None):
+        """Reserva un turno para llamar a `node` en el carril actual o el indicado"""
+        priority = current_lane() if priority is None else priority
+        limiter = self.limiter(node)
+        limiter.acquire(priority, self.config['timeout'][priority])
+        try:
+            yield
+        finally:
+            limiter.release(priority)
+
+    def govern(self, proxmox):
+        """
+        Hace que todas las llamadas de una conexión de proxmoxer pasen por el limitador
+
+        Returns:
+            ProxmoxAPI: La misma conexión (o None si no hay conexión)
+        """
+        if proxmox is None:
+            return None
+        session = proxmox._store['session']
+        if getattr(session, '_sentinelnexus_governed', False):
+            return proxmox
+        request = session.request
+
+        def governed_request(method, url, *args, **kwargs):
+            match = NODE_PATH.search(url)
+            with self.slot(match.group(1) if match else 'cluster'):
+                return request(method, url, *args, **kwargs)
+
+        session.request = governed_request
+        session._sentinelnexus_governed = True
+        return proxmox
+
+    def stats(self):
+        return {node: limiter.stats() for node, limiter in list(self._limiters.items())}
+
+
+class InteractiveLaneMiddleware:
+    """Las llamadas a Proxmox hechas al atender una petición web van por el carril interactivo"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with interactive():
+            return self.get_response(request)
+
+
+# Instancia singleton para usar en toda la aplicación
+governor = UpstreamGovernor()
@@ -0,0 +1,280 @@
+# submodulos/ip_discovery.py
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+import ipaddress
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from proxmoxer import ProxmoxAPI
+
+from .config_store import config_store
+from .governor import governor
+from .models import MaquinaVirtual
+from .proxmox_service import proxmox_service
+
+logger = logging.getLogger(__name__)
+
+IP_CACHE_PREFIX = 'sentinelnexus:ip_discovery:ip:'
+BACKOFF_PREFIX = 'sentinelnexus:ip_discovery:noagent:'
+
+
+def _ip_discovery_settings():
+    """Devuelve la configuración del descubrimiento de IPs con valores por defecto"""
+    defaults = {
+        'per_node_concurrency': 4,   # Consultas simultáneas al agente por nodo
+        'max_workers': 64,           # Hilos totales del barrido
+        'deadline': 120,             # Segundos máximos de un barrido completo
+        'agent_timeout': 10,         # Timeout HTTP de cada consulta al agente
+        'ip_ttl': 900,               # Segundos que una IP descubierta se considera vigente
+        'backoff_base': 600,         # Primera espera tras un invitado sin agente
+        'backoff_max': 6 * 3600,
+    }
+    defaults.update(getattr(settings, 'IP_DISCOVERY', {}))
+    return defaults
+
+
+def select_primary_ip(interfaces):
+    """
+    Elige la IP principal de la respuesta de `agent/network-get-interfaces`
+
+    Se prefieren direcciones IPv4 globales o privadas; se descartan loopback,
+    link-local y las interfaces de contenedores y puentes internos.
+
+    Returns:
+        str | None: Dirección IP o None si no hay ninguna utilizable
+    """
+    candidates = []
+    for interface in interfaces or []:
+        name = interface.get('name', '')
+        if name == 'lo' or name.startswith(('docker', 'veth', 'br-', 'virbr', 'cni', 'flannel')):
+            continue
+        for address in interface.get('ip-addresses') or []:
+            try:
+                ip = ipaddress.ip_address(address.get('ip-address', ''))
+            except ValueError:
+                continue
+            if ip.is_loopback or ip.is_link_local or ip.is_multicast or ip.is_unspecified:
+                continue
+            candidates.append(ip)
+    if not candidates:
+        return None
+    candidates.sort(key=lambda ip: ip.version)
+    return str(candidates[0])
+
+
+def _is_no_agent_error(error):
+    message = str(error).lower()
+    return 'guest agent' in message or 'not running' in message or 'timeout' in message or 'timed out' in message
+
+
+class IPDiscovery:
+    """
+    Descubre las IPs de las VMs QEMU a través del agente invitado
+
+    Cada nodo tiene su propia cola de VMs y como máximo `per_node_concurrency`
+    consultas en curso, de modo que un nodo lento no acapara el barrido. Las VMs
+    sin agente (o cuyo agente no responde) se aplazan con una espera exponencial,
+    las IPs encontradas se guardan en caché con un TTL y los cambios se escriben
+    en MaquinaVirtual con un único `bulk_update`. El barrido termina al llegar a
+    `deadline` aunque queden agentes sin responder.
+    """
+
+    def __init__(self, proxmox=None, config=None):
+        self._proxmox = proxmox
+        self.config = config or _ip_discovery_settings()
+
+    @property
+    def proxmox(self):
+        if self._proxmox is None:
+            # Conexión propia con un timeout corto para que un agente colgado no bloquee el hueco
+            try:
+                self._proxmox = ProxmoxAPI(
+                    host=settings.PROXMOX['host'],
+                    user=settings.PROXMOX['user'],
+                    password=settings.PROXMOX['password'],
+                    verify_ssl=settings.PROXMOX['verify_ssl'],
+                    timeout=self.config['agent_timeout']
+                )
+                governor.govern(self._proxmox)
+            except Exception as e:
+                logger.error(f"Error al conectar con Proxmox para el descubrimiento de IPs: {str(e)}")
+                return proxmox_service.proxmox
+        return self._proxmox
+
+    # Selección de VMs
+
+    def _agent_disabled(self, config_entry):
+        """Usa la configuración en caché para saltar VMs con el agente desactivado"""
+        if not config_entry:
+            return False
+        agent = str(config_entry['config'].get('agent', '0'))
+        return not (agent.startswith('1') or 'enabled=1' in agent)
+
+    def select_targets(self, resources, force=False):
+        """
+        Filtra las VMs que hay que consultar en este barrido
+
+        Returns:
+            tuple: (VMs a consultar, IPs vigentes en caché, VMs aplazadas)
+        """
+        running = [r for r in resources if r.get('type') == 'qemu' and r.get('status') == 'running']
+        vmids = [int(r['vmid']) for r in running]
+
+        cached_ips = cache.get_many([f'{IP_CACHE_PREFIX}{vmid}' for vmid in vmids])
+        backoffs = cache.get_many([f'{BACKOFF_PREFIX}{vmid}' for vmid in vmids])
+        configs = config_store.cached_configs(vmids)
+
+        now = time.time()
+        targets, fresh, deferred = [], {}, 0
+        for resource in running:
+            vmid = int(resource['vmid'])
+            cached = cached_ips.get(f'{IP_CACHE_PREFIX}{vmid}')
+            if cached is not None and not force:
+                fresh[vmid] = cached
+                continue
+            backoff = backoffs.get(f'{BACKOFF_PREFIX}{vmid}')
+            if backoff and backoff['retry_at'] > now and not force:
+                deferred += 1
+                continue
+            if self._agent_disabled(configs.get(vmid)):
+                deferred += 1
+                continue
+            targets.append(resource)
+        return targets, fresh, deferred
+
+    # Consultas al agente
+
+    def query_agent(self, node, vmid):
+        """Devuelve la IP principal de una VM o None si el agente no informa ninguna"""
+        response = self.proxmox.nodes(node).qemu(vmid).agent('network-get-interfaces').get()
+        return select_primary_ip(response.get('result') if isinstance(response, dict) else response)
+
+    def _drain(self, node, queue, deadline, results, failures, in_flight):
+        """Consume la cola de un nodo hasta vaciarla o alcanzar el límite de tiempo"""
+        while time.monotonic() < deadline:
+            try:
+                resource = queue.popleft()
+            except IndexError:
+                return
+            vmid = int(resource['vmid'])
+            in_flight.add(vmid)
+            try:
+                results[vmid] = (node, self.query_agent(node, vmid))
+            except Exception as e:
+                failures[vmid] = _is_no_agent_error(e)
+                logger.debug(f"Agente de la VM {vmid} en {node} sin respuesta: {str(e)}")
+            finally:
+                in_flight.discard(vmid)
+
+    def _record_backoff(self, vmids):
+        if not vmids:
+            return
+        keys = [f'{BACKOFF_PREFIX}{vmid}' for vmid in vmids]
+        current = cache.get_many(keys)
+        now = time.time()
+        entries = {}
+        for key in keys:
+            failures = (current.get(key) or {}).get('failures', 0) + 1
+            delay = min(self.config['backoff_base'] * 2 ** (failures - 1), self.config['backoff_max'])
+            entries[key] = {'failures': failures, 'retry_at': now + delay}
+        cache.set_many(entries, self.config['backoff_max'] * 2)
+
+    def sweep(self, resources=None, force=False, deadline=None):
+        """
+        Barre todas las VMs QEMU en ejecución y actualiza `MaquinaVirtual.ip_address`
+
+        Args:
+            resources (list, optional): Salida de cluster/resources; por defecto se consulta
+            force (bool): Ignorar la caché de IPs y las esperas de las VMs sin agente
+            deadline (float, optional): Segundos máximos del barrido
+
+        Returns:
+            dict: Estadísticas del barrido
+        """
+        started = time.monotonic()
+        limit = started + (deadline or self.config['deadline'])
+        if resources is None:
+            resources = proxmox_service.get_cluster_resources('vm')
+
+        targets, fresh, deferred = self.select_targets(resources, force=force)
+
+        queues = {}
+        for resource in targets:
+            queues.setdefault(resource['node'], deque()).append(resource)
+
+        results, failures, in_flight = {}, {}, set()
+        slots = [(node, queue) for node, queue in queues.items()
+                 for _ in range(min(self.config['per_node_concurrency'], len(queue)))]
+        if slots:
+            executor = ThreadPoolExecutor(max_workers=min(self.config['max_workers'], len(slots)))
+            futures = [executor.submit(self._drain, node, queue, limit, results, failures, in_flight)
+                       for node, queue in slots]
+            wait(futures, timeout=max(0.0, limit - time.monotonic()))
+            # Las consultas que siguen en curso terminan en segundo plano y se descartan
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        # Copia de lo recibido hasta el límite de tiempo; las consultas aún en curso
+        # cuentan como agentes sin respuesta para no volver a bloquear el siguiente barrido
+        results = dict(results)
+        failures = dict(failures)
+        for vmid in set(in_flight):
+            if vmid not in results:
+                failures.setdefault(vmid, True)
+        found = {vmid: ip for vmid, (node, ip) in results.items() if ip}
+        cache.set_many({f'{IP_CACHE_PREFIX}{vmid}': ip for vmid, ip in found.items()}, self.config['ip_ttl'])
+        if found:
+            cache.delete_many([f'{BACKOFF_PREFIX}{vmid}' for vmid in found])
+        self._record_backoff([vmid for vmid, no_agent in failures.items() if no_agent])
+
+        nodes = {int(r['vmid']): r['node'] for r in resources if r.get('vmid') is not None}
+        updated = self.write_ips({**fresh, **found}, nodes)
+
+        stats = {
+            'queried': len(results) + len(failures),
+            'found': len(found),
+            'cached': len(fresh),
+            'deferred': deferred,
+            'no_agent': sum(1 for no_agent in failures.values() if no_agent),
+            'unfinished': len(targets) - len(results) - len(failures),
+            'updated': updated,
+            'elapsed': round(time.monotonic() - started, 2),
+        }
+        logger.info(f"Descubrimiento de IPs: {stats}")
+        return stats
+
+    # Escritura
+
+    def write_ips(self, ips, nodes):
+        """
+        Escribe en bloque las IPs que cambiaron
+
+        Args:
+            ips (dict): {vmid: ip}
+            nodes (dict): {vmid: nombre del nodo actual}
+
+        Returns:
+            int: Número de MaquinaVirtual actualizadas
+        """
+        if not ips:
+            return 0
+        now = timezone.now()
+        changed = []
+        for vm in (MaquinaVirtual.objects
+                   .filter(vmid__in=ips.keys(), vm_type='qemu')
+                   .select_related('nodo')
+                   .only('vm_id', 'vmid', 'ip_address', 'last_checked', 'nodo__nombre')):
+            ip = ips[vm.vmid]
+            if nodes.get(vm.vmid) not in (None, vm.nodo.nombre) or vm.ip_address == ip:
+                continue
+            vm.ip_address = ip
+            vm.last_checked = now
+            changed.append(vm)
+        MaquinaVirtual.objects.bulk_update(changed, ['ip_address', 'last_checked'], batch_size=500)
+        return len(changed)
+
+
+# Instancia singleton para usar en toda la aplicación
+ip_discovery = IPDiscovery()
@@ -0,0 +1,97 @@
+import gc
+import pickle
+import random
+import time
+import tracemalloc
+
+import orjson
+from django.core.management.base import BaseCommand
+from django.template import Context, Engine
+
+from submodulos.records import parse_guests
+from submodulos.responses import encode
+
+TEMPLATE = ('{% for vm in vms %}{{ vm.vmid }} {{ vm.name }} {{ vm.node }} {{ vm.type }} '
+            '{{ vm.status }} {{ vm.cpu|floatformat:2 }}\n{% endfor %}')
+
+
+def _synthetic_inventory(guests, nodes):
+    """Respuesta de cluster/resources con el formato y la variedad de valores de Proxmox"""
+    rng = random.Random(0)
+    node_names = [f'pve{i:03d}' for i in range(nodes)]
+    items = []
+    for i in range(guests):
+        running = rng.random() < 0.8
+        item = {
+            'id': f'qemu/{100 + i}', 'vmid': 100 + i, 'name': f'vm-{rng.choice(("web", "db", "app"))}-{i}',
+            'node': rng.choice(node_names), 'type': 'qemu' if rng.random() < 0.7 else 'lxc',
+            'status': 'running' if running else 'stopped', 'template': 0,
+            'cpu': rng.random() if running else 0, 'maxcpu': rng.choice((1, 2, 4, 8)),
+            'mem': rng.randrange(1 << 30), 'maxmem': 4 << 30, 'disk': 0, 'maxdisk': 32 << 30,
+            'uptime': rng.randrange(10 ** 6) if running else 0, 'netin': rng.randrange(10 ** 9),
+            'netout': rng.randrange(10 ** 9), 'diskread': rng.randrange(10 ** 9),
+            'diskwrite': rng.randrange(10 ** 9), 'tags': rng.choice(('', 'prod', 'prod;db', 'dev')),
+        }
+        # Los listados reales crean cadenas nuevas en cada respuesta, no literales compartidos
+        items.append(orjson.loads(orjson.dumps(item)))
+    return items
+
+
+def _measure(build):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size, elapsed
+
+
+def _timed(func, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return value, best
+
+
+class Command(BaseCommand):
+    help = 'Compara memoria y serialización de un inventario como diccionarios de proxmoxer y como registros'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=50000)
+        parser.add_argument('--nodes', type=int, default=200)
+
+    def handle(self, *args, **options):
+        payload = orjson.dumps(_synthetic_inventory(options['guests'], options['nodes']))
+        template = Engine().from_string(TEMPLATE)
+
+        rows = []
+        for label, build in (('dict', lambda: orjson.loads(payload)),
+                             ('record', lambda: parse_guests(orjson.loads(payload)))):
+            data, memory, parse_time = _measure(build)
+            # La API solo serializa diccionarios (ver GuestRecord); para los registros
+            # se mide la conversión con to_dict que haría falta para servirlos
+            served = (lambda: data) if label == 'dict' else (lambda: [r.to_dict() for r in data])
+            json_body, json_time = _timed(lambda: encode({'data': served()}, 'json'))
+            msgpack_body, msgpack_time = _timed(lambda: encode({'data': served()}, 'msgpack'))
+            pickled, pickle_time = _timed(lambda: pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+            _, unpickle_time = _timed(lambda: pickle.loads(pickled))
+            _, render_time = _timed(lambda: template.render(Context({'vms': data})), repeat=1)
+            rows.append((label, memory, parse_time, json_time, len(json_body), msgpack_time,
+                         len(msgpack_body), pickle_time, unpickle_time, len(pickled), render_time))
+            del data
+
+        self.stdout.write(f"{options['guests']} invitados en {options['nodes']} nodos")
+        header = ('', 'memoria MB', 'parseo ms', 'json ms', 'json MB', 'msgpack ms', 'msgpack MB',
+                  'pickle ms', 'unpickle ms', 'pickle MB', 'plantilla ms')
+        self.stdout.write(''.join(f'{h:>13}' for h in header))
+        for label, memory, *values in rows:
+            cells = [label, f'{memory / 1e6:.1f}']
+            for i, value in enumerate(values):
+                # Tiempos en segundos (float) y tamaños en bytes (int)
+                cells.append(f'{value * 1000:.1f}' if isinstance(value, float) else f'{value / 1e6:.2f}')
+            self.stdout.write(''.join(f'{c:>13}' for c in cells))
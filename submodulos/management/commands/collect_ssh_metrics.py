@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from submodulos.models import AuditoriaPeriodo, Nodo
+from submodulos.sharding import node_key
+from submodulos.ssh_executor import cache_node_metrics, collect_guest_audit, collect_node_metrics, ssh_executor
+
+NODE_METRICS_TTL = 300
+
+
+class Command(BaseCommand):
+    help = 'Recolecta por SSH métricas de los nodos (ZFS ARC, disco, procesos) y auditoría de los invitados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periodo', type=int, default=None,
+                            help='ID del AuditoriaPeriodo; por defecto el periodo activo actual')
+        parser.add_argument('--skip-nodes', action='store_true', help='No recolectar métricas de los nodos')
+        parser.add_argument('--skip-guests', action='store_true', help='No recolectar auditoría de los invitados')
+
+    def handle(self, *args, **options):
+        try:
+            if not options['skip_nodes']:
+                hosts = {node_key(nodo): nodo.ip_address for nodo in Nodo.objects.filter(estado='activo')}
+                metrics = collect_node_metrics(hosts)
+                # Solo en caché: la auditoría es por VM (ver collect_node_metrics)
+                cache_node_metrics(metrics, NODE_METRICS_TTL)
+                self.stdout.write(f"Métricas recolectadas en {len(metrics)} nodos")
+
+            if not options['skip_guests']:
+                periodo = self._get_periodo(options['periodo'])
+                created = collect_guest_audit(periodo)
+                self.stdout.write(self.style.SUCCESS(f"{created} detalles de auditoría creados en {periodo}"))
+        finally:
+            ssh_executor.close()
+
+    def _get_periodo(self, periodo_id):
+        if periodo_id is not None:
+            try:
+                return AuditoriaPeriodo.objects.get(pk=periodo_id)
+            except AuditoriaPeriodo.DoesNotExist:
+                raise CommandError(f"No existe el periodo de auditoría {periodo_id}")
+
+        now = timezone.now()
+        periodo = (AuditoriaPeriodo.objects
+                   .filter(estado='activo', fecha_inicio__lte=now, fecha_fin__gte=now)
+                   .order_by('-fecha_inicio')
+                   .first())
+        if periodo is None:
+            raise CommandError("No hay un periodo de auditoría activo; usa --periodo")
+        return periodo
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.forecasting import refresh_forecasts
+
+
+class Command(BaseCommand):
+    help = 'Calcula los pronósticos de agotamiento de recursos y los guarda en caché'
+
+    def handle(self, *args, **options):
+        result = refresh_forecasts()
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(result['pronosticos'])} pronósticos calculados a partir de {result['muestras']} muestras"
+        ))
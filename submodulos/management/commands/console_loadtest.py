@@ -0,0 +1,110 @@
+import asyncio
+import resource
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+
+from submodulos.console import CONSOLE_PATH_PREFIX, ConsoleProxy, _console_settings
+
+
+class _LoadTestProxy(ConsoleProxy):
+    """Proxy con autenticación y destino fijos para medir solo el bucle de retransmisión"""
+
+    def __init__(self, host, port, config):
+        super().__init__(config)
+        self.target = {'user_id': '1', 'node': 'loadtest', 'vmid': 0, 'kind': 'vnc',
+                       'host': host, 'port': port, 'ticket': '', 'pve_user': ''}
+
+    async def authenticate(self, scope):
+        return '1'
+
+    async def resolve_target(self, token):
+        return dict(self.target)
+
+
+async def _echo(reader, writer):
+    while True:
+        data = await reader.read(65536)
+        if not data:
+            break
+        writer.write(data)
+        await writer.drain()
+    writer.close()
+
+
+async def _client(proxy, frames, frame_size):
+    inbound = asyncio.Queue()
+    received = 0
+    done = asyncio.Event()
+    accepted = asyncio.Event()
+    expected = frames * frame_size
+
+    async def receive():
+        return await inbound.get()
+
+    progress = asyncio.Event()
+
+    async def send(message):
+        nonlocal received
+        if message['type'] == 'websocket.accept':
+            accepted.set()
+        elif message['type'] == 'websocket.send':
+            received += len(message['bytes'])
+            progress.set()
+            if received >= expected:
+                done.set()
+        elif message['type'] == 'websocket.close':
+            accepted.set()
+            done.set()
+
+    scope = {'type': 'websocket', 'path': CONSOLE_PATH_PREFIX + 'loadtest/', 'headers': [], 'subprotocols': ['binary']}
+    session = asyncio.ensure_future(proxy(scope, receive, send))
+    await inbound.put({'type': 'websocket.connect'})
+    await accepted.wait()
+
+    # Como un cliente real, no se envía más de una ventana sin recibir el eco
+    payload = b'x' * frame_size
+    window = 8 * frame_size
+    for sent in range(1, frames + 1):
+        await inbound.put({'type': 'websocket.receive', 'bytes': payload})
+        while sent * frame_size - received > window and not done.is_set():
+            progress.clear()
+            await progress.wait()
+    await done.wait()
+    await inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+    await session
+    return received
+
+
+class Command(BaseCommand):
+    help = 'Prueba de carga del proxy de consola con sesiones simultáneas contra un servidor eco local'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=500)
+        parser.add_argument('--frames', type=int, default=200)
+        parser.add_argument('--frame-size', type=int, default=4096)
+
+    def handle(self, *args, **options):
+        asyncio.run(self._run(options['sessions'], options['frames'], options['frame_size']))
+
+    async def _run(self, sessions, frames, frame_size):
+        server = await asyncio.start_server(_echo, '127.0.0.1', 0, backlog=sessions)
+        host, port = server.sockets[0].getsockname()[:2]
+        config = dict(_console_settings(), max_sessions_per_node=sessions)
+        proxy = _LoadTestProxy(host, port, config)
+
+        tracemalloc.start()
+        started = time.monotonic()
+        results = await asyncio.gather(*(_client(proxy, frames, frame_size) for _ in range(sessions)))
+        elapsed = time.monotonic() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        server.close()
+
+        total = sum(results)
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(f"Sesiones simultáneas: {sessions}")
+        self.stdout.write(f"Datos retransmitidos: {total / 1e6:.1f} MB en {elapsed:.2f}s ({total / 1e6 / elapsed:.1f} MB/s)")
+        self.stdout.write(f"Memoria Python pico: {peak / 1e6:.1f} MB ({peak / sessions / 1024:.1f} KB por sesión)")
+        self.stdout.write(f"RSS máximo del proceso: {rss_mb:.1f} MB")
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.ip_discovery import ip_discovery
+
+
+class Command(BaseCommand):
+    help = 'Descubre las IPs de las VMs QEMU mediante el agente invitado y actualiza MaquinaVirtual'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Consultar también las VMs con IP en caché o aplazadas por no tener agente')
+        parser.add_argument('--deadline', type=float, default=None,
+                            help='Segundos máximos del barrido')
+
+    def handle(self, *args, **options):
+        stats = ip_discovery.sweep(force=options['force'], deadline=options['deadline'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['found']} IPs descubiertas, {stats['updated']} actualizadas, "
+            f"{stats['no_agent']} sin agente, {stats['unfinished']} sin terminar en {stats['elapsed']}s"
+        ))
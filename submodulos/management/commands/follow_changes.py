@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.change_detector import change_detector
+
+
+class Command(BaseCommand):
+    help = 'Sigue cluster/log y cluster/tasks e invalida o refresca solo las VMs afectadas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Segundos entre consultas')
+        parser.add_argument('--once', action='store_true',
+                            help='Realiza una sola consulta y termina')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            summary = change_detector.poll()
+            self.stdout.write(self.style.SUCCESS(f"Cambios aplicados: {summary or 'ninguno'}"))
+            return
+
+        self.stdout.write("Siguiendo cluster/log y cluster/tasks (Ctrl+C para detener)")
+        try:
+            change_detector.follow(interval=options['interval'])
+        except KeyboardInterrupt:
+            pass
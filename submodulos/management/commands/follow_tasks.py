@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.task_feed import task_feed
+
+
+class Command(BaseCommand):
+    help = 'Sigue de forma incremental las tareas del cluster y las guarda en el índice de tareas'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help='Segundos entre consultas a cluster/tasks')
+        parser.add_argument('--once', action='store_true',
+                            help='Realiza una sola consulta y termina')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            changed = task_feed.poll()
+            self.stdout.write(self.style.SUCCESS(f"{len(changed)} tareas nuevas o modificadas"))
+            return
+
+        self.stdout.write("Siguiendo cluster/tasks (Ctrl+C para detener)")
+        try:
+            task_feed.follow(interval=options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.rebalancer import rebalancer
+
+
+class Command(BaseCommand):
+    help = 'Calcula y ejecuta migraciones en caliente que reducen la carga del nodo más cargado'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Mostrar el plan sin migrar')
+        parser.add_argument('--max-moves', type=int, default=None, help='Migraciones como máximo')
+        parser.add_argument('--deadline', type=float, default=None,
+                            help='Segundos máximos para iniciar migraciones')
+
+    def handle(self, *args, **options):
+        plan = rebalancer.plan(max_moves=options['max_moves'])
+        for node in sorted(plan['before']):
+            self.stdout.write(f"  {node}: {plan['before'][node]:.0%} -> {plan['after'][node]:.0%}")
+        for move in plan['moves']:
+            self.stdout.write(f"  {move['vmid']} ({move['name']}): {move['source']} -> {move['target']} "
+                              f"[{move['cpu']} núcleos, {move['mem'] / 2 ** 30:.1f} GiB]")
+        self.stdout.write(f"Pico de carga: {plan['peak_before']:.0%} -> {plan['peak_after']:.0%} "
+                          f"con {len(plan['moves'])} migraciones")
+
+        if options['dry_run'] or not plan['moves']:
+            return
+
+        results = rebalancer.execute(plan['moves'], deadline=options['deadline'])
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+            if result['status'] != 'ok':
+                self.stdout.write(f"  {result['vmid']}: {result['status']} {result.get('error', '')}")
+        self.stdout.write(self.style.SUCCESS(f"Migraciones: {summary}"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.storage_index import storage_index
+
+
+class Command(BaseCommand):
+    help = 'Escanea en paralelo el contenido de los almacenamientos cuyo uso cambió'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Reescanear todos los almacenamientos')
+
+    def handle(self, *args, **options):
+        stats = storage_index.refresh(force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['scanned']} de {stats['storages']} almacenamientos escaneados "
+            f"({stats['failed']} con error) en {stats['elapsed']}s"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submodulos.models import EstadisticaPeriodo
+from submodulos.rollups import compute_period_statistics, rollup_pending
+
+
+class Command(BaseCommand):
+    help = 'Calcula las estadísticas de los periodos, con sketches de percentiles combinables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--periodo', type=int, action='append', help='Recalcular este periodo (repetible)')
+        parser.add_argument('--nivel', choices=['nodo', 'cluster', 'datacenter', 'almacenamiento'],
+                            help='Solo periodos de este nivel de agregación')
+
+    def handle(self, *args, **options):
+        if options['periodo']:
+            periodos = EstadisticaPeriodo.objects.filter(periodo_id__in=options['periodo'])
+            if len(periodos) != len(set(options['periodo'])):
+                raise CommandError("Alguno de los periodos indicados no existe")
+            rows = sum(compute_period_statistics(periodo) for periodo in periodos)
+            self.stdout.write(self.style.SUCCESS(f"{len(periodos)} periodos recalculados ({rows} estadísticas)"))
+            return
+
+        count = rollup_pending(options['nivel'])
+        self.stdout.write(self.style.SUCCESS(f"{count} periodos cerrados pendientes calculados"))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.sharding import ShardedCollector
+
+
+class Command(BaseCommand):
+    help = 'Worker de recolección distribuido: se reparte los nodos con los demás workers a través de Redis'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--worker-id', default=None, help='Identificador del worker (por defecto host-pid)')
+        parser.add_argument('--status', action='store_true', help='Muestra los workers vivos y el reparto de nodos')
+
+    def handle(self, *args, **options):
+        collector = ShardedCollector(worker_id=options['worker_id'])
+        if options['status']:
+            status = collector.status()
+            self.stdout.write(f"Época {status['epoch']}, líder: {status['leader'] or '-'}")
+            for worker, count in sorted(status['workers'].items()):
+                self.stdout.write(f"  {worker}: {count} nodos")
+            return
+
+        self.stdout.write(f"Recolector {collector.worker_id} en marcha (Ctrl+C para detener)")
+        try:
+            collector.run()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.governor import governor
+from submodulos.scheduler import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Sondea el estado de los invitados con intervalos adaptados a su volatilidad'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Sincroniza los invitados, ejecuta una ronda y termina')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            added, removed = scheduler.sync()
+            polled = scheduler.run_due()
+            self.stdout.write(self.style.SUCCESS(
+                f"{added} invitados añadidos, {removed} retirados, {polled} sondeados"
+            ))
+            for node, stats in governor.stats().items():
+                self.stdout.write(f"  {node}: {stats}")
+            return
+
+        self.stdout.write("Planificador de sondeos en marcha (Ctrl+C para detener)")
+        try:
+            scheduler.run()
+        except KeyboardInterrupt:
+            pass
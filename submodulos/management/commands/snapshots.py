@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from submodulos.snapshots import bulk_snapshots, snapshot_inventory
+
+
+class Command(BaseCommand):
+    help = 'Inventario de instantáneas y operaciones en bloque (crear, eliminar, revertir, rotar)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['collect', 'create', 'delete', 'rollback', 'rotate'])
+        parser.add_argument('--name', help='Nombre de la instantánea (create, delete, rollback)')
+        parser.add_argument('--vmid', type=int, action='append', default=[],
+                            help='VM sobre la que operar (se puede repetir); por defecto todas')
+        parser.add_argument('--node', help='Limitar a las VMs de un nodo')
+        parser.add_argument('--prefix', default='auto-', help='Prefijo de las instantáneas rotadas')
+        parser.add_argument('--keep', type=int, default=7, help='Instantáneas rotadas que se conservan')
+        parser.add_argument('--vmstate', action='store_true', help='Incluir la RAM (solo QEMU)')
+        parser.add_argument('--deadline', type=float, default=None,
+                            help='Segundos máximos para iniciar operaciones')
+        parser.add_argument('--force', action='store_true', help='Recolectar de nuevo todo el inventario')
+
+    def handle(self, *args, **options):
+        action = options['action']
+        entries = snapshot_inventory.collect(force=options['force'] and action == 'collect')
+        if options['vmid']:
+            entries = {vmid: entry for vmid, entry in entries.items() if vmid in options['vmid']}
+        if options['node']:
+            entries = {vmid: entry for vmid, entry in entries.items() if entry['node'] == options['node']}
+
+        if action == 'collect':
+            total = sum(len(entry['snapshots']) for entry in entries.values())
+            self.stdout.write(self.style.SUCCESS(f"{total} instantáneas en {len(entries)} invitados"))
+            return
+
+        try:
+            if action == 'rotate':
+                results = bulk_snapshots.rotate(options['prefix'], options['keep'], entries=entries,
+                                                deadline=options['deadline'], vmstate=options['vmstate'])
+                results = results['create'] + results['delete']
+            else:
+                if not options['name']:
+                    raise CommandError("--name es obligatorio para create, delete y rollback")
+                targets = [{'node': entry['node'], 'vmid': vmid, 'vm_type': entry['vm_type'],
+                            'snapname': options['name'], 'vmstate': options['vmstate']}
+                           for vmid, entry in entries.items()
+                           if action == 'create' or any(s['name'] == options['name'] for s in entry['snapshots'])]
+                results = bulk_snapshots.run(action, targets, deadline=options['deadline'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+            if result['status'] != 'ok':
+                self.stdout.write(f"  {result['vmid']} {result['snapname']}: {result['status']} "
+                                  f"{result.get('error', '')}")
+        self.stdout.write(self.style.SUCCESS(f"{action}: {summary or 'sin objetivos'}"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from submodulos.config_store import config_store
+
+
+class Command(BaseCommand):
+    help = 'Revisa la configuración de todas las VMs y guarda solo las que cambiaron de digest'
+
+    def handle(self, *args, **options):
+        changed = config_store.sweep()
+        self.stdout.write(self.style.SUCCESS(f"{changed} configuraciones nuevas guardadas"))
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submodulos', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConfiguracionVM',
+            fields=[
+                ('configuracion_id', models.AutoField(primary_key=True, serialize=False)),
+                ('nodo', models.CharField(max_length=100)),
+                ('vmid', models.IntegerField()),
+                ('vm_type', models.CharField(choices=[('qemu', 'KVM'), ('lxc', 'Contenedor LXC')], default='qemu', max_length=10)),
+                ('digest', models.CharField(max_length=64)),
+                ('config', models.JSONField()),
+                ('fecha_registro', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Configuración de VM',
+                'verbose_name_plural': 'Configuraciones de VMs',
+                'db_table': 'age_configuracion_vm',
+                'indexes': [models.Index(fields=['vmid', '-fecha_registro'], name='age_configu_vmid_7b767f_idx')],
+            },
+        ),
+    ]
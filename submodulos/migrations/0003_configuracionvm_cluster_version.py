@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:50
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_cluster_version(apps, schema_editor):
+    """Asigna el cluster actual y numera las versiones existentes de cada VM"""
+    ConfiguracionVM = apps.get_model('submodulos', 'ConfiguracionVM')
+    cluster = getattr(settings, 'CONFIG_STORE', {}).get('cluster', settings.PROXMOX['host'])
+    pending = []
+    last_vmid, version = None, 0
+    for row in ConfiguracionVM.objects.order_by('vmid', 'fecha_registro', 'configuracion_id').iterator():
+        version = version + 1 if row.vmid == last_vmid else 1
+        last_vmid = row.vmid
+        row.cluster = cluster
+        row.version = version
+        pending.append(row)
+        if len(pending) >= 500:
+            ConfiguracionVM.objects.bulk_update(pending, ['cluster', 'version'])
+            pending = []
+    if pending:
+        ConfiguracionVM.objects.bulk_update(pending, ['cluster', 'version'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submodulos', '0002_configuracionvm'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='configuracionvm',
+            name='age_configu_vmid_7b767f_idx',
+        ),
+        migrations.AddField(
+            model_name='configuracionvm',
+            name='cluster',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='configuracionvm',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.RunPython(backfill_cluster_version, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='configuracionvm',
+            constraint=models.UniqueConstraint(fields=('cluster', 'vmid', 'version'), name='uniq_configuracion_vm_version'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submodulos', '0003_configuracionvm_cluster_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditoriarecursoscabecera',
+            name='fecha_registro',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AlterField(
+            model_name='configuracionvm',
+            name='fecha_registro',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='configuracionvm',
+            index=models.Index(fields=['vmid', '-version'], name='configuracion_vm_vmid_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submodulos', '0004_audit_config_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='estadisticaperiodo',
+            name='sketch_calculado',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='estadisticarecursos',
+            name='sketch',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+    ]
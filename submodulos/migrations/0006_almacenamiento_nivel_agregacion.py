@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-19 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('submodulos', '0005_estadistica_sketches'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='estadisticaperiodo',
+            name='nivel_agregacion',
+            field=models.CharField(choices=[('cluster', 'Cluster'), ('datacenter', 'Datacenter'), ('nodo', 'Nodo'), ('almacenamiento', 'Almacenamiento')], max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='estadisticarecursos',
+            name='tipo_entidad',
+            field=models.CharField(choices=[('cluster', 'Cluster'), ('datacenter', 'Datacenter'), ('nodo', 'Nodo'), ('almacenamiento', 'Almacenamiento')], max_length=20),
+        ),
+    ]
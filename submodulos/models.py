@@ -35,32 +35,6 @@ class SistemaOperativo(models.Model):
     def __str__(self):
         return f"{self.nombre} {self.version} ({self.arquitectura})"
 
-class Nodo(models.Model):
-    STATUS_CHOICES = [
-        ('activo', 'Activo'),
-        ('inactivo', 'Inactivo'),
-    ]
-
-    nodo_id = models.AutoField(primary_key=True)
-    cluster_id = models.IntegerField()  # Consider using ForeignKey if there's a Cluster model
-    nombre = models.CharField(max_length=100)
-    hostname = models.CharField(max_length=255)
-    ip_address = models.GenericIPAddressField()
-    ubicacion = models.CharField(max_length=255, null=True, blank=True)
-    tipo_hardware = models.CharField(max_length=100, null=True, blank=True)
-    estado = models.CharField(max_length=50, choices=STATUS_CHOICES, default='activo')
-    ultimo_mantenimiento = models.DateTimeField(null=True, blank=True)
-    fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
-
-    class Meta:
-        db_table = 'age_nodo'
-        verbose_name = 'Nodo'
-        verbose_name_plural = 'Nodos'
-
-    def __str__(self):
-        return self.nombre
-
 class RecursoFisico(models.Model):
     STATUS_CHOICES = [
         ('activo', 'Activo'),
@@ -68,7 +42,7 @@ class RecursoFisico(models.Model):
     ]
 
     recurso_id = models.AutoField(primary_key=True)
-    nodo = models.ForeignKey(Nodo, on_delete=models.CASCADE, related_name='recursos')
+    nodo = models.ForeignKey('Nodo', on_delete=models.CASCADE, related_name='recursos')
     tipo_recurso = models.ForeignKey(TipoRecurso, on_delete=models.PROTECT, related_name='recursos')
     nombre = models.CharField(max_length=100)
     capacidad_total = models.DecimalField(max_digits=12, decimal_places=2)
@@ -90,33 +64,9 @@ class RecursoFisico(models.Model):
     def __str__(self):
         return self.nombre
 
-class MaquinaVirtual(models.Model):
-    STATUS_CHOICES = [
-        ('activo', 'Activo'),
-        ('inactivo', 'Inactivo'),
-    ]
-
-    vm_id = models.AutoField(primary_key=True)
-    nodo = models.ForeignKey(Nodo, on_delete=models.CASCADE, related_name='maquinas_virtuales')
-    sistema_operativo = models.ForeignKey(SistemaOperativo, on_delete=models.PROTECT)
-    nombre = models.CharField(max_length=100)
-    hostname = models.CharField(max_length=255)
-    ip_address = models.GenericIPAddressField(null=True, blank=True)
-    estado = models.CharField(max_length=50, choices=STATUS_CHOICES, default='activo')
-    fecha_creacion = models.DateTimeField(auto_now_add=True)
-    fecha_actualizacion = models.DateTimeField(auto_now=True)
-
-    class Meta:
-        db_table = 'age_maquina_virtual'
-        verbose_name = 'Máquina Virtual'
-        verbose_name_plural = 'Máquinas Virtuales'
-
-    def __str__(self):
-        return self.nombre
-
 class AsignacionRecursosInicial(models.Model):
     asignacion_id = models.AutoField(primary_key=True)
-    maquina_virtual = models.ForeignKey(MaquinaVirtual, on_delete=models.CASCADE, related_name='asignaciones')
+    maquina_virtual = models.ForeignKey('MaquinaVirtual', on_delete=models.CASCADE, related_name='asignaciones')
     recurso = models.ForeignKey(RecursoFisico, on_delete=models.CASCADE, related_name='asignaciones')
     cantidad_asignada = models.DecimalField(max_digits=12, decimal_places=2)
     fecha_asignacion = models.DateTimeField(auto_now_add=True)
@@ -156,9 +106,9 @@ class AuditoriaRecursosCabecera(models.Model):
     ]
 
     auditoria_cabecera_id = models.AutoField(primary_key=True)
-    maquina_virtual = models.ForeignKey(MaquinaVirtual, on_delete=models.CASCADE, related_name='auditorias')
+    maquina_virtual = models.ForeignKey('MaquinaVirtual', on_delete=models.CASCADE, related_name='auditorias')
     periodo = models.ForeignKey(AuditoriaPeriodo, on_delete=models.CASCADE, related_name='auditorias')
-    fecha_registro = models.DateTimeField(auto_now_add=True)
+    fecha_registro = models.DateTimeField(auto_now_add=True, db_index=True)
     estado = models.CharField(max_length=50, choices=STATUS_CHOICES, default='activo')
     observaciones = models.TextField(null=True, blank=True)
 
@@ -197,6 +147,7 @@ class EstadisticaPeriodo(models.Model):
         ('cluster', 'Cluster'),
         ('datacenter', 'Datacenter'),
         ('nodo', 'Nodo'),
+        ('almacenamiento', 'Almacenamiento'),
     ]
 
     periodo_id = models.AutoField(primary_key=True)
@@ -204,6 +155,8 @@ class EstadisticaPeriodo(models.Model):
     fecha_fin = models.DateTimeField()
     nivel_agregacion = models.CharField(max_length=20, choices=NIVEL_CHOICES)
     fecha_calculo = models.DateTimeField(auto_now_add=True)
+    # Ya pasó por compute_period_statistics (aunque no tuviera muestras)
+    sketch_calculado = models.BooleanField(default=False)
 
     class Meta:
         db_table = 'age_estadistica_periodo'
@@ -214,10 +167,12 @@ class EstadisticaPeriodo(models.Model):
         return f"Período {self.periodo_id} - {self.nivel_agregacion}"
 
 class EstadisticaRecursos(models.Model):
+    # En 'almacenamiento' entidad_id es el recurso_id del RecursoFisico
     TIPO_ENTIDAD_CHOICES = [
         ('cluster', 'Cluster'),
         ('datacenter', 'Datacenter'),
         ('nodo', 'Nodo'),
+        ('almacenamiento', 'Almacenamiento'),
     ]
 
     estadistica_id = models.AutoField(primary_key=True)
@@ -251,6 +206,8 @@ class EstadisticaRecursos(models.Model):
     )
     total_asignado = models.DecimalField(max_digits=12, decimal_places=2)
     total_disponible = models.DecimalField(max_digits=12, decimal_places=2)
+    # DDSketch serializado de porcentaje_uso (ver submodulos.sketches); se combina entre periodos
+    sketch = models.BinaryField(null=True, blank=True, editable=False)
 
     class Meta:
         db_table = 'age_estadistica_recursos'
@@ -341,4 +298,36 @@ class MaquinaVirtual(models.Model):
         verbose_name_plural = 'Máquinas Virtuales'
 
     def __str__(self):
-        return f"{self.nombre} (ID: {self.vmid})"
\ No newline at end of file
+        return f"{self.nombre} (ID: {self.vmid})"
+
+# Historial de configuraciones de VMs (una versión por cada digest distinto)
+class ConfiguracionVM(models.Model):
+    VM_TYPE_CHOICES = [
+        ('qemu', 'KVM'),
+        ('lxc', 'Contenedor LXC')
+    ]
+
+    configuracion_id = models.AutoField(primary_key=True)
+    cluster = models.CharField(max_length=255, default='')  # Los vmid solo son únicos dentro de un cluster
+    nodo = models.CharField(max_length=100)  # Nodo de Proxmox al capturar la configuración
+    vmid = models.IntegerField()
+    version = models.PositiveIntegerField(default=1)  # Correlativo por cluster y vmid
+    vm_type = models.CharField(max_length=10, choices=VM_TYPE_CHOICES, default='qemu')
+    digest = models.CharField(max_length=64)
+    config = models.JSONField()
+    fecha_registro = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        db_table = 'age_configuracion_vm'
+        constraints = [
+            models.UniqueConstraint(fields=['cluster', 'vmid', 'version'], name='uniq_configuracion_vm_version'),
+        ]
+        # La restricción única empieza por cluster; la búsqueda del admin filtra solo por vmid
+        indexes = [
+            models.Index(fields=['vmid', '-version'], name='configuracion_vm_vmid_idx'),
+        ]
+        verbose_name = 'Configuración de VM'
+        verbose_name_plural = 'Configuraciones de VMs'
+
+    def __str__(self):
+        return f"Configuración {self.vmid} ({self.digest[:12]})"
@@ -3,6 +3,9 @@ from proxmoxer import ProxmoxAPI
 from django.conf import settings
 import logging
 
+from .governor import governor
+from .records import parse_guests
+
 logger = logging.getLogger(__name__)
 
 class ProxmoxService:
@@ -19,6 +22,7 @@ class ProxmoxService:
                 password=settings.PROXMOX['password'],
                 verify_ssl=settings.PROXMOX['verify_ssl']
             )
+            governor.govern(self.proxmox)
             logger.info("Conexión establecida con Proxmox")
         except Exception as e:
             logger.error(f"Error al conectar con Proxmox: {str(e)}")
@@ -40,7 +44,7 @@ class ProxmoxService:
             node (str, optional): Nombre del nodo. Si es None, se obtienen todas las VMs.
         
         Returns:
-            list: Lista de máquinas virtuales
+            list: Lista de GuestRecord
         """
         try:
             vms = []
@@ -49,18 +53,10 @@ class ProxmoxService:
             for node_name in nodes:
                 # Obtener máquinas virtuales (qemu)
                 node = self.proxmox.nodes(node_name)
-                qemu_vms = node.qemu.get()
-                for vm in qemu_vms:
-                    vm['node'] = node_name
-                    vm['type'] = 'qemu'
-                vms.extend(qemu_vms)
+                vms.extend(parse_guests(node.qemu.get(), node_name, 'qemu'))
                 
                 # Obtener contenedores (lxc)
-                lxc_cts = node.lxc.get()
-                for ct in lxc_cts:
-                    ct['node'] = node_name
-                    ct['type'] = 'lxc'
-                vms.extend(lxc_cts)
+                vms.extend(parse_guests(node.lxc.get(), node_name, 'lxc'))
                 
             return vms
         except Exception as e:
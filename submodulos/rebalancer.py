@@ -0,0 +1,389 @@
+# submodulos/rebalancer.py
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+import logging
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Avg
+from django.utils import timezone
+
+from .config_store import config_store
+from .models import AuditoriaRecursosDetalle
+from .proxmox_service import proxmox_service
+from .records import parse_guests, parse_nodes
+from .responses import bump_version
+
+logger = logging.getLogger(__name__)
+
+# Dispositivos que impiden la migración en caliente
+LOCAL_DEVICE = re.compile(r'^(hostpci|usb)\d+$')
+# Discos de una VM QEMU (valor 'almacenamiento:volumen,opciones' o ruta del host)
+DISK_KEY = re.compile(r'^(ide|sata|scsi|virtio|efidisk|tpmstate)\d+$')
+
+
+def _rebalancer_settings():
+    """Devuelve la configuración del reequilibrador con valores por defecto"""
+    defaults = {
+        'max_moves': 10,               # Migraciones como máximo por plan
+        'min_gain': 0.02,              # Reducción mínima del pico de carga por migración
+        'tolerance': 0.05,             # Se deja de mover si el pico supera la media en menos de esto
+        'cpu_limit': 0.85,             # Carga máxima de CPU de un nodo destino tras recibir un invitado
+        'mem_limit': 0.85,             # Ídem para la memoria
+        'pinned_tag': 'pinned',        # Los invitados con esta etiqueta no se mueven
+        'cpu_window': 900,             # Segundos de auditoría con los que se suaviza la CPU (0: instantánea)
+        'cpu_resource_type': 'CPU',    # TipoRecurso.nombre de las muestras de CPU de la auditoría
+        'with_local_disks': False,     # Permitir migrar invitados con discos locales
+        'config_workers': 8,           # Lecturas en paralelo de configuraciones que no están en caché
+        'per_node_migrations': 1,      # Migraciones simultáneas en las que participa cada nodo
+        'max_parallel': 4,             # Migraciones simultáneas en todo el cluster
+        'task_timeout': 3600,
+        'task_poll_interval': 5,
+    }
+    defaults.update(getattr(settings, 'REBALANCER', {}))
+    return defaults
+
+
+class NodeLoad:
+    """Uso de CPU (núcleos) y memoria (bytes) de un nodo durante la planificación"""
+
+    __slots__ = ('node', 'cpu', 'maxcpu', 'mem', 'maxmem')
+
+    def __init__(self, node, cpu, maxcpu, mem, maxmem):
+        self.node = node
+        self.cpu = cpu
+        self.maxcpu = maxcpu or 1
+        self.mem = mem
+        self.maxmem = maxmem or 1
+
+    def score(self, cpu=0.0, mem=0):
+        """Carga normalizada (la mayor de CPU y memoria) con `cpu`/`mem` añadidos"""
+        return max((self.cpu + cpu) / self.maxcpu, (self.mem + mem) / self.maxmem)
+
+
+def recent_guest_cpu(vmids, window, resource_type='CPU'):
+    """
+    Uso medio de CPU de las VMs en los últimos `window` segundos de auditoría
+
+    Returns:
+        dict: {vmid: fracción de sus vCPU en uso} de las VMs con muestras
+    """
+    since = timezone.now() - timedelta(seconds=window)
+    rows = (AuditoriaRecursosDetalle.objects
+            .filter(auditoria_cabecera__fecha_registro__gte=since,
+                    auditoria_cabecera__maquina_virtual__vmid__in=list(vmids),
+                    auditoria_cabecera__maquina_virtual__vm_type='qemu',
+                    recurso__tipo_recurso__nombre=resource_type)
+            .values_list('auditoria_cabecera__maquina_virtual__vmid')
+            .annotate(uso=Avg('porcentaje_uso')))
+    return {vmid: float(uso) / 100 for vmid, uso in rows}
+
+
+def smooth_cpu(nodes, guests, usage):
+    """
+    Sustituye la CPU instantánea de los invitados por su uso reciente
+
+    Una muestra de cluster/resources recoge picos pasajeros que el plan
+    convertiría en migraciones. El uso de cada nodo se corrige con la misma
+    diferencia que sus invitados, de modo que lo que no es de los invitados
+    (el propio host) sigue contando con su valor instantáneo.
+
+    Args:
+        usage (dict): {vmid: fracción de CPU} de `recent_guest_cpu`
+    """
+    delta = {}
+    for guest in guests:
+        if guest.vmid in usage:
+            delta[guest.node] = delta.get(guest.node, 0.0) + (usage[guest.vmid] - guest.cpu) * guest.cpus
+            guest.cpu = usage[guest.vmid]
+    for node in nodes:
+        if node.node in delta and node.maxcpu:
+            node.cpu = max(0.0, node.cpu * node.maxcpu + delta[node.node]) / node.maxcpu
+
+
+def plan_migrations(nodes, guests, config=None, blocked=()):
+    """
+    Calcula un plan de migraciones que reduce la carga del nodo más cargado
+
+    Heurística voraz: en cada paso se toma el nodo con mayor carga y se elige,
+    entre sus invitados movibles y todos los destinos posibles, la migración
+    que más reduce max(carga origen, carga destino) sin que el destino supere
+    `cpu_limit`/`mem_limit`. Se para al agotar `max_moves`, cuando el pico
+    queda a menos de `tolerance` de la media o cuando ninguna migración del
+    nodo más cargado mejora al menos `min_gain`. Cada paso cuesta como mucho
+    O(invitados del nodo × nodos) y los destinos se podan por su carga, así
+    que escala a miles de invitados.
+
+    Args:
+        nodes (list): NodeRecord de los nodos en línea
+        guests (list): GuestRecord de los invitados
+        blocked (iterable): vmids que no se pueden mover
+
+    Returns:
+        dict: {'moves', 'before', 'after', 'peak_before', 'peak_after'}
+    """
+    config = config or _rebalancer_settings()
+    loads = {n.node: NodeLoad(n.node, n.cpu * n.maxcpu, n.maxcpu, n.mem, n.maxmem)
+             for n in nodes if n.status == 'online'}
+    blocked = set(blocked)
+
+    movable = {}
+    for guest in guests:
+        if (guest.node in loads and guest.type == 'qemu' and guest.status == 'running'
+                and not guest.template and not guest.lock and guest.vmid not in blocked
+                and config['pinned_tag'] not in guest.tags.split(';')):
+            movable.setdefault(guest.node, []).append(guest)
+    # A igual ganancia gana el primero: el de menos memoria, cuya migración es más corta
+    for candidates in movable.values():
+        candidates.sort(key=lambda g: g.mem)
+
+    before = {node: round(load.score(), 4) for node, load in loads.items()}
+    moves = []
+    moved = set()
+    while len(moves) < config['max_moves'] and len(loads) > 1:
+        scores = {node: load.score() for node, load in loads.items()}
+        source = max(scores, key=scores.get)
+        peak = scores[source]
+        if peak - sum(scores.values()) / len(scores) <= config['tolerance']:
+            break
+
+        # Destinos de menor a mayor carga: en cuanto la carga actual de un destino
+        # alcanza el mejor resultado encontrado, los siguientes no pueden mejorarlo
+        targets = sorted((score, node) for node, score in scores.items() if node != source)
+        src = loads[source]
+        best = None
+        best_value = peak - config['min_gain']
+        for guest in movable.get(source, ()):
+            if guest.vmid in moved:
+                continue
+            cores = guest.cpu * guest.cpus
+            remaining = src.score(-cores, -guest.mem)
+            if remaining >= best_value:
+                continue
+            for score, target in targets:
+                if score >= best_value:
+                    break
+                dst = loads[target]
+                if ((dst.cpu + cores) / dst.maxcpu > config['cpu_limit']
+                        or (dst.mem + guest.mem) / dst.maxmem > config['mem_limit']):
+                    continue
+                value = max(remaining, dst.score(cores, guest.mem))
+                if value < best_value:
+                    best_value = value
+                    best = (peak - value, guest, target)
+        if best is None:
+            break
+
+        gain, guest, target = best
+        cores = guest.cpu * guest.cpus
+        src.cpu -= cores
+        src.mem -= guest.mem
+        loads[target].cpu += cores
+        loads[target].mem += guest.mem
+        moved.add(guest.vmid)
+        moves.append({
+            'vmid': guest.vmid,
+            'name': guest.name,
+            'source': source,
+            'target': target,
+            'cpu': round(cores, 2),
+            'mem': guest.mem,
+            'gain': round(gain, 4),
+        })
+
+    after = {node: round(load.score(), 4) for node, load in loads.items()}
+    return {
+        'moves': moves,
+        'before': before,
+        'after': after,
+        'peak_before': max(before.values(), default=0.0),
+        'peak_after': max(after.values(), default=0.0),
+    }
+
+
+class Rebalancer:
+    """
+    Planifica y ejecuta migraciones en caliente para equilibrar la carga de los nodos
+
+    El plan se calcula con una sola llamada a cluster/resources y la CPU de las
+    VMs se suaviza con su media en los últimos `cpu_window` segundos de
+    auditoría (las que no tienen muestras usan el valor instantáneo). La ejecución
+    lanza las migraciones en paralelo respetando `per_node_migrations` (cuenta
+    tanto el origen como el destino) y `max_parallel`, y sigue cada una por su
+    UPID hasta que termina. Una migración hacia un nodo espera a que terminen
+    las migraciones anteriores del plan que salen de ese nodo, ya que el plan
+    cuenta con el espacio que liberan.
+    """
+
+    def __init__(self, proxmox=None, config=None):
+        self._proxmox = proxmox
+        self.config = config or _rebalancer_settings()
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    @staticmethod
+    def _has_local_disk(config, shared_storages):
+        for name, value in config.items():
+            if not DISK_KEY.match(name) or not isinstance(value, str):
+                continue
+            volume = value.split(',', 1)[0]
+            if volume == 'none':
+                continue
+            storage, sep, _ = volume.partition(':')
+            # Una ruta del host o un almacenamiento no compartido no existen en el destino
+            if not sep or storage not in shared_storages:
+                return True
+        return False
+
+    def _blocked(self, guests, shared_storages):
+        """
+        Invitados candidatos que no se pueden migrar en caliente
+
+        Las configuraciones se leen de la caché y las que faltan se piden a Proxmox;
+        un invitado cuya configuración no se puede obtener se trata como no movible.
+        Se bloquean los que tienen dispositivos del host y, salvo `with_local_disks`,
+        los que tienen algún disco fuera de un almacenamiento compartido.
+        """
+        candidates = {g.vmid: g for g in guests if g.type == 'qemu' and g.status == 'running' and not g.template}
+        configs = {vmid: entry['config'] for vmid, entry in config_store.cached_configs(candidates).items()}
+
+        def fetch(guest):
+            try:
+                return guest.vmid, config_store.get_config(guest.node, guest.vmid, 'qemu')
+            except Exception as e:
+                logger.warning(f"Reequilibrio: sin configuración de la VM {guest.vmid}, no se moverá: {str(e)}")
+                return guest.vmid, None
+
+        missing = [guest for vmid, guest in candidates.items() if vmid not in configs]
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.config['config_workers']) as executor:
+                configs.update(executor.map(fetch, missing))
+
+        blocked = set()
+        for vmid in candidates:
+            config = configs.get(vmid)
+            if (config is None or any(LOCAL_DEVICE.match(name) for name in config)
+                    or (not self.config['with_local_disks'] and self._has_local_disk(config, shared_storages))):
+                blocked.add(vmid)
+        return blocked
+
+    def plan(self, resources=None, max_moves=None):
+        """Plan de migraciones para el estado actual del cluster"""
+        if resources is None:
+            resources = proxmox_service.get_cluster_resources()
+        nodes = parse_nodes(r for r in resources if r.get('type') == 'node')
+        guests = parse_guests(resources)
+        if self.config['cpu_window']:
+            running = [g.vmid for g in guests if g.type == 'qemu' and g.status == 'running']
+            usage = recent_guest_cpu(running, self.config['cpu_window'], self.config['cpu_resource_type'])
+            smooth_cpu(nodes, guests, usage)
+        shared_storages = {r['storage'] for r in resources if r.get('type') == 'storage' and r.get('shared')}
+        config = self.config if max_moves is None else dict(self.config, max_moves=max_moves)
+        return plan_migrations(nodes, guests, config, blocked=self._blocked(guests, shared_storages))
+
+    def _wait_task(self, node, upid, deadline):
+        """Espera a que termine una tarea y devuelve su exitstatus"""
+        while True:
+            status = self.proxmox.nodes(node).tasks(upid).status.get()
+            if status.get('status') == 'stopped':
+                return status.get('exitstatus', '')
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.config['task_poll_interval'])
+
+    def _migrate(self, move, deadline):
+        started = time.monotonic()
+        result = dict(move, upid=None)
+        try:
+            params = {'target': move['target'], 'online': 1}
+            if self.config['with_local_disks']:
+                params['with-local-disks'] = 1
+            result['upid'] = self.proxmox.nodes(move['source']).qemu(move['vmid']).migrate.post(**params)
+            exitstatus = self._wait_task(move['source'], result['upid'],
+                                         min(deadline, started + self.config['task_timeout']))
+            result['status'] = 'timeout' if exitstatus is None else ('ok' if exitstatus == 'OK' else 'error')
+            if exitstatus not in (None, 'OK'):
+                result['error'] = exitstatus
+        except Exception as e:
+            result.update(status='error', error=str(e))
+        result['elapsed'] = round(time.monotonic() - started, 1)
+        return result
+
+    def execute(self, moves, deadline=None):
+        """
+        Ejecuta las migraciones de un plan
+
+        Args:
+            moves (list): Migraciones de `plan()['moves']`
+            deadline (float, optional): Segundos máximos para iniciar migraciones
+
+        Returns:
+            list: Resultados en el orden del plan con 'status' ('ok', 'error',
+                'timeout' o 'skipped'), 'upid', 'error'? y 'elapsed'
+        """
+        limit = time.monotonic() + (deadline if deadline is not None else 24 * 3600)
+        # Migraciones anteriores que liberan espacio en el destino de cada una
+        depends = [[j for j in range(i) if moves[j]['source'] == move['target']]
+                   for i, move in enumerate(moves)]
+        results = [None] * len(moves)
+        pending = list(range(len(moves)))
+        active = {}
+        running = 0
+        condition = threading.Condition()
+
+        def run(i):
+            nonlocal running
+            result = self._migrate(moves[i], limit)
+            with condition:
+                results[i] = result
+                running -= 1
+                for node in (moves[i]['source'], moves[i]['target']):
+                    active[node] -= 1
+                condition.notify_all()
+
+        def ready(i):
+            move = moves[i]
+            return (all(results[j] is not None for j in depends[i])
+                    and active.get(move['source'], 0) < self.config['per_node_migrations']
+                    and active.get(move['target'], 0) < self.config['per_node_migrations'])
+
+        with ThreadPoolExecutor(max_workers=max(1, self.config['max_parallel'])) as executor:
+            with condition:
+                while pending and time.monotonic() < limit:
+                    # Si una migración previa falló, el destino no tiene el espacio previsto
+                    for i in list(pending):
+                        failed = [j for j in depends[i] if results[j] is not None and results[j]['status'] != 'ok']
+                        if failed:
+                            results[i] = dict(moves[i], upid=None, status='skipped',
+                                              error=f"depende de la migración de {moves[failed[0]]['vmid']}")
+                            pending.remove(i)
+
+                    candidate = next((i for i in pending if ready(i)), None) \
+                        if running < self.config['max_parallel'] else None
+                    if candidate is None:
+                        condition.wait(1.0)
+                        continue
+                    pending.remove(candidate)
+                    running += 1
+                    for node in (moves[candidate]['source'], moves[candidate]['target']):
+                        active[node] = active.get(node, 0) + 1
+                    executor.submit(run, candidate)
+
+        results = [result or dict(move, upid=None, status='skipped')
+                   for move, result in zip(moves, results)]
+        if any(result['status'] == 'ok' for result in results):
+            bump_version('inventory')
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        logger.info(f"Reequilibrio: {summary}")
+        return results
+
+
+# Instancia singleton para usar en toda la aplicación
+rebalancer = Rebalancer()
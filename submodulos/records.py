@@ -0,0 +1,186 @@
+# submodulos/records.py
+from dataclasses import dataclass, fields
+from operator import attrgetter
+import sys
+from typing import Optional
+
+# Valores con pocas variantes que se repiten en miles de registros
+_intern = sys.intern
+
+
+def _istr(value):
+    return _intern(value) if isinstance(value, str) else value
+
+
+class _Record:
+    """
+    Acceso tipo diccionario para los registros
+
+    Las plantillas de Django resuelven `vm.name` probando primero `vm['name']`;
+    con `__getitem__` esa primera búsqueda ya acierta sin lanzar excepción, y el
+    código que trataba los registros como diccionarios sigue funcionando. Los
+    campos de Proxmox sin atributo propio (pid, qmpstatus, swap...) se guardan
+    en `extra` y se leen y serializan igual que los demás.
+    """
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            if self.extra and key in self.extra:
+                return self.extra[key]
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in self._fields or bool(self.extra and key in self.extra)
+
+    def to_dict(self):
+        data = dict(zip(self._fields, self._values(self)))
+        extra = data.pop('extra')
+        if extra:
+            data.update(extra)
+        return data
+
+    def __reduce__(self):
+        # Más rápido que el __getstate__ que genera dataclass para las clases con slots
+        return self.__class__, self._values(self)
+
+
+def _extra(data, known):
+    """Campos de la respuesta de Proxmox que no tienen atributo propio (None si no hay)"""
+    extra = {key: value for key, value in data.items() if key not in known}
+    return extra or None
+
+
+@dataclass(slots=True)
+class GuestRecord(_Record):
+    """
+    VM o contenedor tal como lo devuelve Proxmox, con campos fijos
+
+    Se construye una sola vez a partir del JSON de `nodes/{nodo}/qemu|lxc` o de
+    `cluster/resources`. Nodo, tipo, estado y bloqueo se internan, así que en un
+    inventario grande cada valor distinto existe una sola vez en memoria (y
+    pickle lo guarda una sola vez al cachear la lista). `to_dict` devuelve los
+    campos fijos más los de `extra` al mismo nivel, con la misma forma que la
+    respuesta original de Proxmox. Las respuestas JSON y msgpack de la API no
+    usan registros: convertir cada uno a diccionario cuesta más que serializar
+    directamente el diccionario de Proxmox.
+    """
+
+    vmid: int
+    name: str
+    node: str
+    type: str
+    status: str
+    cpu: float = 0.0
+    cpus: float = 0.0
+    mem: int = 0
+    maxmem: int = 0
+    disk: int = 0
+    maxdisk: int = 0
+    uptime: int = 0
+    netin: int = 0
+    netout: int = 0
+    diskread: int = 0
+    diskwrite: int = 0
+    template: bool = False
+    tags: str = ''
+    lock: Optional[str] = None
+    extra: Optional[dict] = None
+
+    @classmethod
+    def from_api(cls, data, node=None, vm_type=None):
+        """
+        Args:
+            data (dict): Elemento devuelto por Proxmox
+            node, vm_type (str, optional): Nodo y tipo cuando la respuesta no los incluye
+                (los listados por nodo no traen `node` ni `type`)
+        """
+        get = data.get
+        return cls(
+            int(get('vmid')),
+            get('name') or '',
+            _intern(node or get('node') or ''),
+            _intern(vm_type or get('type') or 'qemu'),
+            _intern(get('status') or 'unknown'),
+            float(get('cpu') or 0.0),
+            float(get('cpus') or get('maxcpu') or 0.0),
+            int(get('mem') or 0),
+            int(get('maxmem') or 0),
+            int(get('disk') or 0),
+            int(get('maxdisk') or 0),
+            int(get('uptime') or 0),
+            int(get('netin') or 0),
+            int(get('netout') or 0),
+            int(get('diskread') or 0),
+            int(get('diskwrite') or 0),
+            bool(int(get('template') or 0)),
+            _istr(get('tags') or ''),
+            _istr(get('lock')),
+            _extra(data, GUEST_KEYS),
+        )
+
+
+@dataclass(slots=True)
+class NodeRecord(_Record):
+    """Nodo del cluster (`nodes` o `cluster/resources?type=node`)"""
+
+    node: str
+    status: str
+    cpu: float = 0.0
+    maxcpu: int = 0
+    mem: int = 0
+    maxmem: int = 0
+    disk: int = 0
+    maxdisk: int = 0
+    uptime: int = 0
+    memory: Optional[dict] = None   # Detalle de status (total/used/free) cuando se ha pedido
+    extra: Optional[dict] = None
+
+    @classmethod
+    def from_api(cls, data):
+        get = data.get
+        return cls(
+            _intern(get('node') or ''),
+            _intern(get('status') or 'unknown'),
+            float(get('cpu') or 0.0),
+            int(get('maxcpu') or 0),
+            int(get('mem') or 0),
+            int(get('maxmem') or 0),
+            int(get('disk') or 0),
+            int(get('maxdisk') or 0),
+            int(get('uptime') or 0),
+            None,
+            _extra(data, NODE_KEYS),
+        )
+
+
+for _cls in (GuestRecord, NodeRecord):
+    _cls._fields = tuple(f.name for f in fields(_cls))
+    _cls._values = attrgetter(*_cls._fields)
+
+# Claves de Proxmox que se copian a un campo fijo; el resto va a `extra`
+GUEST_KEYS = frozenset(GuestRecord._fields) - {'extra'}
+NODE_KEYS = frozenset(NodeRecord._fields) - {'extra', 'memory'}
+
+
+def parse_guests(items, node=None, vm_type=None):
+    """
+    Convierte una respuesta de Proxmox en registros de invitado
+
+    Los elementos de `cluster/resources` que no son VMs ni contenedores se ignoran.
+    """
+    return [GuestRecord.from_api(item, node, vm_type) for item in items
+            if item.get('vmid') is not None and (vm_type or item.get('type', 'qemu') in ('qemu', 'lxc'))]
+
+
+def parse_nodes(items):
+    return [NodeRecord.from_api(item) for item in items]
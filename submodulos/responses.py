@@ -0,0 +1,160 @@
+# submodulos/responses.py
+from decimal import Decimal
+import gzip
+import hashlib
+import logging
+
+import msgpack
+import orjson
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+
+logger = logging.getLogger(__name__)
+
+VERSION_PREFIX = 'sentinelnexus:version:'
+# Entradas (etag, cuerpo, cuerpo comprimido)
+PAYLOAD_PREFIX = 'sentinelnexus:body:'
+
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# Por debajo de este tamaño no compensa comprimir
+GZIP_MIN_SIZE = 1024
+
+
+def get_version(name):
+    """Devuelve la versión actual de un conjunto de datos (se crea en 1)"""
+    key = VERSION_PREFIX + name
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(name):
+    """
+    Marca un conjunto de datos como modificado
+
+    Las respuestas cacheadas con la versión anterior dejan de usarse y
+    caducan solas por su TTL.
+    """
+    key = VERSION_PREFIX + name
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+        return 2
+
+
+def _default(obj):
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+def negotiate_format(request):
+    """Elige 'msgpack' o 'json' según la cabecera Accept"""
+    accept = request.headers.get('Accept', '')
+    if any(media_type in accept for media_type in MSGPACK_TYPES):
+        return 'msgpack'
+    return 'json'
+
+
+def accepts_gzip(request):
+    """Indica si Accept-Encoding admite gzip con q > 0 (de forma explícita o con '*')"""
+    qualities = {}
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        qualities[coding.strip().lower()] = q
+    return qualities.get('gzip', qualities.get('x-gzip', qualities.get('*', 0.0))) > 0
+
+
+def _etag_matches(request, etag):
+    header = request.headers.get('If-None-Match')
+    if not header:
+        return False
+    tags = {tag.strip().removeprefix('W/') for tag in header.split(',')}
+    return '*' in tags or etag in tags
+
+
+def encode(data, fmt='json'):
+    """Serializa `data` en bytes con orjson o msgpack"""
+    if fmt == 'msgpack':
+        return msgpack.packb(data, use_bin_type=True, default=_default)
+    # Los registros de inventario (dataclasses) no se serializan: llegan a la API
+    # como diccionarios de Proxmox, que orjson codifica más rápido
+    return orjson.dumps(data, default=_default,
+                        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+
+def payload_response(data, request, status=200):
+    """Respuesta sin caché con la misma negociación de formato que las cacheadas"""
+    fmt = negotiate_format(request)
+    response = HttpResponse(encode(data, fmt), status=status,
+                            content_type='application/msgpack' if fmt == 'msgpack' else 'application/json')
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def cached_payload_response(request, name, builder, variant='', version=None, timeout=60):
+    """
+    Sirve una respuesta de API desde bytes ya serializados y comprimidos
+
+    La clave incluye el nombre del conjunto de datos, la variante (p. ej. un
+    filtro), su versión y el formato negociado. En un acierto la respuesta se
+    construye directamente con los bytes guardados, sin volver a serializar.
+    El ETag es un hash del cuerpo guardado con la entrada, y If-None-Match
+    solo se compara con una entrada vigente: al caducar se reconstruye y el
+    cliente recibe 304 únicamente si el cuerpo no cambió.
+
+    Args:
+        request (HttpRequest): Petición actual (Accept / Accept-Encoding / If-None-Match)
+        name (str): Nombre del conjunto de datos, usado también por `bump_version`
+        builder (callable): Función que devuelve los datos si no hay caché
+        variant (str, optional): Parte adicional de la clave
+        version (optional): Versión explícita; por defecto `get_version(name)`
+        timeout (int): Segundos de validez de los bytes en caché
+
+    Returns:
+        HttpResponse: Respuesta con el cuerpo serializado
+    """
+    fmt = negotiate_format(request)
+    if version is None:
+        version = get_version(name)
+    key = f'{PAYLOAD_PREFIX}{name}:{variant}:{version}:{fmt}'
+
+    entry = cache.get(key)
+    if entry is None:
+        body = encode(builder(), fmt)
+        etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}-{fmt}"'
+        compressed = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+        entry = (etag, body, compressed)
+        cache.set(key, entry, timeout)
+
+    etag, body, compressed = entry
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified(headers={'ETag': etag})
+        patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+        return response
+
+    use_gzip = compressed is not None and accepts_gzip(request)
+    response = HttpResponse(
+        compressed if use_gzip else body,
+        content_type='application/msgpack' if fmt == 'msgpack' else 'application/json',
+    )
+    if use_gzip:
+        response['Content-Encoding'] = 'gzip'
+    response['ETag'] = etag
+    patch_vary_headers(response, ('Accept', 'Accept-Encoding'))
+    return response
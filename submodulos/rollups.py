@@ -0,0 +1,200 @@
+# submodulos/rollups.py
+from decimal import Decimal
+import logging
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .db_routers import use_primary
+from .models import (AsignacionRecursosInicial, AuditoriaRecursosDetalle, EstadisticaPeriodo,
+                     EstadisticaRecursos, RecursoFisico)
+from .sketches import DDSketch, merge_sketches
+
+logger = logging.getLogger(__name__)
+
+# Campo de RecursoFisico que identifica la entidad de cada nivel de agregación
+ENTITY_FIELDS = {
+    'nodo': 'nodo_id',
+    'cluster': 'nodo__cluster_id',
+    'datacenter': 'nodo__proxmox_server_id',
+    'almacenamiento': 'recurso_id',
+}
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def _rollup_settings():
+    """Devuelve la configuración de los rollups estadísticos con valores por defecto"""
+    defaults = {
+        'alpha': 0.01,       # Error relativo máximo de los percentiles
+        'max_bins': 2048,
+        'chunk_size': 20000,
+    }
+    defaults.update(getattr(settings, 'ROLLUPS', {}))
+    return defaults
+
+
+def _entities(nivel):
+    """{recurso_id: (entidad_id, tipo_recurso_id)} y capacidades por (entidad, tipo)"""
+    field = ENTITY_FIELDS[nivel]
+    entities = {}
+    capacity = {}
+    for recurso_id, entidad_id, tipo_recurso_id, total, disponible in RecursoFisico.objects.values_list(
+            'recurso_id', field, 'tipo_recurso_id', 'capacidad_total', 'capacidad_disponible'):
+        # Los nodos sin cluster se agrupan en la entidad 0
+        key = (entidad_id or 0, tipo_recurso_id)
+        entities[recurso_id] = key
+        current = capacity.setdefault(key, [Decimal(0), Decimal(0)])
+        current[0] += total
+        current[1] += disponible
+    return entities, capacity
+
+
+def load_samples(periodo, entities, chunk_size):
+    """
+    Carga el porcentaje de uso de las auditorías del periodo agrupado por entidad
+
+    Returns:
+        tuple: (claves, grupo, valores) donde `grupo` es el índice en `claves` de cada muestra
+    """
+    rows = (
+        AuditoriaRecursosDetalle.objects
+        .filter(auditoria_cabecera__fecha_registro__gte=periodo.fecha_inicio,
+                auditoria_cabecera__fecha_registro__lt=periodo.fecha_fin)
+        .values_list('recurso_id', 'porcentaje_uso')
+        .iterator(chunk_size=chunk_size)
+    )
+    keys = {}
+    grupo, valores = [], []
+    for recurso_id, porcentaje in rows:
+        key = entities.get(recurso_id)
+        if key is None:
+            continue
+        grupo.append(keys.setdefault(key, len(keys)))
+        valores.append(porcentaje)
+    return list(keys), np.asarray(grupo, dtype=np.int64), np.asarray(valores, dtype=np.float64)
+
+
+def compute_period_statistics(periodo):
+    """
+    Calcula las estadísticas de un periodo con un sketch de percentiles por entidad
+
+    Sustituye las filas de EstadisticaRecursos del periodo. Además de promedio,
+    máximo y mínimo, cada fila guarda un DDSketch serializado del porcentaje de
+    uso, de modo que los percentiles de varios periodos o entidades se obtienen
+    combinando sketches (ver `percentiles`) sin volver a leer las auditorías.
+
+    Returns:
+        int: Filas de estadísticas creadas
+    """
+    config = _rollup_settings()
+    started = time.monotonic()
+    entities, capacity = _entities(periodo.nivel_agregacion)
+    # Las últimas auditorías del periodo pueden no haber llegado aún a la réplica
+    with use_primary():
+        keys, grupo, valores = load_samples(periodo, entities, config['chunk_size'])
+
+    asignado = {}
+    for recurso_id, cantidad in (AsignacionRecursosInicial.objects.values('recurso_id')
+                                 .annotate(total=Sum('cantidad_asignada')).values_list('recurso_id', 'total')):
+        if recurso_id in entities:
+            asignado[entities[recurso_id]] = asignado.get(entities[recurso_id], Decimal(0)) + cantidad
+
+    rows = []
+    if keys:
+        # Las muestras de cada entidad quedan contiguas tras ordenar por grupo
+        order = np.argsort(grupo, kind='stable')
+        bounds = np.flatnonzero(np.diff(grupo[order])) + 1
+        for chunk in np.split(order, bounds):
+            (entidad_id, tipo_recurso_id), values = keys[grupo[chunk[0]]], valores[chunk]
+            sketch = DDSketch(alpha=config['alpha'], max_bins=config['max_bins'])
+            sketch.add_many(values)
+            total, disponible = capacity[(entidad_id, tipo_recurso_id)]
+            rows.append(EstadisticaRecursos(
+                periodo=periodo,
+                tipo_recurso_id=tipo_recurso_id,
+                entidad_id=entidad_id,
+                tipo_entidad=periodo.nivel_agregacion,
+                uso_promedio=round(Decimal(sketch.mean), 2),
+                uso_maximo=round(Decimal(sketch.max), 2),
+                uso_minimo=round(Decimal(sketch.min), 2),
+                total_asignado=asignado.get((entidad_id, tipo_recurso_id), Decimal(0)),
+                total_disponible=disponible,
+                sketch=sketch.to_bytes(),
+            ))
+
+    with transaction.atomic():
+        EstadisticaRecursos.objects.filter(periodo=periodo).delete()
+        EstadisticaRecursos.objects.bulk_create(rows, batch_size=1000)
+        EstadisticaPeriodo.objects.filter(pk=periodo.pk).update(sketch_calculado=True)
+    periodo.sketch_calculado = True
+
+    logger.info(f"Periodo {periodo.periodo_id}: {len(rows)} estadísticas a partir de {len(valores)} muestras "
+                f"en {time.monotonic() - started:.2f}s")
+    return len(rows)
+
+
+def percentiles(tipo_recurso_id, tipo_entidad, entidad_ids=None, desde=None, hasta=None,
+                quantiles=DEFAULT_QUANTILES):
+    """
+    Percentiles de uso combinando los sketches de los periodos
+
+    Solo se usan periodos contenidos por completo en el rango; los periodos de
+    un mismo nivel no deben solaparse o sus muestras se contarían dos veces.
+
+    Args:
+        tipo_recurso_id (int): Tipo de recurso
+        tipo_entidad (str): 'nodo', 'cluster' o 'datacenter'
+        entidad_ids (list, optional): Entidades a combinar; por defecto todas las del nivel
+        desde, hasta (datetime, optional): Rango de fechas
+
+    Returns:
+        dict: Percentiles, muestras, promedio, mínimo, máximo y periodos combinados
+    """
+    filters = {'tipo_recurso_id': tipo_recurso_id, 'tipo_entidad': tipo_entidad, 'sketch__isnull': False}
+    if entidad_ids is not None:
+        filters['entidad_id__in'] = entidad_ids
+    if desde is not None:
+        filters['periodo__fecha_inicio__gte'] = desde
+    if hasta is not None:
+        filters['periodo__fecha_fin__lte'] = hasta
+
+    rows = list(EstadisticaRecursos.objects.filter(**filters).values_list('periodo_id', 'sketch'))
+    sketch = merge_sketches((blob for _, blob in rows), alpha=_rollup_settings()['alpha'])
+    return {
+        'percentiles': {f'p{q * 100:g}': (round(v, 2) if v is not None else None)
+                        for q, v in sketch.quantiles(quantiles).items()},
+        'muestras': sketch.count,
+        'promedio': round(sketch.mean, 2) if sketch.count else None,
+        'minimo': sketch.min if sketch.count else None,
+        'maximo': sketch.max if sketch.count else None,
+        'periodos': len({periodo_id for periodo_id, _ in rows}),
+        'sketches': len(rows),
+    }
+
+
+def rollup_pending(nivel=None):
+    """
+    Calcula las estadísticas de los periodos cerrados que aún no se han calculado
+
+    Un periodo en curso se deja para cuando termine (sus muestras aún no están
+    completas) y uno ya calculado no se repite aunque no tuviera muestras; para
+    recalcular un periodo se usa `compute_period_statistics` directamente.
+
+    Returns:
+        int: Periodos calculados
+    """
+    periodos = EstadisticaPeriodo.objects.filter(sketch_calculado=False, fecha_fin__lte=timezone.now())
+    if nivel:
+        periodos = periodos.filter(nivel_agregacion=nivel)
+    count = 0
+    # Leer de la réplica podría devolver periodos que otro proceso acaba de marcar como calculados
+    with use_primary():
+        for periodo in periodos.order_by('fecha_inicio'):
+            compute_period_statistics(periodo)
+            count += 1
+    return count
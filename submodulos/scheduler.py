@@ -0,0 +1,258 @@
+# submodulos/scheduler.py
+from concurrent.futures import ThreadPoolExecutor
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django_redis import get_redis_connection
+
+from .proxmox_service import proxmox_service
+
+logger = logging.getLogger(__name__)
+
+STATUS_PREFIX = 'sentinelnexus:status:'
+
+
+def _scheduler_settings():
+    """Devuelve la configuración del planificador de sondeos con valores por defecto"""
+    defaults = {
+        'key_prefix': 'sentinelnexus:poll',
+        'min_interval': 10,        # Segundos entre sondeos de un invitado muy variable
+        'max_interval': 120,       # Segundos entre sondeos de un invitado estable
+        'stopped_interval': 600,   # Segundos entre sondeos de un invitado detenido
+        'watched_interval': 5,     # Segundos entre sondeos mientras alguien lo está viendo
+        'watch_ttl': 60,           # Segundos que dura la marca de "observado"
+        'volatility_scale': 0.2,   # Volatilidad a partir de la cual se usa min_interval
+        'smoothing': 0.3,          # Peso de la última observación en la media móvil
+        'batch_size': 200,         # Invitados sondeados como máximo por ronda
+        'workers': 16,
+        'resync_interval': 300,    # Segundos entre sincronizaciones con cluster/resources
+    }
+    defaults.update(getattr(settings, 'POLL_SCHEDULER', {}))
+    return defaults
+
+
+def change_score(previous, current):
+    """
+    Medida del cambio entre dos observaciones de status/current (0 = idéntico)
+
+    Un cambio de estado cuenta como 1; si no, se suman la variación absoluta de
+    CPU (fracción de 0 a 1) y la de memoria relativa a la memoria máxima.
+    """
+    if previous is None:
+        return 0.0
+    if previous.get('status') != current.get('status'):
+        return 1.0
+    cpu = abs(float(current.get('cpu') or 0) - float(previous.get('cpu') or 0))
+    maxmem = float(current.get('maxmem') or 0)
+    mem = abs(float(current.get('mem') or 0) - float(previous.get('mem') or 0)) / maxmem if maxmem else 0.0
+    return min(1.0, cpu + mem)
+
+
+class PollScheduler:
+    """
+    Planificador central de sondeos de status/current por invitado
+
+    Cada invitado tiene su próxima fecha de sondeo en un conjunto ordenado de
+    Redis. El intervalo se calcula con una media móvil de su volatilidad
+    (`change_score`), su estado (los detenidos se sondean poco) y si alguien lo
+    está viendo (vista de detalle o `api_vm_status`), que lo adelanta a
+    `watched_interval`. El último estado se guarda en caché para que las vistas
+    lo sirvan sin llamar a Proxmox mientras siga vigente. Los sondeos van por el
+    carril de segundo plano del limitador de llamadas.
+    """
+
+    def __init__(self, proxmox=None, redis=None, config=None):
+        self._proxmox = proxmox
+        self._redis = redis
+        self.config = config or _scheduler_settings()
+        self.prefix = self.config['key_prefix']
+        self.last_resync = 0.0
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = get_redis_connection('default')
+        return self._redis
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    @staticmethod
+    def _member(node, vmid):
+        return f'{node}/{vmid}'
+
+    # Intervalos
+
+    def is_watched(self, vmid):
+        return self.redis.exists(self._key('watch', vmid)) == 1
+
+    def compute_interval(self, state, watched=False):
+        """Segundos hasta el próximo sondeo de un invitado"""
+        if watched:
+            return self.config['watched_interval']
+        if state.get('status') != 'running':
+            return self.config['stopped_interval']
+        ratio = min(1.0, state.get('volatility', 0.0) / self.config['volatility_scale'])
+        span = self.config['max_interval'] - self.config['min_interval']
+        return self.config['max_interval'] - span * ratio
+
+    # Registro de invitados
+
+    def sync(self, resources=None):
+        """
+        Alinea los invitados planificados con cluster/resources
+
+        Los nuevos se sondean en la siguiente ronda; los que ya no existen se retiran.
+
+        Returns:
+            tuple: (invitados añadidos, invitados retirados)
+        """
+        if resources is None:
+            resources = proxmox_service.get_cluster_resources('vm')
+        current = {self._member(r['node'], r['vmid']): r for r in resources if r.get('vmid') is not None}
+        known = {m.decode() if isinstance(m, bytes) else m for m in self.redis.zrange(self._key('due'), 0, -1)}
+
+        added = current.keys() - known
+        removed = known - current.keys()
+        pipe = self.redis.pipeline(transaction=False)
+        if added:
+            now = time.time()
+            pipe.zadd(self._key('due'), {member: now for member in added})
+            pipe.hset(self._key('state'), mapping={
+                member: json.dumps({'vm_type': current[member].get('type', 'qemu'),
+                                    'status': current[member].get('status'), 'volatility': 0.0})
+                for member in added
+            })
+        if removed:
+            pipe.zrem(self._key('due'), *removed)
+            pipe.hdel(self._key('state'), *removed)
+        pipe.execute()
+        self.last_resync = time.time()
+        return len(added), len(removed)
+
+    def watch(self, node, vmid):
+        """Marca un invitado como observado y adelanta su próximo sondeo"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.set(self._key('watch', vmid), node, ex=self.config['watch_ttl'])
+        # LT: solo se adelanta, nunca se retrasa; XX: solo si el invitado ya está planificado
+        pipe.zadd(self._key('due'), {self._member(node, vmid): time.time() + self.config['watched_interval']},
+                  xx=True, lt=True)
+        pipe.execute()
+
+    # Observaciones
+
+    def get_status(self, node, vmid):
+        """Último status/current del invitado si sigue vigente, o None"""
+        entry = cache.get(f'{STATUS_PREFIX}{vmid}')
+        if entry and entry['node'] == node and time.time() < entry['expires']:
+            return entry['data']
+        return None
+
+    def observe(self, node, vmid, vm_type, status):
+        """
+        Registra un status/current (de un sondeo o de una vista) y replanifica el invitado
+
+        Returns:
+            float: Segundos hasta el próximo sondeo
+        """
+        member = self._member(node, vmid)
+        raw = self.redis.hget(self._key('state'), member)
+        state = json.loads(raw) if raw else {'volatility': 0.0}
+        previous = state.get('last')
+        sample = {k: status.get(k) for k in ('status', 'cpu', 'mem', 'maxmem')}
+
+        alpha = self.config['smoothing']
+        state['volatility'] = (1 - alpha) * state.get('volatility', 0.0) + alpha * change_score(previous, sample)
+        state.update({'vm_type': vm_type, 'status': status.get('status'), 'last': sample})
+        interval = self.compute_interval(state, watched=self.is_watched(vmid))
+        state['interval'] = interval
+
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self._key('state'), member, json.dumps(state))
+        pipe.zadd(self._key('due'), {member: now + interval})
+        pipe.execute()
+        cache.set(f'{STATUS_PREFIX}{vmid}', {
+            'node': node,
+            'data': dict(status, type=vm_type),
+            'expires': now + interval,
+        }, int(interval) + 60)
+        return interval
+
+    def invalidate(self, node, vmid):
+        """
+        Descarta el estado en caché de un invitado y adelanta su próximo sondeo
+
+        Se llama cuando se sabe que el estado ha cambiado (acción desde la vista o
+        tarea de arranque/parada en el cluster) para no servir el anterior hasta
+        que caduque.
+        """
+        cache.delete(f'{STATUS_PREFIX}{vmid}')
+        self.redis.zadd(self._key('due'), {self._member(node, vmid): time.time()}, xx=True, lt=True)
+
+    # Sondeos
+
+    def _poll(self, member, state):
+        node, vmid = member.rsplit('/', 1)
+        vm_type = state.get('vm_type', 'qemu')
+        guest = self.proxmox.nodes(node)
+        guest = guest.qemu(vmid) if vm_type == 'qemu' else guest.lxc(vmid)
+        status = guest.status.current.get()
+        return self.observe(node, int(vmid), vm_type, status)
+
+    def run_due(self):
+        """
+        Sondea los invitados cuya fecha ha vencido
+
+        Returns:
+            int: Invitados sondeados
+        """
+        now = time.time()
+        due = [m.decode() if isinstance(m, bytes) else m
+               for m in self.redis.zrangebyscore(self._key('due'), '-inf', now, start=0,
+                                                 num=self.config['batch_size'])]
+        if not due:
+            return 0
+        states = dict(zip(due, self.redis.hmget(self._key('state'), due)))
+
+        # Se retrasan antes de sondear para que otra ronda no los repita si esta se alarga
+        self.redis.zadd(self._key('due'), {member: now + self.config['max_interval'] for member in due})
+
+        def poll(member):
+            try:
+                self._poll(member, json.loads(states[member] or '{}'))
+                return True
+            except Exception as e:
+                logger.error(f"Error al sondear {member}: {str(e)}")
+                return False
+
+        with ThreadPoolExecutor(max_workers=self.config['workers']) as executor:
+            polled = sum(executor.map(poll, due))
+        return polled
+
+    def run(self, stop=None):
+        """
+        Bucle del planificador
+
+        Args:
+            stop (callable, optional): Función que devuelve True para detener el bucle
+        """
+        while not (stop and stop()):
+            if time.time() - self.last_resync > self.config['resync_interval']:
+                self.sync()
+            if self.run_due():
+                continue
+            upcoming = self.redis.zrange(self._key('due'), 0, 0, withscores=True)
+            wait = upcoming[0][1] - time.time() if upcoming else 1.0
+            time.sleep(min(max(wait, 0.1), 1.0))
+
+
+# Instancia singleton para usar en toda la aplicación
+scheduler = PollScheduler()
@@ -0,0 +1,374 @@
+# submodulos/search.py
+from collections import Counter
+import heapq
+import logging
+import math
+from operator import itemgetter
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from .config_store import config_store
+from .models import MaquinaVirtual
+from .proxmox_service import proxmox_service
+from .responses import get_version
+
+logger = logging.getLogger(__name__)
+
+TOKEN_SPLIT = re.compile(r'[\s,;/]+')
+
+# Campos indexados y su peso en la puntuación
+FIELD_WEIGHTS = {
+    'vmid': 3.0,
+    'name': 2.0,
+    'tags': 1.5,
+    'ips': 1.5,
+    'node': 1.0,
+    'description': 0.5,
+}
+
+
+def _search_settings():
+    """Devuelve la configuración de la búsqueda con valores por defecto"""
+    defaults = {
+        'min_similarity': 0.4,    # Fracción mínima de trigramas de la consulta presentes
+        'refresh_interval': 300,  # Segundos máximos sin sincronizar aunque no haya cambios
+        'check_interval': 5,      # Segundos entre comprobaciones del hilo de sincronización
+    }
+    defaults.update(getattr(settings, 'SEARCH', {}))
+    return defaults
+
+
+def normalize(text):
+    return str(text or '').lower().strip()
+
+
+def tokenize(text):
+    return [t for t in TOKEN_SPLIT.split(normalize(text)) if t]
+
+
+def token_grams(token):
+    """Trigramas de un token con relleno inicial, de modo que los prefijos coinciden"""
+    padded = f'  {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def query_grams(token):
+    """Trigramas de un término de búsqueda (sin relleno final para buscar por prefijo)"""
+    padded = f'  {token}'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _IndexState:
+    """Documentos y listas invertidas; `sync` puede construir uno nuevo y publicarlo de una vez"""
+
+    __slots__ = ('docs', 'postings', 'exact')
+
+    def __init__(self):
+        self.docs = {}  # clave -> (huella, documento, {campo: (trigramas, valores)})
+        self.postings = {field: {} for field in FIELD_WEIGHTS}  # campo -> trigrama -> set(claves)
+        self.exact = {field: {} for field in FIELD_WEIGHTS}     # campo -> valor -> set(claves)
+
+    def add(self, key, fingerprint, doc, fields):
+        for field, (grams, values) in fields.items():
+            postings = self.postings[field]
+            for gram in grams:
+                postings.setdefault(gram, set()).add(key)
+            exact = self.exact[field]
+            for value in values:
+                exact.setdefault(value, set()).add(key)
+        self.docs[key] = (fingerprint, doc, fields)
+
+    def discard(self, key):
+        current = self.docs.pop(key, None)
+        if current is None:
+            return
+        for field, (grams, values) in current[2].items():
+            for index, entries in ((self.postings[field], grams), (self.exact[field], values)):
+                for entry in entries:
+                    keys = index.get(entry)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del index[entry]
+
+
+class SearchIndex:
+    """
+    Índice de búsqueda aproximada en memoria sobre el inventario de invitados
+
+    Cada campo de un documento se descompone en trigramas que se guardan en
+    listas invertidas por campo (trigrama -> claves), junto con un índice de
+    valores exactos. `sync` compara una huella de cada documento y solo
+    reindexa los que cambiaron; el análisis de los documentos se hace fuera
+    del lock, y si cambia más de la mitad del índice se construye uno nuevo y
+    se sustituye de una vez, así que las búsquedas no esperan a una
+    reconstrucción. La búsqueda cuenta los trigramas comunes recorriendo
+    únicamente las listas de los trigramas de la consulta.
+    """
+
+    def __init__(self, min_similarity=None):
+        if min_similarity is None:
+            min_similarity = _search_settings()['min_similarity']
+        self.min_similarity = min_similarity
+        self._state = _IndexState()
+        self._lock = threading.RLock()
+        self.last_sync = 0.0
+        self.version = None
+
+    def __len__(self):
+        return len(self._state.docs)
+
+    @staticmethod
+    def _values(value):
+        return value if isinstance(value, (list, tuple)) else [value]
+
+    def _fingerprint(self, doc):
+        return tuple(tuple(self._values(doc.get(field))) for field in FIELD_WEIGHTS)
+
+    def _analyze(self, doc):
+        fields = {}
+        for field in FIELD_WEIGHTS:
+            values = {normalize(v) for v in self._values(doc.get(field))} - {''}
+            grams = set()
+            for value in values:
+                for token in tokenize(value):
+                    grams |= token_grams(token)
+            fields[field] = (grams, values)
+        return fields
+
+    def upsert(self, key, doc):
+        """
+        Inserta o actualiza un documento
+
+        Returns:
+            bool: True si el documento cambió y se reindexó
+        """
+        fingerprint = self._fingerprint(doc)
+        with self._lock:
+            current = self._state.docs.get(key)
+            if current is not None and current[0] == fingerprint:
+                # Solo cambian campos no indexados (estado, tipo...): se actualiza el documento
+                self._state.docs[key] = (fingerprint, doc, current[2])
+                return False
+        fields = self._analyze(doc)
+        with self._lock:
+            self._state.discard(key)
+            self._state.add(key, fingerprint, doc, fields)
+        return True
+
+    def remove(self, key):
+        with self._lock:
+            self._state.discard(key)
+
+    def sync(self, docs):
+        """
+        Sincroniza el índice con el inventario completo
+
+        Args:
+            docs (dict): {clave: documento}
+
+        Returns:
+            tuple: (documentos reindexados, documentos eliminados)
+        """
+        with self._lock:
+            current = dict(self._state.docs)
+
+        # Análisis fuera del lock: es la parte costosa
+        entries, changed = {}, 0
+        for key, doc in docs.items():
+            fingerprint = self._fingerprint(doc)
+            known = current.get(key)
+            if known is not None and known[0] == fingerprint:
+                entries[key] = (fingerprint, doc, known[2], False)
+            else:
+                entries[key] = (fingerprint, doc, self._analyze(doc), True)
+                changed += 1
+        removed = [key for key in current if key not in docs]
+
+        if changed + len(removed) > len(current) // 2:
+            # Reconstrucción completa sobre un estado nuevo que se publica con una sola asignación
+            state = _IndexState()
+            for key, (fingerprint, doc, fields, _) in entries.items():
+                state.add(key, fingerprint, doc, fields)
+            with self._lock:
+                self._state = state
+                self.last_sync = time.time()
+            return changed, len(removed)
+
+        with self._lock:
+            state = self._state
+            for key, (fingerprint, doc, fields, reindex) in entries.items():
+                if reindex:
+                    state.discard(key)
+                    state.add(key, fingerprint, doc, fields)
+                else:
+                    state.docs[key] = (fingerprint, doc, fields)
+            for key in removed:
+                state.discard(key)
+            self.last_sync = time.time()
+        return changed, len(removed)
+
+    def search(self, query, limit=20):
+        """
+        Busca documentos por nombre, vmid, etiquetas, IPs, nodo o descripción
+
+        Returns:
+            list: [(puntuación, documento)] ordenada de mayor a menor puntuación
+        """
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            state = self._state
+            scores = None
+            for term in terms:
+                term_scores = self._search_term(state, term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    # Todos los términos deben coincidir (AND)
+                    scores = {k: scores[k] + v for k, v in term_scores.items() if k in scores}
+                if not scores:
+                    return []
+            best = heapq.nlargest(limit, scores.items(), key=itemgetter(1))
+            return [(round(score, 3), state.docs[key][1]) for key, score in best]
+
+    def _search_term(self, state, term):
+        grams = query_grams(term)
+        needed = math.ceil(self.min_similarity * len(grams))
+        scores = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            postings = state.postings[field]
+            counts = Counter()
+            for gram in grams:
+                counts.update(postings.get(gram, ()))
+            factor = weight / len(grams)
+            for key, shared in counts.items():
+                if shared >= needed:
+                    score = shared * factor
+                    if score > scores.get(key, 0.0):
+                        scores[key] = score
+            # Coincidencia exacta del valor del campo
+            for key in state.exact[field].get(term, ()):
+                scores[key] = max(scores.get(key, 0.0), 2 * weight)
+        return scores
+
+
+def build_documents():
+    """
+    Construye los documentos de búsqueda de todas las VMs del cluster
+
+    Combina cluster/resources (una sola llamada), las IPs guardadas en
+    MaquinaVirtual y la descripción de las configuraciones en caché.
+    """
+    resources = [r for r in proxmox_service.get_cluster_resources('vm') if r.get('vmid') is not None]
+
+    ips = {}
+    for vmid, ip in MaquinaVirtual.objects.filter(ip_address__isnull=False).values_list('vmid', 'ip_address'):
+        ips.setdefault(vmid, []).append(ip)
+
+    configs = config_store.cached_configs(r['vmid'] for r in resources)
+
+    docs = {}
+    for resource in resources:
+        vmid = int(resource['vmid'])
+        entry = configs.get(vmid)
+        docs[vmid] = {
+            'vmid': vmid,
+            'name': resource.get('name', ''),
+            'node': resource.get('node', ''),
+            'type': resource.get('type', ''),
+            'status': resource.get('status', ''),
+            'tags': [t for t in (resource.get('tags') or '').split(';') if t],
+            'ips': ips.get(vmid, []),
+            'description': entry['config'].get('description', '') if entry else '',
+        }
+    return docs
+
+
+_refresh_lock = threading.Lock()
+
+
+def _is_fresh(version):
+    return (version == search_index.version
+            and time.time() - search_index.last_sync < _search_settings()['refresh_interval'])
+
+
+def refresh_search_index(force=False):
+    """
+    Sincroniza el índice si el inventario cambió o han pasado más de `refresh_interval` segundos
+
+    El detector de cambios y el feed de tareas incrementan la versión del
+    inventario, de modo que en reposo el índice no vuelve a consultar Proxmox.
+    Solo un hilo sincroniza a la vez; mientras tanto los demás buscan sobre el
+    índice vigente (o esperan si aún está vacío). Las vistas no la llaman: la
+    ejecuta el hilo de `start_background_refresh`.
+    """
+    version = get_version('inventory')
+    if not force and _is_fresh(version):
+        return None
+    if not _refresh_lock.acquire(blocking=not len(search_index)):
+        return None
+    try:
+        if not force and _is_fresh(version):
+            # Otro hilo sincronizó mientras se esperaba el lock
+            return None
+        started = time.monotonic()
+        updated, removed = search_index.sync(build_documents())
+        search_index.version = version
+    finally:
+        _refresh_lock.release()
+    logger.info(f"Índice de búsqueda: {updated} actualizados, {removed} eliminados "
+                f"en {time.monotonic() - started:.2f}s")
+    return updated, removed
+
+
+_refresher = None
+_refresher_lock = threading.Lock()
+_refresher_stop = threading.Event()
+
+
+def _refresh_loop(interval):
+    while True:
+        try:
+            refresh_search_index()
+        except Exception as e:
+            # Con el inventario no disponible se sigue sirviendo el índice tal como esté
+            logger.error(f"Error al actualizar el índice de búsqueda: {str(e)}")
+        if _refresher_stop.wait(interval):
+            return
+
+
+def start_background_refresh():
+    """
+    Arranca, una vez por proceso, el hilo que mantiene el índice sincronizado
+
+    Cada `check_interval` segundos el hilo compara la versión del inventario y
+    sincroniza si cambió, así que las búsquedas nunca esperan a Proxmox: leen
+    el índice vigente, que está vacío solo hasta la primera sincronización.
+    """
+    global _refresher
+    if _refresher is not None and _refresher.is_alive():
+        return _refresher
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher_stop.clear()
+            _refresher = threading.Thread(target=_refresh_loop, args=(_search_settings()['check_interval'],),
+                                          name='search-index-refresh', daemon=True)
+            _refresher.start()
+    return _refresher
+
+
+def stop_background_refresh(timeout=None):
+    """Detiene el hilo de sincronización si está en marcha"""
+    _refresher_stop.set()
+    if _refresher is not None:
+        _refresher.join(timeout)
+
+
+# Instancia singleton para usar en toda la aplicación
+search_index = SearchIndex()
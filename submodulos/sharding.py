@@ -0,0 +1,283 @@
+# submodulos/sharding.py
+from bisect import bisect
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .db_routers import use_primary
+from .models import AuditoriaPeriodo, MaquinaVirtual, Nodo
+from .ssh_executor import cache_node_metrics, collect_guest_audit, collect_node_metrics
+
+logger = logging.getLogger(__name__)
+
+# Renueva el lease solo si sigue siendo del mismo propietario
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+def _collector_settings():
+    """Devuelve la configuración de los recolectores distribuidos con valores por defecto"""
+    defaults = {
+        'key_prefix': 'sentinelnexus:collectors',
+        'interval': 300,          # Segundos entre recolecciones de cada nodo
+        'heartbeat': 5,           # Segundos entre latidos de cada worker
+        'lease_ttl': 20,          # Un worker sin latido durante este tiempo se da por muerto
+        'virtual_nodes': 128,     # Réplicas de cada worker en el anillo de hash
+        'guest_audit': True,      # Recolectar también la auditoría de los invitados de cada nodo
+    }
+    defaults.update(getattr(settings, 'COLLECTORS', {}))
+    return defaults
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+def node_key(nodo):
+    """Clave de un nodo, única entre todos los servidores Proxmox"""
+    return f"{nodo.proxmox_server_id or 0}/{nodo.nombre}"
+
+
+class HashRing:
+    """
+    Anillo de hash consistente
+
+    Cada worker ocupa `virtual_nodes` posiciones, así que al entrar o salir un
+    worker solo cambian de dueño alrededor de 1/N de los nodos.
+    """
+
+    def __init__(self, members, virtual_nodes=128):
+        self.members = sorted(members)
+        points = sorted((_hash(f'{member}#{i}'), member)
+                        for member in self.members for i in range(virtual_nodes))
+        self._hashes = [h for h, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key):
+        if not self._owners:
+            return None
+        return self._owners[bisect(self._hashes, _hash(key)) % len(self._owners)]
+
+    def assign(self, keys):
+        """{worker: [claves]} para todos los workers del anillo"""
+        assignment = {member: [] for member in self.members}
+        for key in keys:
+            owner = self.owner(key)
+            if owner is not None:
+                assignment[owner].append(key)
+        return assignment
+
+
+def default_collect(nodos, config):
+    """Recolecta las métricas SSH de los nodos asignados y la auditoría de sus invitados"""
+    metrics = collect_node_metrics({node_key(nodo): nodo.ip_address for nodo in nodos})
+    cache_node_metrics(metrics, config['interval'] * 2)
+    if not config['guest_audit']:
+        return
+
+    now = timezone.now()
+    # Un periodo recién abierto puede no estar aún en la réplica
+    with use_primary():
+        periodo = (AuditoriaPeriodo.objects
+                   .filter(estado='activo', fecha_inicio__lte=now, fecha_fin__gte=now)
+                   .order_by('-fecha_inicio')
+                   .first())
+    if periodo is None:
+        logger.warning("Recolector: no hay un periodo de auditoría activo, se omite la auditoría de invitados")
+        return
+    collect_guest_audit(periodo, vms=MaquinaVirtual.objects.filter(
+        nodo__in=nodos, is_monitored=True, ip_address__isnull=False))
+
+
+class ShardedCollector:
+    """
+    Worker de recolección que se coordina con los demás a través de Redis
+
+    Cada worker publica un latido en un conjunto ordenado. Uno de ellos obtiene
+    el lease de líder (`SET NX PX`), retira a los workers sin latido y publica
+    el anillo con los miembros vivos y una época. Cada worker toma del anillo
+    los nodos que le corresponden por hash consistente, así que añadir workers
+    reparte la carga y la caída de uno solo mueve sus nodos.
+
+    Además, antes de recolectar un nodo el worker lo reclama para el intervalo
+    actual (`SET NX` sobre nodo + número de intervalo). Durante un reequilibrio
+    dos workers pueden creerse dueños del mismo nodo, pero solo uno gana la
+    reclamación: cada nodo se recolecta una sola vez por intervalo, y si su
+    dueño muere a mitad de intervalo el nuevo dueño lo recolecta en ese mismo.
+    """
+
+    def __init__(self, worker_id=None, collect=None, redis=None, config=None):
+        self.config = config or _collector_settings()
+        self.worker_id = worker_id or f'{socket.gethostname()}-{os.getpid()}'
+        self.collect = collect or default_collect
+        self._redis = redis
+        self.prefix = self.config['key_prefix']
+        self.last_slot = None
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._running = None
+        self._scripts = None
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = get_redis_connection('default')
+        return self._redis
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def _script(self, name):
+        if self._scripts is None:
+            self._scripts = {'renew': self.redis.register_script(RENEW_SCRIPT),
+                             'release': self.redis.register_script(RELEASE_SCRIPT)}
+        return self._scripts[name]
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    # Pertenencia y liderazgo
+
+    def heartbeat(self):
+        self.redis.zadd(self._key('members'), {self.worker_id: time.time()})
+
+    def is_leader(self):
+        return self._decode(self.redis.get(self._key('leader'))) == self.worker_id
+
+    def elect(self):
+        """Renueva el lease de líder o intenta obtenerlo; devuelve True si este worker es líder"""
+        ttl = int(self.config['lease_ttl'] * 1000)
+        if self._script('renew')(keys=[self._key('leader')], args=[self.worker_id, ttl]):
+            return True
+        if self.redis.set(self._key('leader'), self.worker_id, nx=True, px=ttl):
+            logger.info(f"Recolector {self.worker_id}: elegido líder")
+            return True
+        return False
+
+    def publish_ring(self):
+        """
+        (Solo el líder) Retira los workers sin latido y publica el anillo si cambió
+
+        Returns:
+            dict: Anillo vigente {'epoch', 'members'}
+        """
+        now = time.time()
+        self.redis.zremrangebyscore(self._key('members'), '-inf', now - self.config['lease_ttl'])
+        members = sorted(self._decode(m) for m in self.redis.zrange(self._key('members'), 0, -1))
+        ring = self.ring()
+        if ring['members'] != members:
+            ring = {'epoch': ring['epoch'] + 1, 'members': members}
+            self.redis.set(self._key('ring'), json.dumps(ring))
+            logger.info(f"Recolectores: época {ring['epoch']} con {len(members)} workers")
+        return ring
+
+    def ring(self):
+        raw = self.redis.get(self._key('ring'))
+        return json.loads(raw) if raw else {'epoch': 0, 'members': []}
+
+    def leave(self):
+        """Abandona el grupo; el líder reparte sus nodos en su siguiente latido"""
+        self.redis.zrem(self._key('members'), self.worker_id)
+        self._script('release')(keys=[self._key('leader')], args=[self.worker_id])
+
+    # Asignación y recolección
+
+    def nodes(self):
+        return {node_key(nodo): nodo for nodo in Nodo.objects.filter(estado='activo')}
+
+    def assigned(self, ring, nodes):
+        if self.worker_id not in ring['members']:
+            return []
+        hash_ring = HashRing(ring['members'], self.config['virtual_nodes'])
+        return [key for key in nodes if hash_ring.owner(key) == self.worker_id]
+
+    def claim(self, keys, slot):
+        """Reclama los nodos para el intervalo `slot`; devuelve los que ganó este worker"""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.set(self._key('claim', slot, key), self.worker_id, nx=True, ex=self.config['interval'] * 2)
+        return [key for key, won in zip(keys, pipe.execute()) if won]
+
+    def _collect(self, nodos, slot):
+        started = time.monotonic()
+        try:
+            self.collect(nodos, self.config)
+            logger.info(f"Recolector {self.worker_id}: {len(nodos)} nodos en el intervalo {slot} "
+                        f"({time.monotonic() - started:.1f}s)")
+        except Exception as e:
+            logger.error(f"Recolector {self.worker_id}: error en el intervalo {slot}: {str(e)}")
+
+    def tick(self):
+        """
+        Latido, liderazgo y recolección de los nodos propios pendientes del intervalo
+
+        La recolección se hace en segundo plano para no retrasar los latidos.
+
+        Returns:
+            list: Claves de los nodos cuya recolección se lanzó
+        """
+        self.heartbeat()
+        ring = self.publish_ring() if self.elect() else self.ring()
+
+        slot = int(time.time() // self.config['interval'])
+        if self._running is not None and not self._running.done():
+            if slot != self.last_slot:
+                logger.warning(f"Recolector {self.worker_id}: la recolección anterior sigue en curso")
+            return []
+
+        nodes = self.nodes()
+        # Se reclama en cada latido: tras un reequilibrio pueden llegar nodos sin recolectar
+        claimed = self.claim(self.assigned(ring, nodes), slot)
+        self.last_slot = slot
+        if claimed:
+            self._running = self._executor.submit(self._collect, [nodes[key] for key in claimed], slot)
+        return claimed
+
+    def status(self):
+        """Workers vivos, líder, época y reparto de nodos"""
+        ring = self.ring()
+        hash_ring = HashRing(ring['members'], self.config['virtual_nodes'])
+        assignment = hash_ring.assign(list(self.nodes()))
+        return {
+            'epoch': ring['epoch'],
+            'leader': self._decode(self.redis.get(self._key('leader'))),
+            'workers': {member: len(keys) for member, keys in assignment.items()},
+        }
+
+    def run(self, stop=None):
+        """
+        Bucle del worker
+
+        Args:
+            stop (callable, optional): Función que devuelve True para detener el bucle
+        """
+        try:
+            while not (stop and stop()):
+                started = time.monotonic()
+                try:
+                    self.tick()
+                except Exception as e:
+                    logger.error(f"Recolector {self.worker_id}: {str(e)}")
+                time.sleep(max(0.0, self.config['heartbeat'] - (time.monotonic() - started)))
+        finally:
+            self.leave()
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,151 @@
+# submodulos/sketches.py
+import math
+import struct
+import zlib
+
+import numpy as np
+
+# Versión del formato binario
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BdQQdddI')
+
+
+class DDSketch:
+    """
+    Sketch de cuantiles con error relativo acotado (DDSketch)
+
+    Cada valor positivo se cuenta en el bin `ceil(log(v) / log(gamma))`, con
+    gamma = (1 + alpha) / (1 - alpha), de modo que cualquier cuantil se estima
+    con un error relativo menor que `alpha`. Dos sketches con el mismo `alpha`
+    se combinan sumando sus bins, así que los percentiles de un nodo, un cluster
+    o un rango de fechas salen de combinar los sketches de los periodos.
+
+    Los valores cero (o negativos) se cuentan aparte. Si se superan `max_bins`
+    se agrupan los bins más bajos, que son los menos relevantes para p95/p99.
+    """
+
+    def __init__(self, alpha=0.01, max_bins=2048):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def __len__(self):
+        return self.count
+
+    def add(self, value, count=1):
+        self.add_many(np.asarray([value], dtype=float), count)
+
+    def add_many(self, values, count=1):
+        """Añade un array de valores (vectorizado con numpy)"""
+        values = np.asarray(values, dtype=float)
+        if not values.size:
+            return
+        self.count += values.size * count
+        self.sum += float(values.sum()) * count
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+        positive = values[values > 0]
+        self.zero_count += (values.size - positive.size) * count
+        if positive.size:
+            indexes, counts = np.unique(np.ceil(np.log(positive) / self._log_gamma).astype(np.int64),
+                                        return_counts=True)
+            for index, n in zip(indexes.tolist(), counts.tolist()):
+                self.bins[index] = self.bins.get(index, 0) + n * count
+            self._collapse()
+
+    def merge(self, other):
+        """Combina otro sketch en este (deben tener el mismo alpha)"""
+        if not math.isclose(other.alpha, self.alpha):
+            raise ValueError(f"No se pueden combinar sketches con alpha {self.alpha} y {other.alpha}")
+        for index, n in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + n
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._collapse()
+        return self
+
+    def _collapse(self):
+        if len(self.bins) <= self.max_bins:
+            return
+        indexes = sorted(self.bins)
+        excess = indexes[:len(indexes) - self.max_bins + 1]
+        target = excess[-1]
+        self.bins[target] = sum(self.bins.pop(index) for index in excess[:-1]) + self.bins[target]
+
+    def quantile(self, q):
+        """
+        Estima el cuantil `q` (0 a 1)
+
+        Returns:
+            float | None: Valor estimado o None si el sketch está vacío
+        """
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Punto medio del bin en escala logarítmica: error relativo <= alpha
+                value = 2 * self.gamma ** index / (self.gamma + 1)
+                return min(max(value, self.min), self.max)
+        return self.max
+
+    def quantiles(self, qs):
+        return {q: self.quantile(q) for q in qs}
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    # Serialización
+
+    def to_bytes(self):
+        """Formato binario compacto: cabecera fija + bins (índices en delta) comprimidos"""
+        indexes = np.array(sorted(self.bins), dtype=np.int64)
+        counts = np.array([self.bins[i] for i in indexes.tolist()], dtype=np.uint64)
+        deltas = np.diff(indexes, prepend=0).astype(np.int32) if indexes.size else indexes.astype(np.int32)
+        header = HEADER.pack(FORMAT_VERSION, self.alpha, self.zero_count, self.count, self.sum,
+                             self.min if self.count else 0.0, self.max if self.count else 0.0, indexes.size)
+        return header + zlib.compress(deltas.tobytes() + counts.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data, max_bins=2048):
+        data = bytes(data)
+        version, alpha, zero_count, count, total, minimum, maximum, size = HEADER.unpack_from(data)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Versión de sketch no soportada: {version}")
+        sketch = cls(alpha=alpha, max_bins=max_bins)
+        payload = zlib.decompress(data[HEADER.size:])
+        deltas = np.frombuffer(payload[:size * 4], dtype=np.int32)
+        counts = np.frombuffer(payload[size * 4:], dtype=np.uint64)
+        sketch.bins = dict(zip(np.cumsum(deltas, dtype=np.int64).tolist(), counts.tolist()))
+        sketch.zero_count = zero_count
+        sketch.count = count
+        sketch.sum = total
+        if count:
+            sketch.min, sketch.max = minimum, maximum
+        return sketch
+
+
+def merge_sketches(blobs, alpha=0.01):
+    """Combina sketches serializados; los vacíos o nulos se ignoran"""
+    merged = None
+    for blob in blobs:
+        if blob:
+            sketch = DDSketch.from_bytes(blob)
+            merged = sketch if merged is None else merged.merge(sketch)
+    return merged if merged is not None else DDSketch(alpha=alpha)
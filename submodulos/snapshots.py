@@ -0,0 +1,303 @@
+# submodulos/snapshots.py
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .config_store import config_store
+from .proxmox_service import proxmox_service
+from .responses import bump_version
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'sentinelnexus:snapshots:'
+SNAPSHOT_NAME = re.compile(r'^[A-Za-z][A-Za-z0-9_-]{1,39}$')
+
+OPERATIONS = ('create', 'delete', 'rollback')
+
+
+def _snapshot_settings():
+    """Devuelve la configuración de las instantáneas con valores por defecto"""
+    defaults = {
+        'workers': 32,               # Hilos para recolectar el inventario
+        'cache_timeout': 24 * 3600,  # Validez del inventario sin actividad de instantáneas
+        'per_node_concurrency': 4,   # Tareas de instantánea simultáneas por nodo
+        'max_workers': 128,
+        'task_timeout': 900,         # Segundos máximos de espera por cada tarea
+        'task_poll_interval': 2,
+    }
+    defaults.update(getattr(settings, 'SNAPSHOTS', {}))
+    return defaults
+
+
+def validate_name(name):
+    if not SNAPSHOT_NAME.match(name or ''):
+        raise ValueError(f"Nombre de instantánea no válido: {name!r}")
+    return name
+
+
+class SnapshotInventory:
+    """
+    Inventario de instantáneas de todas las VMs y contenedores
+
+    La lista de cada invitado se guarda en caché y solo se vuelve a pedir cuando
+    falta, cuando el detector de cambios ve una tarea de instantánea sobre él
+    (`invalidate`) o cuando se ejecuta una operación en bloque. La recolección
+    inicial se hace en paralelo; el limitador de llamadas reparte la carga por nodo.
+    """
+
+    def __init__(self, proxmox=None, config=None):
+        self._proxmox = proxmox
+        self.config = config or _snapshot_settings()
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    def _guest(self, node, vmid, vm_type):
+        guest = self.proxmox.nodes(node)
+        return guest.qemu(vmid) if vm_type == 'qemu' else guest.lxc(vmid)
+
+    def fetch(self, node, vmid, vm_type):
+        """Pide a Proxmox las instantáneas de un invitado y actualiza la caché"""
+        snapshots = [s for s in self._guest(node, vmid, vm_type).snapshot.get() if s.get('name') != 'current']
+        snapshots.sort(key=lambda s: s.get('snaptime', 0))
+        cache.set(f'{CACHE_PREFIX}{vmid}', {
+            'node': node,
+            'vm_type': vm_type,
+            'snapshots': snapshots,
+            'checked': time.time(),
+        }, self.config['cache_timeout'])
+        return snapshots
+
+    def invalidate(self, vmid):
+        cache.delete(f'{CACHE_PREFIX}{vmid}')
+
+    def snapshots_for(self, vmid):
+        """Instantáneas en caché de un invitado (None si no está en el inventario)"""
+        entry = cache.get(f'{CACHE_PREFIX}{vmid}')
+        return entry['snapshots'] if entry else None
+
+    def collect(self, resources=None, force=False):
+        """
+        Completa el inventario pidiendo solo los invitados sin entrada en caché
+
+        Returns:
+            dict: {vmid: entrada del inventario} de todos los invitados
+        """
+        if resources is None:
+            resources = proxmox_service.get_cluster_resources('vm')
+        guests = {int(r['vmid']): r for r in resources
+                  if r.get('vmid') is not None and r.get('type') in ('qemu', 'lxc') and not r.get('template')}
+
+        entries = {} if force else {
+            int(key[len(CACHE_PREFIX):]): entry
+            for key, entry in cache.get_many([f'{CACHE_PREFIX}{vmid}' for vmid in guests]).items()
+        }
+        # Un invitado que cambió de nodo también se vuelve a pedir
+        missing = [r for vmid, r in guests.items()
+                   if vmid not in entries or entries[vmid]['node'] != r['node']]
+
+        def fetch(resource):
+            try:
+                self.fetch(resource['node'], int(resource['vmid']), resource['type'])
+            except Exception as e:
+                logger.error(f"Error al obtener instantáneas de {resource['vmid']}: {str(e)}")
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.config['workers']) as executor:
+                list(executor.map(fetch, missing))
+            entries.update({
+                int(key[len(CACHE_PREFIX):]): entry
+                for key, entry in cache.get_many([f"{CACHE_PREFIX}{r['vmid']}" for r in missing]).items()
+            })
+            logger.info(f"Inventario de instantáneas: {len(missing)} invitados actualizados")
+        return entries
+
+
+class BulkSnapshotRunner:
+    """
+    Ejecuta operaciones de instantánea sobre muchos invitados
+
+    Cada nodo tiene su cola y como máximo `per_node_concurrency` tareas en curso.
+    Un hueco queda ocupado hasta que la tarea (identificada por su UPID) termina,
+    porque la carga de E/S está en el nodo y no en la llamada a la API.
+    """
+
+    def __init__(self, proxmox=None, inventory=None, config=None):
+        self._proxmox = proxmox
+        self.inventory = inventory or snapshot_inventory
+        self.config = config or _snapshot_settings()
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    def _submit(self, operation, target):
+        guest = self.proxmox.nodes(target['node'])
+        guest = guest.qemu(target['vmid']) if target['vm_type'] == 'qemu' else guest.lxc(target['vmid'])
+        name = target['snapname']
+        if operation == 'create':
+            params = {'snapname': name, 'description': target.get('description', '')}
+            if target.get('vmstate') and target['vm_type'] == 'qemu':
+                params['vmstate'] = 1
+            return guest.snapshot.post(**params)
+        if operation == 'delete':
+            return guest.snapshot(name).delete()
+        return guest.snapshot(name).rollback.post()
+
+    def _wait_task(self, node, upid, deadline):
+        """Espera a que termine una tarea y devuelve su exitstatus"""
+        while True:
+            status = self.proxmox.nodes(node).tasks(upid).status.get()
+            if status.get('status') == 'stopped':
+                return status.get('exitstatus', '')
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(self.config['task_poll_interval'])
+
+    def _execute(self, operation, target, deadline):
+        started = time.monotonic()
+        result = {'node': target['node'], 'vmid': target['vmid'], 'snapname': target['snapname'], 'upid': None}
+        try:
+            result['upid'] = self._submit(operation, target)
+            task_deadline = min(deadline, started + self.config['task_timeout'])
+            exitstatus = self._wait_task(target['node'], result['upid'], task_deadline)
+            result['status'] = 'timeout' if exitstatus is None else ('ok' if exitstatus == 'OK' else 'error')
+            if exitstatus not in (None, 'OK'):
+                result['error'] = exitstatus
+        except Exception as e:
+            result.update(status='error', error=str(e))
+        result['elapsed'] = round(time.monotonic() - started, 1)
+        return result
+
+    def _drain(self, operation, queue, deadline, results):
+        """Consume la cola de un nodo; las operaciones de una misma VM van seguidas"""
+        while time.monotonic() < deadline:
+            try:
+                group = queue.popleft()
+            except IndexError:
+                return
+            for target in group:
+                if time.monotonic() >= deadline:
+                    return
+                results[(target['vmid'], target['snapname'])] = self._execute(operation, target, deadline)
+
+    def run(self, operation, targets, deadline=None):
+        """
+        Ejecuta una operación sobre varios invitados
+
+        Las operaciones sobre una misma VM se ejecutan una tras otra, ya que
+        Proxmox bloquea la VM mientras dura cada tarea de instantánea.
+
+        Args:
+            operation (str): 'create', 'delete' o 'rollback'
+            targets (list): [{'node', 'vmid', 'vm_type', 'snapname', 'description'?, 'vmstate'?}]
+            deadline (float, optional): Segundos máximos para iniciar operaciones
+
+        Returns:
+            list: [{'node', 'vmid', 'snapname', 'upid', 'status', 'error'?, 'elapsed'?}]
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"Operación de instantánea no soportada: {operation}")
+        for target in targets:
+            validate_name(target['snapname'])
+
+        limit = time.monotonic() + (deadline if deadline is not None else 24 * 3600)
+        groups = {}
+        for target in targets:
+            groups.setdefault((target['node'], target['vmid']), []).append(target)
+        queues = {}
+        for (node, _), group in groups.items():
+            queues.setdefault(node, deque()).append(group)
+
+        results = {}
+        slots = [queue for queue in queues.values()
+                 for _ in range(min(self.config['per_node_concurrency'], len(queue)))]
+        if slots:
+            with ThreadPoolExecutor(max_workers=min(self.config['max_workers'], len(slots))) as executor:
+                for queue in slots:
+                    executor.submit(self._drain, operation, queue, limit, results)
+
+        # Lo no iniciado antes del límite queda pendiente
+        results = [results.get((target['vmid'], target['snapname'])) or {
+            'node': target['node'], 'vmid': target['vmid'], 'snapname': target['snapname'],
+            'upid': None, 'status': 'skipped'
+        } for target in targets]
+
+        for vmid in {target['vmid'] for target in targets}:
+            self.inventory.invalidate(vmid)
+            if operation == 'rollback':
+                config_store.invalidate(vmid)
+        if targets:
+            bump_version('inventory')
+
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        logger.info(f"Instantáneas ({operation}): {summary}")
+        return results
+
+    def plan_rotation(self, entries, prefix, keep):
+        """
+        Calcula las instantáneas a eliminar para conservar las `keep` más recientes con `prefix`
+
+        Args:
+            entries (dict): Inventario {vmid: entrada}
+
+        Returns:
+            list: Objetivos para `run('delete', ...)`
+        """
+        targets = []
+        for vmid, entry in entries.items():
+            rotated = [s for s in entry['snapshots'] if s.get('name', '').startswith(prefix)]
+            rotated.sort(key=lambda s: s.get('snaptime', 0))
+            for snapshot in rotated[:max(0, len(rotated) - keep)]:
+                targets.append({'node': entry['node'], 'vmid': vmid, 'vm_type': entry['vm_type'],
+                                'snapname': snapshot['name']})
+        return targets
+
+    def rotate(self, prefix, keep, entries=None, deadline=None, vmstate=False):
+        """
+        Rotación de instantáneas: crea una nueva en cada invitado y borra las más antiguas
+
+        El plan de borrado sale del inventario, sin listar las instantáneas de cada VM.
+
+        Args:
+            entries (dict, optional): Inventario {vmid: entrada}; por defecto todo el cluster
+
+        Returns:
+            dict: {'create': resultados, 'delete': resultados}
+        """
+        name = validate_name(f"{prefix}{timezone.now():%Y%m%d%H%M}")
+        started = time.monotonic()
+        if entries is None:
+            entries = self.inventory.collect()
+        entries = dict(entries)
+
+        created = self.run('create', [
+            {'node': entry['node'], 'vmid': vmid, 'vm_type': entry['vm_type'], 'snapname': name,
+             'description': 'Rotación automática', 'vmstate': vmstate}
+            for vmid, entry in entries.items()
+        ], deadline=deadline)
+
+        # Solo se rota en los invitados donde la nueva instantánea se creó
+        ok = {result['vmid'] for result in created if result['status'] == 'ok'}
+        for vmid in ok:
+            entries[vmid] = dict(entries[vmid], snapshots=entries[vmid]['snapshots'] + [
+                {'name': name, 'snaptime': int(time.time())}
+            ])
+        remaining = max(0.0, deadline - (time.monotonic() - started)) if deadline is not None else None
+        deleted = self.run('delete', self.plan_rotation({v: entries[v] for v in ok}, prefix, keep),
+                           deadline=remaining)
+        return {'create': created, 'delete': deleted}
+
+
+# Instancias singleton para usar en toda la aplicación
+snapshot_inventory = SnapshotInventory()
+bulk_snapshots = BulkSnapshotRunner()
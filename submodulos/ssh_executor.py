@@ -0,0 +1,471 @@
+# submodulos/ssh_executor.py
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+import logging
+import select
+import threading
+import time
+
+import paramiko
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import (
+    AsignacionRecursosInicial,
+    AuditoriaRecursosCabecera,
+    AuditoriaRecursosDetalle,
+    MaquinaVirtual,
+)
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+NODE_METRICS_PREFIX = 'sentinelnexus:node_metrics:'
+
+CommandResult = namedtuple('CommandResult', ['host', 'command', 'exit_status', 'stdout', 'stderr', 'error'])
+
+# Comandos ejecutados en los nodos Proxmox
+NODE_COMMANDS = {
+    'arcstats': 'cat /proc/spl/kstat/zfs/arcstats',
+    'diskstats': 'cat /proc/diskstats',
+    'procesos': 'ps -eo pid,pcpu,pmem,rss,comm --sort=-pcpu --no-headers | head -n 20',
+}
+
+# Comandos ejecutados dentro de los invitados
+GUEST_COMMANDS = {
+    'stat': 'head -n 1 /proc/stat; sleep 1; head -n 1 /proc/stat',
+    'meminfo': 'cat /proc/meminfo',
+    'df': 'df -P -B1 /',
+}
+
+
+def _ssh_settings():
+    """Devuelve la configuración del ejecutor SSH con valores por defecto"""
+    defaults = {
+        'username': 'root',
+        'password': None,
+        'key_filename': None,
+        'port': 22,
+        'connect_timeout': 10,
+        'command_timeout': 30,
+        'channels_per_host': 8,     # Por debajo del MaxSessions=10 de OpenSSH
+        'max_parallel_hosts': 32,
+        'keepalive': 30,
+        # Claves de host desconocidas: 'reject', 'warning' o 'auto_add'. Las conocidas se
+        # leen de ~/.ssh/known_hosts y, si se indica, de `known_hosts`
+        'host_key_policy': 'reject',
+        'known_hosts': None,
+        # Métrica recolectada -> TipoRecurso.nombre
+        'resource_types': {'cpu': 'CPU', 'memoria': 'Memoria', 'disco': 'Disco'},
+    }
+    defaults.update(getattr(settings, 'SSH_COLLECTOR', {}))
+    return defaults
+
+
+HOST_KEY_POLICIES = {
+    'reject': paramiko.RejectPolicy,
+    'warning': paramiko.WarningPolicy,
+    'auto_add': paramiko.AutoAddPolicy,
+}
+
+
+def default_transport_factory(host, config):
+    """Abre un transporte SSH autenticado contra `host` verificando su clave de host"""
+    client = paramiko.SSHClient()
+    client.load_system_host_keys()
+    if config['known_hosts']:
+        client.load_host_keys(config['known_hosts'])
+    client.set_missing_host_key_policy(HOST_KEY_POLICIES[config['host_key_policy']]())
+    client.connect(
+        host,
+        port=config['port'],
+        username=config['username'],
+        password=config['password'],
+        key_filename=config['key_filename'],
+        timeout=config['connect_timeout'],
+        banner_timeout=config['connect_timeout'],
+        auth_timeout=config['connect_timeout'],
+        look_for_keys=config['key_filename'] is None and config['password'] is None,
+    )
+    transport = client.get_transport()
+    transport.set_keepalive(config['keepalive'])
+    return transport
+
+
+class SSHConnectionPool:
+    """
+    Mantiene un transporte SSH persistente por host
+
+    Los transportes se reutilizan entre ejecuciones y se reabren si la conexión
+    se perdió. `transport_factory` permite sustituir la conexión real por un
+    servidor SSH local en pruebas.
+    """
+
+    def __init__(self, transport_factory=None, config=None):
+        self.config = config or _ssh_settings()
+        self.transport_factory = transport_factory or default_transport_factory
+        self._transports = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _host_lock(self, host):
+        with self._lock:
+            return self._locks.setdefault(host, threading.Lock())
+
+    def get_transport(self, host):
+        """Devuelve un transporte activo para el host, conectando si es necesario"""
+        with self._host_lock(host):
+            transport = self._transports.get(host)
+            if transport is None or not transport.is_active():
+                if transport is not None:
+                    transport.close()
+                transport = self.transport_factory(host, self.config)
+                self._transports[host] = transport
+            return transport
+
+    def discard(self, host):
+        """Cierra y descarta el transporte de un host"""
+        with self._host_lock(host):
+            transport = self._transports.pop(host, None)
+        if transport is not None:
+            transport.close()
+
+    def close(self):
+        for host in list(self._transports):
+            self.discard(host)
+
+
+class SSHExecutor:
+    """
+    Ejecuta comandos en muchos hosts reutilizando un transporte por host
+
+    Dentro de cada host los comandos se multiplexan como canales sobre el mismo
+    transporte (hasta `channels_per_host` a la vez) y se leen con `select`, sin
+    un hilo por comando. Entre hosts el paralelismo se limita a `max_parallel_hosts`.
+    """
+
+    def __init__(self, pool=None, config=None):
+        self.config = config or _ssh_settings()
+        self.pool = pool or SSHConnectionPool(config=self.config)
+
+    def run(self, jobs):
+        """
+        Ejecuta una lista de comandos agrupándolos por host
+
+        Args:
+            jobs (dict): {host: [comando, ...]}
+
+        Returns:
+            dict: {host: [CommandResult, ...]} en el mismo orden que los comandos
+        """
+        results = {}
+        if not jobs:
+            return results
+        workers = min(self.config['max_parallel_hosts'], len(jobs))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {host: executor.submit(self._run_host, host, commands) for host, commands in jobs.items()}
+            for host, future in futures.items():
+                results[host] = future.result()
+        return results
+
+    def _run_host(self, host, commands):
+        try:
+            transport = self.pool.get_transport(host)
+        except Exception as e:
+            logger.error(f"Error al conectar por SSH con {host}: {str(e)}")
+            return [CommandResult(host, cmd, None, '', '', str(e)) for cmd in commands]
+
+        try:
+            return self._run_multiplexed(host, transport, commands)
+        except (paramiko.SSHException, OSError) as e:
+            # El transporte quedó inutilizable; se descarta para reconectar la próxima vez
+            logger.error(f"Error SSH en {host}: {str(e)}")
+            self.pool.discard(host)
+            return [CommandResult(host, cmd, None, '', '', str(e)) for cmd in commands]
+
+    def _run_multiplexed(self, host, transport, commands):
+        """
+        Ejecuta los comandos como canales sobre un mismo transporte
+
+        Se mantienen hasta `channels_per_host` canales abiertos; cuando uno termina
+        se abre el siguiente, y todos se leen desde un único hilo con `select`.
+        """
+        limit = self.config['channels_per_host']
+        timeout = self.config['command_timeout']
+        results = [None] * len(commands)
+        queue = list(enumerate(commands))
+        queue.reverse()
+        active = {}  # canal -> (índice, stdout, stderr, límite)
+
+        while queue or active:
+            while queue and len(active) < limit:
+                index, command = queue.pop()
+                channel = transport.open_session(timeout=self.config['connect_timeout'])
+                channel.exec_command(command)
+                active[channel] = (index, [], [], time.monotonic() + timeout)
+
+            readable, _, _ = select.select(list(active), [], [], 0.5)
+            for channel in readable:
+                _, out, err, _ = active[channel]
+                while channel.recv_ready():
+                    out.append(channel.recv(32768))
+                while channel.recv_stderr_ready():
+                    err.append(channel.recv_stderr(32768))
+
+            now = time.monotonic()
+            for channel, (index, out, err, deadline) in list(active.items()):
+                finished = channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready()
+                if not finished and now < deadline:
+                    continue
+                del active[channel]
+                results[index] = CommandResult(
+                    host, commands[index],
+                    channel.recv_exit_status() if finished else None,
+                    b''.join(out).decode('utf-8', 'replace'),
+                    b''.join(err).decode('utf-8', 'replace'),
+                    None if finished else 'timeout',
+                )
+                channel.close()
+        return results
+
+    def close(self):
+        self.pool.close()
+
+
+# Parsers
+
+def parse_arcstats(text):
+    """Convierte /proc/spl/kstat/zfs/arcstats en un diccionario {nombre: valor}"""
+    stats = {}
+    for line in text.splitlines()[2:]:
+        parts = line.split()
+        if len(parts) == 3 and parts[2].isdigit():
+            stats[parts[0]] = int(parts[2])
+    if 'hits' in stats and 'misses' in stats:
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(100.0 * stats['hits'] / total, 2) if total else 0.0
+    return stats
+
+
+def parse_diskstats(text):
+    """
+    Convierte /proc/diskstats en la latencia media por dispositivo
+
+    Returns:
+        dict: {dispositivo: {'lecturas', 'escrituras', 'latencia_lectura_ms', 'latencia_escritura_ms'}}
+    """
+    disks = {}
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) < 14 or parts[2].startswith(('loop', 'ram')):
+            continue
+        reads, read_ms = int(parts[3]), int(parts[6])
+        writes, write_ms = int(parts[7]), int(parts[10])
+        disks[parts[2]] = {
+            'lecturas': reads,
+            'escrituras': writes,
+            'latencia_lectura_ms': round(read_ms / reads, 3) if reads else 0.0,
+            'latencia_escritura_ms': round(write_ms / writes, 3) if writes else 0.0,
+        }
+    return disks
+
+
+def parse_processes(text):
+    """Convierte la salida de `ps -eo pid,pcpu,pmem,rss,comm` en una lista de procesos"""
+    processes = []
+    for line in text.splitlines():
+        parts = line.split(None, 4)
+        if len(parts) == 5:
+            processes.append({
+                'pid': int(parts[0]),
+                'cpu': float(parts[1]),
+                'mem': float(parts[2]),
+                'rss_kb': int(parts[3]),
+                'comando': parts[4],
+            })
+    return processes
+
+
+def parse_cpu_usage(text):
+    """Calcula el % de CPU a partir de dos lecturas consecutivas de /proc/stat"""
+    lines = [l.split() for l in text.splitlines() if l.startswith('cpu ')]
+    if len(lines) < 2:
+        return None
+    first = [int(v) for v in lines[0][1:]]
+    second = [int(v) for v in lines[1][1:]]
+    idle = (second[3] + second[4]) - (first[3] + first[4])
+    total = sum(second) - sum(first)
+    return 100.0 * (total - idle) / total if total else 0.0
+
+
+def parse_meminfo(text):
+    """Devuelve (bytes usados, % de uso) a partir de /proc/meminfo"""
+    info = {}
+    for line in text.splitlines():
+        key, _, value = line.partition(':')
+        if value:
+            info[key] = int(value.split()[0]) * 1024
+    total = info.get('MemTotal')
+    if not total:
+        return None
+    used = total - info.get('MemAvailable', info.get('MemFree', 0))
+    return used, 100.0 * used / total
+
+
+def parse_df(text):
+    """Devuelve (bytes usados, % de uso) a partir de `df -P -B1`"""
+    lines = text.splitlines()
+    if len(lines) < 2:
+        return None
+    parts = lines[1].split()
+    used, available = int(parts[2]), int(parts[3])
+    total = used + available
+    return used, 100.0 * used / total if total else 0.0
+
+
+def parse_guest_metrics(outputs):
+    """
+    Convierte las salidas de GUEST_COMMANDS en métricas {métrica: (consumo, porcentaje)}
+    """
+    metrics = {}
+    cpu = parse_cpu_usage(outputs.get('stat', ''))
+    if cpu is not None:
+        metrics['cpu'] = (cpu, cpu)
+    # Memoria y disco se guardan en MB para que quepan en consumo_actual
+    mem = parse_meminfo(outputs.get('meminfo', ''))
+    if mem is not None:
+        metrics['memoria'] = (mem[0] / MB, mem[1])
+    disk = parse_df(outputs.get('df', ''))
+    if disk is not None:
+        metrics['disco'] = (disk[0] / MB, disk[1])
+    return metrics
+
+
+def _outputs_by_name(results, commands):
+    """Asocia los resultados de un host con el nombre de cada comando"""
+    names = {command: name for name, command in commands.items()}
+    return {names[r.command]: r.stdout for r in results if r.exit_status == 0}
+
+
+# Recolección
+
+def collect_node_metrics(hosts, executor=None):
+    """
+    Recolecta métricas de ZFS ARC, latencia de disco y procesos en los nodos
+
+    A diferencia de las de los invitados, no se guardan como auditoría: cada
+    AuditoriaRecursosCabecera pertenece a una MaquinaVirtual y los detalles son
+    consumos de un RecursoFisico, mientras que estas métricas (contadores de
+    ARC, latencias por dispositivo, lista de procesos) son del nodo y no tienen
+    recurso asociado. Se publican en caché con `cache_node_metrics`.
+
+    Args:
+        hosts (dict): {clave del nodo (`sharding.node_key`): dirección SSH}
+
+    Returns:
+        dict: {clave del nodo: {'arcstats', 'diskstats', 'procesos'}}
+    """
+    executor = executor or ssh_executor
+    commands = list(NODE_COMMANDS.values())
+    results = executor.run({address: commands for address in hosts.values()})
+
+    metrics = {}
+    for node, address in hosts.items():
+        outputs = _outputs_by_name(results.get(address, []), NODE_COMMANDS)
+        try:
+            metrics[node] = {
+                'arcstats': parse_arcstats(outputs['arcstats']) if 'arcstats' in outputs else {},
+                'diskstats': parse_diskstats(outputs.get('diskstats', '')),
+                'procesos': parse_processes(outputs.get('procesos', '')),
+            }
+        except (ValueError, IndexError) as e:
+            # Una salida inesperada solo invalida las métricas de ese nodo
+            logger.error(f"Salida no reconocida en el nodo {node} ({address}): {str(e)}")
+            metrics[node] = {'arcstats': {}, 'diskstats': {}, 'procesos': [], 'error': str(e)}
+    return metrics
+
+
+def cache_node_metrics(metrics, timeout):
+    """
+    Publica en caché las métricas de `collect_node_metrics`, una clave por nodo
+
+    La clave incluye el servidor Proxmox (`sharding.node_key`): dos clusters
+    pueden tener nodos con el mismo nombre.
+    """
+    cache.set_many({f'{NODE_METRICS_PREFIX}{node}': node_metrics for node, node_metrics in metrics.items()}, timeout)
+
+
+def collect_guest_audit(periodo, vms=None, executor=None):
+    """
+    Recolecta métricas dentro de los invitados y las guarda como auditoría en bloque
+
+    Se crea una AuditoriaRecursosCabecera por VM y un AuditoriaRecursosDetalle por
+    cada recurso asignado cuyo tipo tenga métrica, todo con `bulk_create`.
+
+    Args:
+        periodo (AuditoriaPeriodo): Periodo de auditoría al que pertenecen las muestras
+        vms (QuerySet, optional): VMs a auditar. Por defecto todas las monitorizadas con IP.
+
+    Returns:
+        int: Número de detalles de auditoría creados
+    """
+    executor = executor or ssh_executor
+    resource_types = executor.config['resource_types']
+    if vms is None:
+        vms = MaquinaVirtual.objects.filter(is_monitored=True, ip_address__isnull=False)
+    vms = list(vms)
+    if not vms:
+        return 0
+
+    commands = list(GUEST_COMMANDS.values())
+    results = executor.run({vm.ip_address: commands for vm in vms})
+
+    # Recursos asignados a cada VM indexados por nombre del tipo de recurso
+    assigned = {}
+    for asignacion in (AsignacionRecursosInicial.objects
+                       .filter(maquina_virtual__in=vms)
+                       .select_related('recurso__tipo_recurso')):
+        assigned.setdefault(asignacion.maquina_virtual_id, {})[asignacion.recurso.tipo_recurso.nombre] = asignacion.recurso
+
+    cabeceras, pending, failed = [], [], 0
+    for vm in vms:
+        try:
+            metrics = parse_guest_metrics(_outputs_by_name(results.get(vm.ip_address, []), GUEST_COMMANDS))
+        except (ValueError, IndexError) as e:
+            # Una salida inesperada solo deja sin auditar a ese invitado
+            logger.error(f"Salida no reconocida en la VM {vm.vm_id} ({vm.ip_address}): {str(e)}")
+            failed += 1
+            continue
+        recursos = assigned.get(vm.vm_id, {})
+        rows = []
+        for metric, (consumo, porcentaje) in metrics.items():
+            recurso = recursos.get(resource_types.get(metric))
+            if recurso is not None:
+                rows.append((recurso, consumo, porcentaje))
+        if rows:
+            cabeceras.append(AuditoriaRecursosCabecera(maquina_virtual=vm, periodo=periodo))
+            pending.append(rows)
+
+    with transaction.atomic():
+        AuditoriaRecursosCabecera.objects.bulk_create(cabeceras)
+        detalles = [
+            AuditoriaRecursosDetalle(
+                auditoria_cabecera=cabecera,
+                recurso=recurso,
+                consumo_actual=Decimal(consumo).quantize(Decimal('0.01')),
+                porcentaje_uso=Decimal(min(max(porcentaje, 0.0), 100.0)).quantize(Decimal('0.01')),
+            )
+            for cabecera, rows in zip(cabeceras, pending)
+            for recurso, consumo, porcentaje in rows
+        ]
+        AuditoriaRecursosDetalle.objects.bulk_create(detalles, batch_size=1000)
+
+    logger.info(f"Auditoría SSH: {len(detalles)} detalles para {len(cabeceras)} VMs ({failed} con salida no reconocida)")
+    return len(detalles)
+
+
+# Instancia singleton para usar en toda la aplicación
+ssh_executor = SSHExecutor()
@@ -0,0 +1,236 @@
+# submodulos/storage_index.py
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .config_store import config_store
+from .proxmox_service import proxmox_service
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'sentinelnexus:storage:'
+MANIFEST_KEY = CACHE_PREFIX + 'manifest'
+VM_PREFIX = CACHE_PREFIX + 'vm:'
+VM_MANIFEST_KEY = CACHE_PREFIX + 'vm_manifest'
+ORPHANS_KEY = CACHE_PREFIX + 'orphans'
+
+UNUSED_DISK = re.compile(r'^unused\d+$')
+
+
+def _storage_index_settings():
+    """Devuelve la configuración del índice de almacenamiento con valores por defecto"""
+    defaults = {
+        'workers': 16,
+        'max_age': 3600,   # Segundos tras los que se reescanea un almacenamiento aunque no cambie
+    }
+    defaults.update(getattr(settings, 'STORAGE_INDEX', {}))
+    return defaults
+
+
+def storage_key(resource):
+    """Clave de un almacenamiento: los compartidos son uno solo para todo el cluster"""
+    if resource.get('shared'):
+        return resource['storage']
+    return f"{resource['node']}/{resource['storage']}"
+
+
+class StorageIndex:
+    """
+    Índice del contenido de todos los almacenamientos del cluster
+
+    Una sola llamada a cluster/resources da el uso de cada par nodo/almacenamiento.
+    Los almacenamientos compartidos se agrupan y se escanean desde un único nodo,
+    y solo se vuelve a pedir `storage/{id}/content` de los que cambiaron de uso
+    (o superan `max_age`). Los escaneos se hacen en paralelo y el resultado se
+    guarda por almacenamiento, junto con dos índices derivados: volúmenes por VM
+    y volúmenes huérfanos.
+    """
+
+    def __init__(self, proxmox=None, config=None):
+        self._proxmox = proxmox
+        self.config = config or _storage_index_settings()
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    def _scan(self, node, storage):
+        volumes = []
+        for item in self.proxmox.nodes(node).storage(storage).content.get():
+            vmid = item.get('vmid')
+            volumes.append({
+                'volid': item.get('volid'),
+                'content': item.get('content'),
+                'format': item.get('format'),
+                'size': item.get('size', 0),
+                'vmid': int(vmid) if vmid not in (None, '') else None,
+                'ctime': item.get('ctime'),
+            })
+        return volumes
+
+    def _targets(self, resources):
+        """Agrupa los pares nodo/almacenamiento activos por almacenamiento lógico"""
+        targets = {}
+        for resource in resources:
+            if resource.get('status') != 'available':
+                continue
+            key = storage_key(resource)
+            target = targets.setdefault(key, {
+                'storage': resource['storage'],
+                'shared': bool(resource.get('shared')),
+                'nodes': [],
+                'used': resource.get('disk', 0),
+                'total': resource.get('maxdisk', 0),
+                'plugintype': resource.get('plugintype'),
+            })
+            target['nodes'].append(resource['node'])
+        return targets
+
+    def refresh(self, force=False):
+        """
+        Reescanea los almacenamientos cuyo uso cambió y reconstruye los índices derivados
+
+        Args:
+            force (bool): Reescanear todos los almacenamientos
+
+        Returns:
+            dict: Estadísticas del refresco
+        """
+        started = time.monotonic()
+        targets = self._targets(proxmox_service.get_cluster_resources('storage'))
+        current = cache.get_many([CACHE_PREFIX + key for key in targets])
+
+        now = time.time()
+        pending = []
+        for key, target in targets.items():
+            entry = current.get(CACHE_PREFIX + key)
+            if (force or entry is None or entry['used'] != target['used']
+                    or now - entry['scanned'] > self.config['max_age']):
+                pending.append(key)
+
+        def scan(key):
+            target = targets[key]
+            # Un almacenamiento compartido se lee desde el primer nodo que responda
+            for node in target['nodes']:
+                try:
+                    return key, node, self._scan(node, target['storage'])
+                except Exception as e:
+                    logger.warning(f"Error al escanear {target['storage']} en {node}: {str(e)}")
+            return key, None, None
+
+        entries = {}
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.config['workers']) as executor:
+                for key, node, volumes in executor.map(scan, pending):
+                    if volumes is None:
+                        continue
+                    target = targets[key]
+                    entries[CACHE_PREFIX + key] = {
+                        'key': key,
+                        'storage': target['storage'],
+                        'shared': target['shared'],
+                        'nodes': target['nodes'],
+                        'scanned_from': node,
+                        'used': target['used'],
+                        'total': target['total'],
+                        'scanned': now,
+                        'volumes': volumes,
+                    }
+            cache.set_many(entries, None)
+
+        # Los almacenamientos que ya no existen salen del índice
+        previous = cache.get(MANIFEST_KEY) or []
+        gone = [CACHE_PREFIX + key for key in previous if key not in targets]
+        if gone:
+            cache.delete_many(gone)
+        cache.set(MANIFEST_KEY, sorted(targets), None)
+
+        # Se reconstruyen siempre: una VM eliminada deja huérfanos sin cambiar el uso
+        self._rebuild_derived(list(targets))
+
+        stats = {
+            'storages': len(targets),
+            'scanned': len(entries),
+            'failed': len(pending) - len(entries),
+            'removed': len(gone),
+            'elapsed': round(time.monotonic() - started, 2),
+        }
+        logger.info(f"Índice de almacenamiento: {stats}")
+        return stats
+
+    def _rebuild_derived(self, keys):
+        """Reconstruye los índices de volúmenes por VM y de huérfanos"""
+        entries = list(cache.get_many([CACHE_PREFIX + key for key in keys]).values())
+        guests = {int(r['vmid']) for r in proxmox_service.get_cluster_resources('vm') if r.get('vmid') is not None}
+        if not guests:
+            # Sin inventario no se puede distinguir un huérfano de una VM existente
+            logger.warning("Índice de almacenamiento: inventario de VMs vacío, no se recalculan los huérfanos")
+            return
+
+        by_vm = {}
+        for entry in entries:
+            for volume in entry['volumes']:
+                if volume['vmid'] is not None:
+                    by_vm.setdefault(volume['vmid'], []).append(dict(volume, storage=entry['key']))
+
+        # Discos desvinculados ("unusedN") según las configuraciones en caché
+        configs = config_store.cached_configs(vmid for vmid in by_vm if vmid in guests)
+        unused = set()
+        for config_entry in configs.values():
+            for name, value in config_entry['config'].items():
+                if UNUSED_DISK.match(name):
+                    unused.add(str(value).split(',')[0])
+
+        orphans = []
+        for vmid, volumes in by_vm.items():
+            for volume in volumes:
+                if vmid not in guests:
+                    orphans.append(dict(volume, reason='vm_missing'))
+                elif volume['volid'] in unused:
+                    orphans.append(dict(volume, reason='unused'))
+
+        # Una clave por VM para que las consultas no deserialicen el índice completo
+        stale = set(cache.get(VM_MANIFEST_KEY) or []) - by_vm.keys()
+        if stale:
+            cache.delete_many([f'{VM_PREFIX}{vmid}' for vmid in stale])
+        cache.set_many({f'{VM_PREFIX}{vmid}': volumes for vmid, volumes in by_vm.items()}, None)
+        cache.set_many({VM_MANIFEST_KEY: sorted(by_vm), ORPHANS_KEY: orphans}, None)
+
+    # Consultas
+
+    def volumes_for_vm(self, vmid):
+        """Discos, copias de seguridad y plantillas de una VM en todos los almacenamientos"""
+        return cache.get(f'{VM_PREFIX}{int(vmid)}') or []
+
+    def orphans(self, storage=None):
+        """Volúmenes cuya VM ya no existe o que están desvinculados de su VM"""
+        orphans = cache.get(ORPHANS_KEY) or []
+        if storage:
+            orphans = [o for o in orphans if o['storage'] == storage]
+        return orphans
+
+    def summary(self):
+        """Uso y espacio ocupado por huérfanos de cada almacenamiento indexado"""
+        keys = cache.get(MANIFEST_KEY) or []
+        entries = cache.get_many([CACHE_PREFIX + key for key in keys])
+        orphaned = {}
+        for orphan in self.orphans():
+            orphaned[orphan['storage']] = orphaned.get(orphan['storage'], 0) + (orphan['size'] or 0)
+        return [{
+            'storage': entry['key'],
+            'shared': entry['shared'],
+            'nodes': entry['nodes'],
+            'used': entry['used'],
+            'total': entry['total'],
+            'volumes': len(entry['volumes']),
+            'orphaned_bytes': orphaned.get(entry['key'], 0),
+            'scanned': entry['scanned'],
+        } for entry in sorted(entries.values(), key=lambda e: e['key'])]
+
+
+# Instancia singleton para usar en toda la aplicación
+storage_index = StorageIndex()
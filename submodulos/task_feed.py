@@ -0,0 +1,295 @@
+# submodulos/task_feed.py
+import json
+import logging
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+
+from .proxmox_service import proxmox_service
+from .responses import bump_version
+
+logger = logging.getLogger(__name__)
+
+
+def _task_feed_settings():
+    """Devuelve la configuración del feed de tareas con valores por defecto"""
+    defaults = {
+        'key_prefix': 'sentinelnexus:tasks',
+        'max_tasks': 20000,       # Tareas totales conservadas en el índice
+        'max_per_key': 500,       # Tareas conservadas por nodo, VM o usuario
+        'poll_interval': 5,       # Segundos entre consultas a cluster/tasks
+        'lock_timeout': 60,       # Segundos que se reserva la sincronización a un proceso
+    }
+    defaults.update(getattr(settings, 'TASK_FEED', {}))
+    return defaults
+
+
+class TaskFeed:
+    """
+    Sigue `cluster/tasks` de forma incremental y mantiene un índice acotado en Redis
+
+    Una tarea es nueva si su UPID aún no está en el índice, y el cursor guarda
+    las tareas que seguían en ejecución. En cada consulta solo se escriben las
+    tareas nuevas o las que terminaron desde la anterior, de modo que las vistas
+    pueden leer el historial sin ir a Proxmox. No se usa un `starttime` máximo
+    como marca: los relojes de los nodos pueden diferir y una tarea puede
+    aparecer en `cluster/tasks` después de otras más recientes.
+
+    Esas mismas tareas se añaden a un stream de Redis para que otros procesos
+    (el detector de cambios) las consuman con su propio cursor, sin depender
+    de qué proceso hizo la consulta.
+    """
+
+    def __init__(self, proxmox=None, redis=None):
+        self._proxmox = proxmox
+        self._redis = redis
+        config = _task_feed_settings()
+        self.prefix = config['key_prefix']
+        self.max_tasks = config['max_tasks']
+        self.max_per_key = config['max_per_key']
+        self.poll_interval = config['poll_interval']
+        self.lock_timeout = config['lock_timeout']
+
+    @property
+    def proxmox(self):
+        return self._proxmox or proxmox_service.proxmox
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = get_redis_connection('default')
+        return self._redis
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    # Cursor
+
+    def get_cursor(self):
+        """Devuelve el cursor actual o None si el feed nunca se ha sincronizado"""
+        raw = self.redis.get(self._key('cursor'))
+        return json.loads(raw) if raw else None
+
+    def is_synced(self):
+        """Indica si el índice tiene datos válidos para servir lecturas"""
+        return self.redis.exists(self._key('cursor')) == 1
+
+    # Sincronización
+
+    def _known(self, upids):
+        """UPID que ya están en el índice"""
+        pipe = self.redis.pipeline(transaction=False)
+        for upid in upids:
+            pipe.hexists(self._key('data'), upid)
+        return {upid for upid, exists in zip(upids, pipe.execute()) if exists}
+
+    def _floor(self):
+        """`starttime` más antiguo que conserva el índice lleno (0 si aún cabe todo)"""
+        all_key = self._key('all')
+        if self.redis.zcard(all_key) < self.max_tasks:
+            return 0
+        oldest = self.redis.zrange(all_key, 0, 0, withscores=True)
+        return int(oldest[0][1]) if oldest else 0
+
+    def _select_changes(self, tasks, cursor, known, floor=0):
+        """
+        Selecciona las tareas nuevas o modificadas
+
+        Una tarea es nueva si su UPID no está en el índice, sea cual sea su
+        `starttime`: así no se pierden las de un nodo con el reloj atrasado ni las
+        que aparecen tarde en `cluster/tasks`. Solo se ignoran las anteriores a
+        `floor`, que ya salieron del índice por antigüedad.
+
+        Args:
+            known (set): UPID ya indexados
+            floor (int): `starttime` más antiguo que conserva el índice
+
+        Returns:
+            tuple: (tareas a escribir, nuevo cursor)
+        """
+        running = set(cursor['running']) if cursor else set()
+        max_start = cursor['starttime'] if cursor else 0
+
+        changed = []
+        new_running = set()
+        for task in tasks:
+            upid = task.get('upid')
+            if not upid:
+                continue
+            start = int(task.get('starttime', 0))
+
+            is_running = 'endtime' not in task and 'status' not in task
+            if is_running:
+                new_running.add(upid)
+
+            is_new = upid not in known and start >= floor
+            finished = upid in running and not is_running
+            if is_new or finished:
+                changed.append(task)
+            max_start = max(max_start, start)
+
+        # Las tareas en ejecución que ya no aparecen se dejan de seguir
+        new_cursor = {
+            'starttime': max_start,
+            'running': sorted(new_running),
+            'updated': time.time(),
+        }
+        return changed, new_cursor
+
+    def _write(self, tasks, cursor):
+        """Escribe las tareas en el índice y recorta los conjuntos al tamaño máximo"""
+        pipe = self.redis.pipeline(transaction=False)
+        touched = set()
+        data_key = self._key('data')
+        all_key = self._key('all')
+        stream_key = self._key('stream')
+
+        for task in tasks:
+            upid = task['upid']
+            score = int(task.get('starttime', 0))
+            raw = json.dumps(task)
+            pipe.hset(data_key, upid, raw)
+            pipe.zadd(all_key, {upid: score})
+            pipe.xadd(stream_key, {'task': raw}, maxlen=self.max_tasks, approximate=True)
+            for key in self._index_keys(task):
+                pipe.zadd(key, {upid: score})
+                touched.add(key)
+
+        for key in touched:
+            pipe.zremrangebyrank(key, 0, -(self.max_per_key + 1))
+        pipe.set(self._key('cursor'), json.dumps(cursor))
+        pipe.execute()
+
+        # Recortar el índice global y eliminar los datos de las tareas descartadas
+        overflow = self.redis.zcard(all_key) - self.max_tasks
+        if overflow > 0:
+            expired = self.redis.zrange(all_key, 0, overflow - 1)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zremrangebyrank(all_key, 0, overflow - 1)
+            pipe.hdel(data_key, *expired)
+            pipe.execute()
+
+    def _index_keys(self, task):
+        keys = []
+        if task.get('node'):
+            keys.append(self._key('node', task['node']))
+        if task.get('user'):
+            keys.append(self._key('user', task['user']))
+        vmid = task.get('id')
+        if vmid and str(vmid).isdigit():
+            keys.append(self._key('vm', vmid))
+        return keys
+
+    def poll(self):
+        """
+        Consulta `cluster/tasks` y aplica los cambios al índice
+
+        Returns:
+            list: Tareas nuevas o modificadas desde la consulta anterior
+        """
+        lock = self.redis.lock(self._key('lock'), timeout=self.lock_timeout, blocking_timeout=0)
+        if not lock.acquire(blocking=False):
+            logger.debug("Otro proceso está sincronizando el feed de tareas")
+            return []
+        try:
+            try:
+                tasks = self.proxmox.cluster.tasks.get()
+            except Exception as e:
+                logger.error(f"Error al obtener tareas del cluster: {str(e)}")
+                return []
+
+            # Si la consulta tardó más que el lock, otro proceso puede haber avanzado el
+            # cursor: se renueva antes de escribir y, si ya no es nuestro, se descarta
+            try:
+                lock.reacquire()
+            except LockError:
+                logger.warning("Feed de tareas: el lock expiró durante la consulta, se descartan los cambios")
+                return []
+
+            upids = [task['upid'] for task in tasks if task.get('upid')]
+            changed, cursor = self._select_changes(tasks, self.get_cursor(), self._known(upids), self._floor())
+            self._write(changed, cursor)
+            if changed:
+                # Las tareas (arranques, migraciones...) cambian el inventario servido por la API
+                bump_version('inventory')
+                logger.info(f"Feed de tareas: {len(changed)} tareas nuevas o modificadas")
+            return changed
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+    def follow(self, interval=None, stop=None):
+        """
+        Consulta el feed de forma continua
+
+        Args:
+            interval (float, optional): Segundos entre consultas
+            stop (callable, optional): Función que devuelve True para detener el bucle
+        """
+        interval = interval or self.poll_interval
+        while not (stop and stop()):
+            started = time.monotonic()
+            self.poll()
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    # Lecturas
+
+    def changes_since(self, last_id, count=1000):
+        """
+        Tareas escritas en el índice después de `last_id`
+
+        Args:
+            last_id (str | None): ID del stream devuelto por la llamada anterior. Con
+                None solo se devuelve la posición actual, sin tareas.
+
+        Returns:
+            tuple: (último ID leído, tareas nuevas o modificadas en orden de escritura)
+        """
+        stream_key = self._key('stream')
+        if last_id is None:
+            latest = self.redis.xrevrange(stream_key, count=1)
+            return (self._decode(latest[0][0]) if latest else '0-0'), []
+
+        tasks = []
+        while True:
+            entries = self.redis.xrange(stream_key, min=f'({last_id}', count=count)
+            for entry_id, fields in entries:
+                last_id = self._decode(entry_id)
+                tasks.append(json.loads(fields[b'task'] if b'task' in fields else fields['task']))
+            if len(entries) < count:
+                return last_id, tasks
+
+    @staticmethod
+    def _decode(value):
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _read(self, index_key, limit, offset=0):
+        upids = self.redis.zrevrange(index_key, offset, offset + limit - 1)
+        if not upids:
+            return []
+        raw = self.redis.hmget(self._key('data'), upids)
+        return [json.loads(item) for item in raw if item]
+
+    def recent(self, limit=50, offset=0):
+        """Tareas más recientes de todo el cluster"""
+        return self._read(self._key('all'), limit, offset)
+
+    def tasks_for_vm(self, vmid, limit=10):
+        """Historial de tareas de una VM o contenedor"""
+        return self._read(self._key('vm', vmid), limit)
+
+    def tasks_for_node(self, node, limit=50):
+        """Historial de tareas de un nodo"""
+        return self._read(self._key('node', node), limit)
+
+    def tasks_for_user(self, user, limit=50):
+        """Historial de tareas lanzadas por un usuario"""
+        return self._read(self._key('user', user), limit)
+
+
+# Instancia singleton para usar en toda la aplicación
+task_feed = TaskFeed()
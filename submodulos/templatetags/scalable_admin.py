@@ -0,0 +1,90 @@
+import calendar
+import datetime
+
+from django import template
+from django.contrib.admin.utils import get_fields_from_path
+from django.db import models
+from django.utils import formats, timezone
+from django.utils.text import capfirst
+from django.utils.translation import gettext as _
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/date_hierarchy.html')
+def calendar_date_hierarchy(cl):
+    """
+    Jerarquía de fechas del admin calculada con el calendario
+
+    La jerarquía estándar lista los años, meses y días con `SELECT DISTINCT` sobre
+    toda la tabla. Aquí solo se consultan el mínimo y el máximo (resueltos con el
+    índice de la columna) y los enlaces se generan a partir del calendario.
+    """
+    if not cl.date_hierarchy:
+        return {'show': False}
+
+    field_name = cl.date_hierarchy
+    field = get_fields_from_path(cl.model, field_name)[-1]
+    year_field = f'{field_name}__year'
+    month_field = f'{field_name}__month'
+    day_field = f'{field_name}__day'
+    year_lookup = cl.params.get(year_field)
+    month_lookup = cl.params.get(month_field)
+    day_lookup = cl.params.get(day_field)
+
+    def link(filters):
+        return cl.get_query_string(filters, [f'{field_name}__', 'cursor'])
+
+    if year_lookup and month_lookup and day_lookup:
+        day = datetime.date(int(year_lookup), int(month_lookup), int(day_lookup))
+        return {
+            'show': True,
+            'back': {
+                'link': link({year_field: year_lookup, month_field: month_lookup}),
+                'title': capfirst(formats.date_format(day, 'YEAR_MONTH_FORMAT')),
+            },
+            'choices': [{'title': capfirst(formats.date_format(day, 'MONTH_DAY_FORMAT'))}],
+        }
+
+    if year_lookup and month_lookup:
+        year, month = int(year_lookup), int(month_lookup)
+        days = calendar.monthrange(year, month)[1]
+        return {
+            'show': True,
+            'back': {'link': link({year_field: year_lookup}), 'title': str(year_lookup)},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month_lookup, day_field: day}),
+                    'title': capfirst(formats.date_format(datetime.date(year, month, day), 'MONTH_DAY_FORMAT')),
+                }
+                for day in range(1, days + 1)
+            ],
+        }
+
+    if year_lookup:
+        year = int(year_lookup)
+        return {
+            'show': True,
+            'back': {'link': link({}), 'title': _('All dates')},
+            'choices': [
+                {
+                    'link': link({year_field: year_lookup, month_field: month}),
+                    'title': capfirst(formats.date_format(datetime.date(year, month, 1), 'YEAR_MONTH_FORMAT')),
+                }
+                for month in range(1, 13)
+            ],
+        }
+
+    date_range = cl.queryset.order_by().aggregate(first=models.Min(field_name), last=models.Max(field_name))
+    if not date_range['first']:
+        return {'show': False}
+    if isinstance(field, models.DateTimeField):
+        date_range = {k: timezone.localtime(v) if timezone.is_aware(v) else v for k, v in date_range.items()}
+    return {
+        'show': True,
+        'back': None,
+        'choices': [
+            {'link': link({year_field: str(year)}), 'title': str(year)}
+            for year in range(date_range['first'].year, date_range['last'].year + 1)
+        ],
+    }
@@ -1,3 +1,1677 @@
-from django.test import TestCase
+import asyncio
+import gzip
+from datetime import timedelta
+import ipaddress
+import json
+import os
+from pathlib import Path
+import pickle
+import runpy
+import socket
+import ssl
+import tempfile
+import threading
+import time
+from unittest import mock, skipIf
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+import msgpack
+import numpy as np
+import paramiko
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connections
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+import websockets
+
+from .change_detector import TASK_CURSOR_KEY, ChangeDetector, _change_detector_settings
+from .config_store import ConfigStore
+from .console import CONSOLE_PATH_PREFIX, TOKEN_PREFIX, ConsoleProxy, _console_settings, create_console_session
+from .db_routers import PIN_COOKIE, AnalyticsReplicaRouter, PrimaryPinningMiddleware, is_pinned, use_primary
+from .forecasting import compute_forecasts, days_to_threshold, fit_trends
+from .ip_discovery import BACKOFF_PREFIX, IP_CACHE_PREFIX, IPDiscovery, _ip_discovery_settings
+from .models import (AsignacionRecursosInicial, AuditoriaPeriodo, AuditoriaRecursosCabecera, AuditoriaRecursosDetalle,
+                     ConfiguracionVM, EstadisticaPeriodo, EstadisticaRecursos, MaquinaVirtual, Nodo, ProxmoxServer,
+                     RecursoFisico, SistemaOperativo, TipoRecurso)
+from .rebalancer import Rebalancer, _rebalancer_settings, plan_migrations
+from .records import GuestRecord, NodeRecord, parse_guests, parse_nodes
+from .responses import bump_version, cached_payload_response, encode
+from .rollups import compute_period_statistics, percentiles, rollup_pending
+from .scheduler import STATUS_PREFIX, PollScheduler, _scheduler_settings
+from .search import SearchIndex
+from .sharding import HashRing, ShardedCollector, _collector_settings, default_collect, node_key
+from .sketches import DDSketch, merge_sketches
+from .snapshots import BulkSnapshotRunner, _snapshot_settings
+from .ssh_executor import (GUEST_COMMANDS, NODE_COMMANDS, SSHConnectionPool, SSHExecutor, _ssh_settings,
+                           collect_guest_audit, collect_node_metrics, default_transport_factory)
+from .storage_index import StorageIndex, _storage_index_settings
+from .task_feed import TaskFeed
+
+try:
+    import fakeredis
+except ImportError:  # Solo para las pruebas que necesitan Redis
+    fakeredis = None
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class ForecastingTests(SimpleTestCase):
+
+    def test_fit_trends_matches_polyfit(self):
+        rng = np.random.default_rng(0)
+        grupo = np.repeat(np.arange(50), 30)
+        t = np.tile(np.linspace(-29, 0, 30), 50)
+        y = rng.uniform(0, 2, 50)[grupo] * t + 60 + rng.normal(0, 1, grupo.size)
+
+        n, slope, intercept, _ = fit_trends(grupo, t, y, 50)
+        for g in (0, 17, 49):
+            expected_slope, expected_intercept = np.polyfit(t[grupo == g], y[grupo == g], 1)
+            self.assertAlmostEqual(slope[g], expected_slope, places=6)
+            self.assertAlmostEqual(intercept[g], expected_intercept, places=6)
+        self.assertTrue((n == 30).all())
+
+    def test_days_to_threshold(self):
+        days = days_to_threshold(np.array([2.0, -1.0, 1.0]), np.array([80.0, 50.0, 120.0]), 100.0)
+        self.assertEqual(days.tolist(), [10.0, np.inf, 0.0])
+
+    def test_fit_trends_scales_to_thousands_of_entities(self):
+        # 10 000 entidades con 90 días de historial cada una
+        grupo = np.repeat(np.arange(10000), 90)
+        t = np.tile(np.arange(-89, 1, dtype=np.float64), 10000)
+        y = np.random.default_rng(1).uniform(0, 100, grupo.size)
+        started = time.perf_counter()
+        fit_trends(grupo, t, y, 10000)
+        self.assertLess(time.perf_counter() - started, 2.0)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ForecastEntitiesTests(TestCase):
+
+    def test_storage_entities_are_forecast(self):
+        servidor = ProxmoxServer.objects.create(name='pve', hostname='pve', username='root@pam', password='x')
+        nodo = Nodo.objects.create(proxmox_server=servidor, nombre='pve1', hostname='pve1', ip_address='10.0.0.1')
+        disco = TipoRecurso.objects.create(nombre='Disco', unidad_medida='GB')
+        almacenamiento = RecursoFisico.objects.create(nodo=nodo, tipo_recurso=disco, nombre='local-zfs',
+                                                      capacidad_total=1000, capacidad_disponible=400)
+        now = timezone.now()
+        for day in range(10):
+            periodo = EstadisticaPeriodo.objects.create(
+                fecha_inicio=now - timedelta(days=10 - day), fecha_fin=now - timedelta(days=9 - day),
+                nivel_agregacion='almacenamiento')
+            EstadisticaRecursos.objects.create(
+                periodo=periodo, tipo_recurso=disco, entidad_id=almacenamiento.recurso_id,
+                tipo_entidad='almacenamiento', uso_promedio=40 + 2 * day, uso_maximo=50 + 2 * day,
+                uso_minimo=30, total_asignado=0, total_disponible=400)
+
+        forecasts = compute_forecasts()['pronosticos']
+        self.assertEqual(len(forecasts), 1)
+        self.assertEqual(forecasts[0]['tipo_entidad'], 'almacenamiento')
+        self.assertEqual(forecasts[0]['entidad'], 'pve1/local-zfs')
+        # Crece 2 puntos por día desde 68 %: unos 16 días hasta el 100 %
+        self.assertAlmostEqual(forecasts[0]['dias_restantes'], 16, delta=1)
+
+
+class FakeProxmox:
+    """Sustituto mínimo de proxmoxer: responde a `cluster.tasks.get()`"""
+
+    def __init__(self, tasks=(), delay=0.0):
+        self._tasks = list(tasks)
+        self._delay = delay
+        self.cluster = self.tasks = self
+
+    def get(self):
+        time.sleep(self._delay)
+        return self._tasks
+
+
+@skipIf(fakeredis is None, 'fakeredis no está instalado')
+@override_settings(CACHES=LOCMEM_CACHE)
+class TaskFeedTests(SimpleTestCase):
+
+    TASKS = [{'upid': f'UPID:pve1:{i}', 'node': 'pve1', 'user': 'root@pam', 'id': '100',
+              'starttime': 1000 + i, 'endtime': 1001 + i, 'status': 'OK'} for i in range(3)]
+
+    def test_poll_indexes_new_tasks_once(self):
+        feed = TaskFeed(proxmox=FakeProxmox(self.TASKS), redis=fakeredis.FakeRedis())
+        self.assertEqual(len(feed.poll()), 3)
+        self.assertEqual(feed.poll(), [])
+        self.assertEqual([t['upid'] for t in feed.tasks_for_vm(100)], [t['upid'] for t in reversed(self.TASKS)])
+
+    def test_late_and_skewed_tasks_are_not_dropped(self):
+        feed = TaskFeed(proxmox=FakeProxmox(self.TASKS), redis=fakeredis.FakeRedis())
+        feed.poll()
+        # Un nodo con el reloj atrasado y una tarea que aparece tarde, ambas anteriores al máximo visto
+        skewed = {'upid': 'UPID:pve2:9', 'node': 'pve2', 'user': 'root@pam', 'id': '101', 'starttime': 900,
+                  'endtime': 901, 'status': 'OK'}
+        late = dict(self.TASKS[0], upid='UPID:pve1:late', starttime=1000)
+        running = {'upid': 'UPID:pve2:10', 'node': 'pve2', 'user': 'root@pam', 'id': '101', 'starttime': 950}
+        feed.proxmox._tasks = self.TASKS + [skewed, late, running]
+        self.assertEqual({t['upid'] for t in feed.poll()}, {'UPID:pve2:9', 'UPID:pve1:late', 'UPID:pve2:10'})
+        self.assertEqual(feed.poll(), [])
+
+        feed.proxmox._tasks = self.TASKS + [skewed, late, dict(running, endtime=960, status='OK')]
+        self.assertEqual([t['upid'] for t in feed.poll()], ['UPID:pve2:10'])
+        self.assertEqual(len(feed.changes_since('0-0')[1]), 7)
+
+    def test_poll_longer_than_lock_discards_changes(self):
+        feed = TaskFeed(proxmox=FakeProxmox(self.TASKS, delay=0.3), redis=fakeredis.FakeRedis())
+        feed.lock_timeout = 0.1
+        # Mientras tanto otro proceso toma el lock caducado
+        original = feed.proxmox.get
+
+        def slow_get():
+            tasks = original()
+            feed.redis.set(feed._key('lock'), b'otro')
+            return tasks
+
+        feed.proxmox.get = slow_get
+        self.assertEqual(feed.poll(), [])
+        self.assertFalse(feed.is_synced())
+        self.assertEqual(feed.redis.get(feed._key('lock')), b'otro')
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ApiLimitTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _get(self, view, *args, headers=None, **params):
+        request = RequestFactory().get('/', params, headers=headers)
+        request.user = mock.Mock(is_authenticated=True)
+        return view(request, *args)
+
+    def test_non_positive_limits_are_clamped(self):
+        from . import views
+        with mock.patch.object(views.task_feed, 'recent', return_value=[]) as recent, \
+                mock.patch.object(views.task_feed, 'get_cursor', return_value=None):
+            for value in ('0', '-5'):
+                self._get(views.api_tasks, limit=value)
+                self.assertEqual(recent.call_args.kwargs['limit'], 1)
+        with mock.patch.object(views, '_search_guests', return_value=[]) as search:
+            self._get(views.api_search, q='web', limit='-1')
+            search.assert_called_once_with('web', 1)
+
+    def test_task_status_and_history_endpoints_negotiate_format(self):
+        from . import views
+        msgpack_accept = {'Accept': 'application/msgpack'}
+        with mock.patch.object(views.task_feed, 'tasks_for_vm', return_value=[{'upid': 'UPID:pve1:1'}]) as tasks, \
+                mock.patch.object(views.task_feed, 'get_cursor', return_value=None):
+            response = self._get(views.api_tasks, vmid='100', headers=msgpack_accept)
+            self.assertEqual(response['Content-Type'], 'application/msgpack')
+            self.assertEqual(msgpack.unpackb(response.content)['data'], [{'upid': 'UPID:pve1:1'}])
+            # La segunda petición se sirve con los bytes en caché
+            self.assertEqual(self._get(views.api_tasks, vmid='100', headers=msgpack_accept).content,
+                             response.content)
+            self.assertEqual(tasks.call_count, 1)
+
+        with mock.patch.object(views.scheduler, 'watch'), \
+                mock.patch.object(views.scheduler, 'get_status', return_value={'status': 'running'}):
+            response = self._get(views.api_vm_status, 'pve1', 100, headers=msgpack_accept)
+        self.assertEqual(msgpack.unpackb(response.content)['data'], {'status': 'running'})
+
+        with mock.patch.object(views.config_store, 'history', return_value=[]), \
+                mock.patch.object(views.config_store, 'diff', return_value=None):
+            response = self._get(views.api_vm_config_history, 100, headers=msgpack_accept)
+        self.assertEqual(msgpack.unpackb(response.content), {'success': True, 'data': [], 'diff': None})
+        response = self._get(views.api_vm_config_history, 100, **{'from': 'x'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertFalse(json.loads(response.content)['success'])
+
+
+
+class _RelayProxy(ConsoleProxy):
+    """Proxy que da por autenticado al usuario 1 para probar solo la retransmisión"""
+
+    async def authenticate(self, scope):
+        return '1'
+
+
+def _self_signed_context(directory):
+    """Contexto TLS de servidor con un certificado autofirmado para 127.0.0.1"""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'pve1')])
+    now = timezone.now()
+    cert = (x509.CertificateBuilder().subject_name(name).issuer_name(name).public_key(key.public_key())
+            .serial_number(1).not_valid_before(now).not_valid_after(now + timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]),
+                           critical=False)
+            .sign(key, hashes.SHA256()))
+    cert_path, key_path = Path(directory, 'cert.pem'), Path(directory, 'key.pem')
+    cert_path.write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    return context
+
+
+class PveProxyStandIn:
+    """
+    Servidor wss que imita `vncwebsocket` de pveproxy
+
+    Comprueba la ruta, el puerto y el ticket de la consulta, la cookie PVEAuthCookie y
+    el subprotocolo; en las sesiones de terminal exige "usuario:ticket\\n" como primer
+    mensaje. Después devuelve cada frame recibido.
+    """
+
+    def __init__(self, path, port, ticket, auth_ticket, login=None):
+        self.expected = (path, {'port': [str(port)], 'vncticket': [ticket]}, f'PVEAuthCookie={auth_ticket}')
+        self.login = login
+        self.requests = []
+
+    async def handler(self, websocket):
+        url = urlsplit(websocket.path)
+        self.requests.append((url.path, parse_qs(url.query), websocket.request_headers.get('Cookie'),
+                              websocket.subprotocol))
+        if self.requests[-1] != self.expected + ('binary',):
+            await websocket.close(1008)
+            return
+        if self.login is not None and await websocket.recv() != self.login:
+            await websocket.close(1008)
+            return
+        async for message in websocket:
+            await websocket.send(message)
+
+    async def serve(self, context):
+        return await websockets.serve(self.handler, '127.0.0.1', 0, ssl=context, subprotocols=['binary'],
+                                      max_size=None)
+
+
+async def _console_session(proxy, path, frames, headers=()):
+    """Abre un websocket de consola contra el proxy, envía `frames` y devuelve los mensajes ASGI enviados"""
+    inbound = asyncio.Queue()
+    sent = []
+    done = asyncio.Event()
+    expected = sum(map(len, frames))
+
+    async def send(message):
+        sent.append(message)
+        received = sum(len(m['bytes']) for m in sent if m['type'] == 'websocket.send')
+        if message['type'] == 'websocket.close' or received >= expected:
+            done.set()
+
+    scope = {'type': 'websocket', 'path': CONSOLE_PATH_PREFIX + path, 'headers': list(headers),
+             'subprotocols': ['binary']}
+    session = asyncio.ensure_future(proxy(scope, inbound.get, send))
+    await inbound.put({'type': 'websocket.connect'})
+    for frame in frames:
+        await inbound.put({'type': 'websocket.receive', 'bytes': frame})
+    await asyncio.wait_for(done.wait(), 5)
+    await inbound.put({'type': 'websocket.disconnect', 'code': 1000})
+    await asyncio.wait_for(session, 5)
+    return sent
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConsoleProxyTests(SimpleTestCase):
+
+    def _relay(self, kind, vm_type, frames, ticket='PVEVNC:abc'):
+        proxy = _RelayProxy(dict(_console_settings(), verify_ssl=False))
+        api = 'qemu' if vm_type == 'qemu' else 'lxc'
+        login = f'root@pam:{ticket}\n' if kind == 'term' else None
+        stand_in = PveProxyStandIn(f'/api2/json/nodes/pve1/{api}/100/vncwebsocket', 5901, ticket, 'PVE:root@pam:X',
+                                   login)
+
+        async def scenario():
+            with tempfile.TemporaryDirectory() as directory:
+                server = await stand_in.serve(_self_signed_context(directory))
+            proxy.config['pveproxy_port'] = server.sockets[0].getsockname()[1]
+            await cache.aset(TOKEN_PREFIX + 'tok', {'user_id': 1, 'node': 'pve1', 'vmid': 100, 'vm_type': vm_type,
+                                                    'kind': kind, 'host': '127.0.0.1', 'port': 5901,
+                                                    'ticket': ticket, 'pve_user': 'root@pam',
+                                                    'auth_ticket': 'PVE:root@pam:X'})
+            try:
+                first = await _console_session(proxy, 'tok/', frames)
+                second = await _console_session(proxy, 'tok/', [])
+            finally:
+                server.close()
+                await server.wait_closed()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        return proxy, stand_in, first, second
+
+    def test_relays_bytes_through_pveproxy_and_consumes_token(self):
+        frames = [b'hola', b'x' * 200000]
+        proxy, stand_in, first, second = self._relay('vnc', 'qemu', frames)
+        self.assertEqual(len(stand_in.requests), 1)
+        self.assertEqual(first[0], {'type': 'websocket.accept', 'subprotocol': 'binary'})
+        self.assertEqual(b''.join(m['bytes'] for m in first if m['type'] == 'websocket.send'), b''.join(frames))
+        self.assertEqual(proxy.sessions_per_node, {'pve1': 0})
+        # El token es de un solo uso
+        self.assertEqual(second, [{'type': 'websocket.close', 'code': 4403}])
+
+    def test_terminal_session_logs_in_before_relaying(self):
+        _, stand_in, first, _ = self._relay('term', 'lxc', [b'0:3:ls\n'], ticket='PVEVNC:term')
+        self.assertEqual(stand_in.requests[0][0], '/api2/json/nodes/pve1/lxc/100/vncwebsocket')
+        self.assertEqual(b''.join(m['bytes'] for m in first if m['type'] == 'websocket.send'), b'0:3:ls\n')
+
+    def test_session_requests_a_websocket_vncproxy(self):
+        proxmox = mock.Mock()
+        proxmox.get_tokens.return_value = ('PVE:root@pam:X', 'csrf')
+        proxmox.cluster.status.get.return_value = [{'type': 'node', 'name': 'pve1', 'ip': '10.0.0.1'}]
+        guest = proxmox.nodes.return_value.qemu.return_value
+        guest.vncproxy.post.return_value = {'port': '5901', 'ticket': 'PVEVNC:abc', 'user': 'root@pam'}
+        console = create_console_session(mock.Mock(pk=1), 'pve1', 100, proxmox=proxmox)
+        guest.vncproxy.post.assert_called_once_with(websocket=1)
+        target = cache.get(TOKEN_PREFIX + console['token'])
+        self.assertEqual((target['host'], target['auth_ticket']), ('10.0.0.1', 'PVE:root@pam:X'))
+        self.assertEqual(ConsoleProxy().target_url(target),
+                         'wss://10.0.0.1:8006/api2/json/nodes/pve1/qemu/100/vncwebsocket'
+                         '?port=5901&vncticket=PVEVNC%3Aabc')
+
+    def test_malformed_cookie_is_rejected(self):
+        headers = [(b'cookie', b'sessionid=abc; $bad')]
+        sent = asyncio.run(_console_session(ConsoleProxy(), 'tok/', [], headers=headers))
+        self.assertEqual(sent, [{'type': 'websocket.close', 'code': 4403}])
+
+
+class ConsoleViewTests(SimpleTestCase):
+
+    def _request(self, method):
+        request = getattr(RequestFactory(), method)('/console/pve1/100/qemu/')
+        request.user = mock.Mock(is_authenticated=True)
+        request._dont_enforce_csrf_checks = True
+        return request
+
+    def test_get_does_not_open_a_console_session(self):
+        from . import views
+        with mock.patch.object(views, 'create_console_session') as create, \
+                mock.patch.object(views, 'render', return_value=HttpResponse()) as render:
+            views.vm_console(self._request('get'), 'pve1', 100, 'qemu')
+        create.assert_not_called()
+        self.assertNotIn('ws_url', render.call_args.args[2])
+
+    def test_post_returns_session(self):
+        from . import views
+        console = {'token': 'tok', 'ticket': 'PVEVNC:x', 'port': 5900}
+        with mock.patch.object(views, 'create_console_session', return_value=console):
+            response = views.vm_console(self._request('post'), 'pve1', 100, 'qemu')
+        data = json.loads(response.content)
+        self.assertEqual(data['ticket'], 'PVEVNC:x')
+        self.assertTrue(data['ws_url'].endswith('/console/ws/tok/'))
+
+
+class _SSHStandIn(paramiko.ServerInterface):
+    """Lado servidor de una conexión: acepta cualquier contraseña y responde según el usuario"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.username = None
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        self.username = username
+        return paramiko.AUTH_SUCCESSFUL
+
+    def check_channel_request(self, kind, chanid):
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_exec_request(self, channel, command):
+        output = self.outputs.get(self.username, {}).get(command.decode())
+
+        def reply():
+            if output is None:
+                channel.send_stderr(b'command not found\n')
+                channel.send_exit_status(127)
+            else:
+                channel.sendall(output.encode())
+                channel.send_exit_status(0)
+            channel.close()
+
+        # La respuesta se envía después de que el servidor confirme el exec
+        threading.Timer(0.05, reply).start()
+        return True
+
+
+class SSHServerStandIn:
+    """
+    Servidor SSH local para las pruebas del ejecutor
+
+    `outputs` es {usuario: {comando: salida}}; la fábrica de transportes de las
+    pruebas se autentica con el nombre del host como usuario, así cada "host"
+    responde con sus propias salidas.
+    """
+
+    host_key = None
+
+    def __init__(self, outputs):
+        if SSHServerStandIn.host_key is None:
+            SSHServerStandIn.host_key = paramiko.RSAKey.generate(2048)
+        self.outputs = outputs
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(16)
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            transport = paramiko.Transport(conn)
+            transport.add_server_key(self.host_key)
+            transport.start_server(server=_SSHStandIn(self.outputs))
+            self.transports.append(transport)
+
+    def close(self):
+        self.sock.close()
+        for transport in self.transports:
+            transport.close()
+
+    def transport_factory(self, host, config):
+        transport = paramiko.Transport(('127.0.0.1', self.port))
+        transport.connect(username=host, password='x')
+        return transport
+
+
+NODE_OUTPUTS = {
+    'arcstats': '6 1 0x01 1 0\nname type data\nhits 4 90\nmisses 4 10\n',
+    'diskstats': '   8       0 sda 100 0 0 250 50 0 0 100 0 0 0 0 0 0 0 0 0\n',
+    'procesos': '  1  0.5  0.1  1024 systemd\n',
+}
+
+
+class SSHExecutorTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = SSHServerStandIn({
+            'pve1': {NODE_COMMANDS[name]: output for name, output in NODE_OUTPUTS.items()},
+            # Salida truncada: una línea de diskstats con un campo no numérico
+            'pve2': {NODE_COMMANDS['arcstats']: '', NODE_COMMANDS['procesos']: '',
+                     NODE_COMMANDS['diskstats']: '   8 0 sda x 0 0 250 50 0 0 100 0 0 0 0\n'},
+        })
+        self.addCleanup(self.server.close)
+        config = dict(_ssh_settings(), channels_per_host=2, command_timeout=5)
+        self.executor = SSHExecutor(SSHConnectionPool(self.server.transport_factory, config), config)
+        self.addCleanup(self.executor.close)
+
+    def test_runs_commands_over_one_transport(self):
+        commands = list(NODE_COMMANDS.values()) + ['unknown']
+        results = self.executor.run({'pve1': commands})['pve1']
+        self.assertEqual([r.command for r in results], commands)
+        self.assertEqual([r.exit_status for r in results], [0, 0, 0, 127])
+        self.assertEqual(results[1].stdout, NODE_OUTPUTS['diskstats'])
+        self.assertEqual(len(self.server.transports), 1)
+
+    def test_unparseable_output_only_fails_that_host(self):
+        metrics = collect_node_metrics({'pve1': 'pve1', 'pve2': 'pve2'}, executor=self.executor)
+        self.assertEqual(metrics['pve1']['arcstats']['hit_ratio'], 90.0)
+        self.assertEqual(metrics['pve1']['diskstats']['sda']['latencia_lectura_ms'], 2.5)
+        self.assertEqual(metrics['pve1']['procesos'][0]['comando'], 'systemd')
+        self.assertIn('error', metrics['pve2'])
+        self.assertEqual(metrics['pve2']['diskstats'], {})
+
+    def test_unknown_host_key_is_rejected_by_default(self):
+        config = dict(_ssh_settings(), port=self.server.port, password='x', connect_timeout=5)
+        with self.assertRaises(paramiko.SSHException):
+            default_transport_factory('127.0.0.1', config)
+
+        with tempfile.NamedTemporaryFile('w', suffix='known_hosts') as known_hosts:
+            known_hosts.write(f'[127.0.0.1]:{self.server.port} ssh-rsa {self.server.host_key.get_base64()}\n')
+            known_hosts.flush()
+            transport = default_transport_factory('127.0.0.1', dict(config, known_hosts=known_hosts.name))
+        self.assertTrue(transport.is_authenticated())
+        transport.close()
+
+
+GUEST_OUTPUTS = {
+    'stat': 'cpu  100 0 100 700 100 0 0 0 0 0\ncpu  150 0 150 800 100 0 0 0 0 0\n',
+    'meminfo': 'MemTotal:  4194304 kB\nMemFree:  1048576 kB\nMemAvailable:  2097152 kB\n',
+    'df': 'Filesystem 1-blocks Used Available Capacity Mounted on\n/dev/sda1 100 25 75 25% /\n',
+}
+
+
+class GuestAuditTests(TestCase):
+
+    def test_unparseable_guest_is_skipped(self):
+        servidor = ProxmoxServer.objects.create(name='pve', hostname='pve', username='root@pam', password='x')
+        nodo = Nodo.objects.create(proxmox_server=servidor, nombre='pve1', hostname='pve1', ip_address='10.0.0.1')
+        so = SistemaOperativo.objects.create(nombre='Debian', version='12', tipo='linux', arquitectura='x86_64')
+        tipos = {nombre: TipoRecurso.objects.create(nombre=nombre, unidad_medida='u')
+                 for nombre in ('CPU', 'Memoria', 'Disco')}
+        vms = []
+        for i, ip in enumerate(('10.0.0.11', '10.0.0.12')):
+            vm = MaquinaVirtual.objects.create(nodo=nodo, sistema_operativo=so, nombre=f'vm{i}', hostname=f'vm{i}',
+                                               ip_address=ip, vmid=100 + i)
+            for tipo in tipos.values():
+                recurso = RecursoFisico.objects.create(nodo=nodo, tipo_recurso=tipo, nombre=f'{tipo.nombre}{i}',
+                                                       capacidad_total=100, capacidad_disponible=100)
+                AsignacionRecursosInicial.objects.create(maquina_virtual=vm, recurso=recurso, cantidad_asignada=1)
+            vms.append(vm)
+        now = timezone.now()
+        periodo = AuditoriaPeriodo.objects.create(fecha_inicio=now - timedelta(days=1), fecha_fin=now + timedelta(days=1))
+
+        broken = dict(GUEST_OUTPUTS, df='Filesystem 1-blocks Used Available Capacity Mounted on\n/dev/sda1\n')
+        server = SSHServerStandIn({
+            '10.0.0.11': {GUEST_COMMANDS[name]: output for name, output in GUEST_OUTPUTS.items()},
+            '10.0.0.12': {GUEST_COMMANDS[name]: output for name, output in broken.items()},
+        })
+        self.addCleanup(server.close)
+        config = dict(_ssh_settings(), command_timeout=5)
+        executor = SSHExecutor(SSHConnectionPool(server.transport_factory, config), config)
+        self.addCleanup(executor.close)
+
+        self.assertEqual(collect_guest_audit(periodo, MaquinaVirtual.objects.all(), executor), 3)
+        detalles = {d.recurso.tipo_recurso.nombre: d for d in AuditoriaRecursosDetalle.objects.select_related(
+            'recurso__tipo_recurso', 'auditoria_cabecera')}
+        self.assertEqual({d.auditoria_cabecera.maquina_virtual_id for d in detalles.values()}, {vms[0].vm_id})
+        self.assertEqual(float(detalles['CPU'].porcentaje_uso), 50.0)
+        self.assertEqual(float(detalles['Memoria'].porcentaje_uso), 50.0)
+        self.assertEqual(float(detalles['Disco'].porcentaje_uso), 25.0)
+
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConfigStoreTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_history_is_kept_per_cluster(self):
+        a, b = ConfigStore(cluster='pve-a'), ConfigStore(cluster='pve-b')
+        self.assertTrue(a.record('n1', 100, 'qemu', {'digest': 'd1', 'cores': 2}))
+        self.assertTrue(b.record('n9', 100, 'qemu', {'digest': 'x1', 'cores': 8}))
+        self.assertFalse(a.record('n1', 100, 'qemu', {'digest': 'd1', 'cores': 2}))
+        self.assertTrue(a.record('n1', 100, 'qemu', {'digest': 'd2', 'cores': 4}))
+
+        self.assertEqual([(v.version, v.digest) for v in a.history(100)], [(2, 'd2'), (1, 'd1')])
+        self.assertEqual([(v.version, v.digest) for v in b.history(100)], [(1, 'x1')])
+        self.assertEqual(a.cached_configs([100])[100]['config']['cores'], 4)
+        self.assertEqual(b.cached_configs([100])[100]['config']['cores'], 8)
+        self.assertEqual(a.diff(100)['changes']['changed'], {'cores': {'old': 2, 'new': 4}})
+
+    def test_concurrent_record_does_not_duplicate(self):
+        # Dos procesos sin la entrada en caché registran el mismo cambio
+        first, second = ConfigStore(cluster='pve'), ConfigStore(cluster='pve')
+        first.record('n1', 100, 'qemu', {'digest': 'd1'})
+        cache.clear()
+        latest = second._latest(100)
+        with mock.patch.object(ConfigStore, '_latest', side_effect=[(0, None), latest]):
+            self.assertFalse(second.record('n1', 100, 'qemu', {'digest': 'd1'}))
+        self.assertEqual(ConfiguracionVM.objects.filter(cluster='pve', vmid=100).count(), 1)
+
+    def test_sweep_counts_only_rows_written(self):
+        store = ConfigStore(cluster='pve')
+        store.record('n1', 100, 'qemu', {'digest': 'a1'})
+        store.record('n1', 101, 'qemu', {'digest': 'b1'})
+        store.record('n1', 101, 'qemu', {'digest': 'b2'})
+        configs = {100: {'digest': 'a2'}, 101: {'digest': 'b3'}, 102: {'digest': 'c1'}}
+        bulk_create = ConfiguracionVM.objects.bulk_create
+
+        def racing_bulk_create(rows, **kwargs):
+            # Otro proceso guarda la versión 3 de la VM 101 durante el barrido
+            ConfiguracionVM.objects.create(cluster='pve', nodo='n1', vmid=101, vm_type='qemu',
+                                           version=3, digest='other', config={})
+            return bulk_create(rows, **kwargs)
+
+        guests = [{'node': 'n1', 'vmid': vmid, 'type': 'qemu'} for vmid in configs]
+        with mock.patch.object(store, '_fetch', side_effect=lambda node, vmid, vm_type: configs[vmid]), \
+                mock.patch.object(ConfiguracionVM.objects, 'bulk_create', side_effect=racing_bulk_create):
+            self.assertEqual(store.sweep(guests), 2)
+
+        latest = {vmid: store._latest(vmid) for vmid in configs}
+        self.assertEqual(latest, {100: (2, 'a2'), 101: (3, 'other'), 102: (1, 'c1')})
+
+
+
+def _project_databases(**environ):
+    """DATABASES tal como los define sentinelnexus/settings.py con las variables de entorno dadas"""
+    path = Path(settings.BASE_DIR) / 'sentinelnexus' / 'settings.py'
+    with mock.patch.dict(os.environ, environ):
+        return runpy.run_path(str(path))['DATABASES']
+
+
+class DatabasePoolTests(SimpleTestCase):
+
+    def test_pool_is_built_with_django_health_check(self):
+        from psycopg_pool import ConnectionPool
+
+        databases = _project_databases(DB_POOL='True', DB_POOL_MAX_SIZE='7', DB_REPLICA_HOST='replica.local')
+        handler = ConnectionHandler(databases)
+        for alias in ('default', 'replica'):
+            # Construir el pool no abre conexiones, así que no hace falta servidor
+            pool = handler[alias].pool
+            self.assertIsInstance(pool, ConnectionPool)
+            self.assertEqual(pool.max_size, 7)
+            self.assertIs(pool._check, ConnectionPool.check_connection)
+        self.assertEqual(handler['replica'].settings_dict['HOST'], 'replica.local')
+
+    def test_persistent_connections_without_pool(self):
+        databases = _project_databases(DB_POOL='False', DB_CONN_MAX_AGE='60')
+        self.assertNotIn('OPTIONS', databases['default'])
+        self.assertEqual(databases['default']['CONN_MAX_AGE'], 60)
+        self.assertTrue(databases['default']['CONN_HEALTH_CHECKS'])
+
+    @skipIf(settings.DATABASES['default']['ENGINE'] != 'django.db.backends.postgresql',
+            'la suite no se ejecuta sobre PostgreSQL')
+    def test_pool_against_test_postgres(self):
+        # Con la configuración del proyecto (la de CI) la suite corre sobre PostgreSQL:
+        # los pools se conectan a la base de pruebas que ha creado el runner
+        target = connections['default'].settings_dict
+        databases = _project_databases(DB_POOL='True', DB_REPLICA_HOST=target['HOST'] or 'localhost')
+        for alias in databases:
+            databases[alias].update({key: target[key] for key in ('NAME', 'USER', 'PASSWORD', 'HOST', 'PORT')})
+        handler = ConnectionHandler(databases)
+        try:
+            for alias in ('default', 'replica'):
+                with handler[alias].cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    self.assertEqual(cursor.fetchone(), (1,))
+        finally:
+            handler.close_all()
+            for alias in ('default', 'replica'):
+                handler[alias].close_pool()
+
+
+REPLICA_DATABASES = {'default': {}, 'replica': {}}
+
+
+@override_settings(DATABASES=REPLICA_DATABASES)
+class ReplicaRouterTests(SimpleTestCase):
+
+    router = AnalyticsReplicaRouter()
+
+    def _middleware(self, view, cookies=None):
+        request = RequestFactory().post('/')
+        request.COOKIES.update(cookies or {})
+        return PrimaryPinningMiddleware(view)(request)
+
+    def test_writes_outside_requests_do_not_pin(self):
+        self.router.db_for_write(EstadisticaRecursos)
+        self.assertFalse(is_pinned())
+        self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'replica')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'default')
+        self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'replica')
+        self.assertEqual(self.router.db_for_read(Nodo), 'default')
+
+    def test_incidental_writes_do_not_pin_the_request(self):
+        def view(request):
+            self.router.db_for_write(Session)
+            self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'replica')
+            return HttpResponse()
+
+        self.assertNotIn(PIN_COOKIE, self._middleware(view).cookies)
+
+    def test_analytics_write_pins_rest_of_request(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'replica')
+            self.router.db_for_write(AuditoriaRecursosDetalle)
+            self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'default')
+            return HttpResponse()
+
+        self.assertIn(PIN_COOKIE, self._middleware(view).cookies)
+        self.assertFalse(is_pinned())
+
+    def test_pin_cookie_reads_primary_without_renewing(self):
+        def view(request):
+            self.assertEqual(self.router.db_for_read(EstadisticaRecursos), 'default')
+            return HttpResponse()
+
+        self.assertNotIn(PIN_COOKIE, self._middleware(view, {PIN_COOKIE: '1'}).cookies)
+
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CachedPayloadTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.data = {'cpu': 0.5}
+
+    def _get(self, timeout=60, **headers):
+        request = RequestFactory().get('/', headers=headers)
+        return cached_payload_response(request, 'inventory', lambda: dict(self.data), variant='nodes',
+                                       timeout=timeout)
+
+    def test_not_modified_only_while_body_is_unchanged(self):
+        first = self._get()
+        etag = first['ETag']
+        self.assertEqual(self._get(If_None_Match=etag).status_code, 304)
+
+        # Al caducar la entrada se reconstruye: el ETag viejo ya no vale si los datos cambiaron
+        self.data['cpu'] = 0.9
+        cache.clear()
+        response = self._get(If_None_Match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), {'cpu': 0.9})
+        self.assertNotEqual(response['ETag'], etag)
+
+        # Con los mismos datos el ETag se mantiene aunque cambie la versión
+        bump_version('inventory')
+        self.assertEqual(self._get(If_None_Match=f'W/{response["ETag"]}, "otro"').status_code, 304)
+
+    def test_gzip_respects_q_values(self):
+        self.data = {'vms': list(range(1000))}
+        cases = {'gzip, deflate': True, 'gzip;q=0': False, 'gzip;q=0.0, br': False, '*;q=0.5': True,
+                 'identity': False, '*, gzip;q=0': False, 'GZIP; q=0.8': True}
+        for header, expected in cases.items():
+            response = self._get(Accept_Encoding=header)
+            self.assertEqual(response.get('Content-Encoding') == 'gzip', expected, header)
+            body = gzip.decompress(response.content) if expected else response.content
+            self.assertEqual(json.loads(body), self.data)
+
+
+class LargeTableAdminTests(TestCase):
+
+    def test_keyset_cursor_does_not_mutate_request(self):
+        from django.contrib.auth.models import User
+
+        admin_user = User.objects.create_superuser('admin', 'admin@example.com', 'x')
+        self.client.force_login(admin_user)
+        response = self.client.get('/admin/submodulos/auditoriarecursosdetalle/', {'cursor': '50', 'q': '7'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.GET.get('cursor'), '50')
+        self.assertEqual(response.context['cl'].cursor, 50)
+        self.assertNotIn('cursor', response.context['cl'].params)
+
+    def test_numeric_search_filters_by_integer_equality(self):
+        from django.contrib.admin.sites import site
+
+        model_admin = site._registry[ConfiguracionVM]
+        for vmid in (100, 1000):
+            ConfiguracionVM.objects.create(cluster='pve', nodo='n1', vmid=vmid, digest='d', config={})
+        queryset = ConfiguracionVM.objects.all()
+
+        results, duplicates = model_admin.get_search_results(None, queryset, ' 100 ')
+        self.assertFalse(duplicates)
+        self.assertEqual([c.vmid for c in results], [100])
+        self.assertNotIn('UPPER', str(results.query))
+        self.assertEqual(model_admin.get_search_results(None, queryset, 'web')[0].count(), 0)
+        self.assertEqual(model_admin.get_search_results(None, queryset, '')[0].count(), 2)
+
+
+def _guest_docs(count, offset=0):
+    return {vmid: {'vmid': vmid, 'name': f'web-{vmid}', 'node': f'pve{vmid % 4}', 'tags': ['prod'],
+                   'ips': [f'10.0.{vmid // 250}.{vmid % 250}'], 'description': '', 'status': 'running'}
+            for vmid in range(100 + offset, 100 + offset + count)}
+
+
+class SearchIndexTests(SimpleTestCase):
+
+    def test_incremental_and_full_sync(self):
+        index = SearchIndex(min_similarity=0.4)
+        self.assertEqual(index.sync(_guest_docs(100)), (100, 0))
+        self.assertEqual(index.search('web-150', limit=1)[0][1]['vmid'], 150)
+
+        # Pocos cambios: se aplican sobre el estado actual
+        docs = _guest_docs(100)
+        docs[150] = dict(docs[150], name='db-150')
+        docs[151] = dict(docs[151], status='stopped')
+        state = index._state
+        self.assertEqual(index.sync(docs), (1, 0))
+        self.assertIs(index._state, state)
+        self.assertEqual(index.search('db-150')[0][1]['vmid'], 150)
+        self.assertEqual(index.search('151')[0][1]['status'], 'stopped')
+
+        # Casi todo cambia: se construye un estado nuevo y se sustituye
+        self.assertEqual(index.sync(_guest_docs(10, offset=1000)), (10, 100))
+        self.assertIsNot(index._state, state)
+        self.assertEqual(len(index), 10)
+        self.assertNotIn(150, [doc['vmid'] for _, doc in index.search('web-150')])
+        self.assertEqual(index.search('web-1105')[0][1]['vmid'], 1105)
+
+    def test_zero_min_similarity_is_kept(self):
+        self.assertEqual(SearchIndex(min_similarity=0).min_similarity, 0)
+        self.assertEqual(SearchIndex().min_similarity, 0.4)
+
+    def test_search_is_not_blocked_by_rebuild(self):
+        index = SearchIndex()
+        index.sync(_guest_docs(50))
+        started = threading.Event()
+        release = threading.Event()
+        original = index._analyze
+
+        def slow_analyze(doc):
+            started.set()
+            release.wait(5)
+            return original(doc)
+
+        with mock.patch.object(index, '_analyze', side_effect=slow_analyze):
+            worker = threading.Thread(target=index.sync, args=(_guest_docs(50, offset=500),))
+            worker.start()
+            self.assertTrue(started.wait(5))
+            # La reconstrucción está en curso y la búsqueda responde con el índice vigente
+            self.assertEqual(index.search('web-120')[0][1]['vmid'], 120)
+            release.set()
+            worker.join(5)
+        self.assertEqual(index.search('web-620')[0][1]['vmid'], 620)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_requests_do_not_wait_for_the_refresh(self):
+        from . import search, views
+
+        index = SearchIndex()
+        index.sync(_guest_docs(5))
+        release = threading.Event()
+
+        def slow_build():
+            release.wait(5)
+            return _guest_docs(5, offset=500)
+
+        with mock.patch.object(search, 'search_index', index), mock.patch.object(views, 'search_index', index), \
+                mock.patch.object(search, 'build_documents', side_effect=slow_build):
+            try:
+                started = time.monotonic()
+                self.assertEqual(views._search_guests('web-102', 1)[0]['vmid'], 102)
+                self.assertLess(time.monotonic() - started, 1)
+                release.set()
+                deadline = time.monotonic() + 5
+                while index.version is None and time.monotonic() < deadline:
+                    time.sleep(0.01)
+                self.assertEqual(views._search_guests('web-602', 1)[0]['vmid'], 602)
+            finally:
+                release.set()
+                search.stop_background_refresh(5)
+
+
+class FakeClusterLog:
+    """Sustituto de proxmoxer para `cluster.log.get()` sin entradas"""
+
+    def __init__(self):
+        self.cluster = self.log = self
+
+    def get(self, **params):
+        return []
+
+
+@skipIf(fakeredis is None, 'fakeredis no está instalado')
+@override_settings(CACHES=LOCMEM_CACHE)
+class ChangeDetectorTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.server = fakeredis.FakeServer()
+        self.scheduler = PollScheduler(proxmox=mock.Mock(), redis=fakeredis.FakeRedis(server=self.server),
+                                       config=_scheduler_settings())
+        patcher = mock.patch('submodulos.change_detector.scheduler', self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _task(self, n, task_type='qmconfig', vmid=100):
+        return {'upid': f'UPID:pve1:0000{n:04X}:00:6500000{n}:{task_type}:{vmid}:root@pam:', 'node': 'pve1',
+                'type': task_type, 'id': str(vmid), 'user': 'root@pam', 'starttime': 1000 + n,
+                'endtime': 1001 + n, 'status': 'OK'}
+
+    def _detectors(self, count):
+        # El feed del detector comparte Redis con el del worker follow_tasks pero no consulta Proxmox
+        feed = TaskFeed(proxmox=FakeProxmox([]), redis=fakeredis.FakeRedis(server=self.server))
+        feed.poll = lambda: []
+        detectors = [ChangeDetector(proxmox=FakeClusterLog(), config=dict(_change_detector_settings(), refresh=False))
+                     for _ in range(count)]
+        return feed, detectors
+
+    def test_detectors_see_tasks_polled_by_another_process(self):
+        worker = TaskFeed(proxmox=FakeProxmox([self._task(1)]), redis=fakeredis.FakeRedis(server=self.server))
+        feed, (first, second) = self._detectors(2)
+        with mock.patch('submodulos.change_detector.task_feed', feed):
+            # La primera lectura solo fija la posición del cursor
+            self.assertEqual(first.poll(), {})
+            worker.poll()
+            worker.proxmox._tasks = [self._task(1), self._task(2, 'qmstart', 101)]
+            worker.poll()
+
+            self.assertEqual(first.poll(), {'config': 1, 'status': 1})
+            # Otro detector (u otra lectura tras mover el cursor atrás) no los vuelve a aplicar
+            cache.delete(TASK_CURSOR_KEY)
+            cache.set(TASK_CURSOR_KEY, '0-0', None)
+            self.assertEqual(second.poll(), {})
+            self.assertEqual(first.poll(), {})
+
+    def test_same_task_from_log_and_tasks_is_applied_once(self):
+        _, (detector,) = self._detectors(1)
+        task = self._task(3)
+        entries = [{'node': 'pve1', 'uid': 1, 'time': 2000, 'msg': f"end task {task['upid']} OK"}]
+        self.assertEqual(len(detector.events_from_log(entries)), 1)
+        self.assertEqual(detector.events_from_tasks([task]), [])
+
+    def test_status_task_drops_the_cached_guest_status(self):
+        _, (detector,) = self._detectors(1)
+        self.scheduler.sync([{'node': 'pve1', 'vmid': 100, 'type': 'qemu', 'status': 'stopped'}])
+        self.scheduler.observe('pve1', 100, 'qemu', {'status': 'stopped', 'cpu': 0, 'mem': 0, 'maxmem': 1})
+        self.assertEqual(self.scheduler.get_status('pve1', 100)['status'], 'stopped')
+
+        detector.apply(detector.events_from_tasks([self._task(4, 'qmstart', 100)]))
+
+        self.assertIsNone(cache.get(f'{STATUS_PREFIX}100'))
+        # El próximo sondeo se adelanta a ahora en lugar de esperar stopped_interval
+        self.assertLessEqual(self.scheduler.redis.zscore(self.scheduler._key('due'), 'pve1/100'), time.time())
+
+    def test_vm_action_drops_the_cached_guest_status(self):
+        from . import views
+        self.scheduler.observe('pve1', 100, 'qemu', {'status': 'running', 'cpu': 0, 'mem': 0, 'maxmem': 1})
+        request = RequestFactory().post('/', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        request.user = mock.Mock(is_authenticated=True)
+        request._messages = mock.Mock()
+        with mock.patch.object(views, 'get_proxmox_connection'), mock.patch.object(views, 'scheduler', self.scheduler):
+            response = views.vm_action(request, 'pve1', 100, 'stop', vm_type='qemu')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(self.scheduler.get_status('pve1', 100))
+
+
+class SketchAccuracyTests(SimpleTestCase):
+
+    def test_quantiles_within_relative_error(self):
+        rng = np.random.default_rng(7)
+        values = np.concatenate([rng.uniform(0, 100, 50000), rng.lognormal(3, 0.5, 50000).clip(max=100)])
+        sketch = DDSketch(alpha=0.01)
+        sketch.add_many(values)
+        for q in (0.5, 0.9, 0.95, 0.99):
+            exact = float(np.quantile(values, q))
+            self.assertLessEqual(abs(sketch.quantile(q) - exact) / exact, 0.011, q)
+        self.assertAlmostEqual(sketch.mean, float(values.mean()), places=6)
+
+    def test_merged_sketches_match_a_single_sketch(self):
+        values = np.random.default_rng(8).uniform(0, 100, 20000)
+        whole = DDSketch(alpha=0.01)
+        whole.add_many(values)
+        parts = []
+        for chunk in np.array_split(values, 4):
+            part = DDSketch(alpha=0.01)
+            part.add_many(chunk)
+            parts.append(part.to_bytes())
+        merged = merge_sketches(parts, alpha=0.01)
+        self.assertEqual(merged.count, whole.count)
+        self.assertEqual(merged.quantiles((0.5, 0.99)), whole.quantiles((0.5, 0.99)))
+
+
+class RollupTests(TestCase):
+
+    def setUp(self):
+        servidor = ProxmoxServer.objects.create(name='pve', hostname='pve', username='root@pam', password='x')
+        nodo = Nodo.objects.create(proxmox_server=servidor, nombre='pve1', hostname='pve1', ip_address='10.0.0.1')
+        self.cpu = TipoRecurso.objects.create(nombre='CPU', unidad_medida='%')
+        self.recurso = RecursoFisico.objects.create(nodo=nodo, tipo_recurso=self.cpu, nombre='cpu',
+                                                    capacidad_total=100, capacidad_disponible=100)
+        so = SistemaOperativo.objects.create(nombre='Debian', version='12', tipo='linux', arquitectura='x86_64')
+        self.vm = MaquinaVirtual.objects.create(nodo=nodo, sistema_operativo=so, nombre='web', hostname='web',
+                                                vmid=100)
+        self.now = timezone.now()
+        self.auditoria = AuditoriaPeriodo.objects.create(fecha_inicio=self.now - timedelta(days=1),
+                                                         fecha_fin=self.now + timedelta(days=1))
+
+    def _periodo(self, start_hours, end_hours):
+        return EstadisticaPeriodo.objects.create(fecha_inicio=self.now + timedelta(hours=start_hours),
+                                                 fecha_fin=self.now + timedelta(hours=end_hours),
+                                                 nivel_agregacion='nodo')
+
+    def _samples(self, hours, values):
+        for value in values:
+            cabecera = AuditoriaRecursosCabecera.objects.create(maquina_virtual=self.vm, periodo=self.auditoria)
+            AuditoriaRecursosCabecera.objects.filter(pk=cabecera.pk).update(
+                fecha_registro=self.now + timedelta(hours=hours))
+            AuditoriaRecursosDetalle.objects.create(auditoria_cabecera=cabecera, recurso=self.recurso,
+                                                    consumo_actual=value, porcentaje_uso=value)
+
+    def test_only_closed_periods_are_computed_once(self):
+        closed = self._periodo(-3, -2)
+        empty = self._periodo(-2, -1)
+        open_ = self._periodo(-1, 1)
+        self._samples(-2.5, range(1, 101))
+        self._samples(0, [50])
+
+        self.assertEqual(rollup_pending(), 2)
+        # El periodo sin muestras queda marcado y no se vuelve a calcular en cada ejecución
+        self.assertEqual(rollup_pending(), 0)
+        self.assertFalse(EstadisticaRecursos.objects.filter(periodo=empty).exists())
+        self.assertFalse(EstadisticaPeriodo.objects.get(pk=open_.pk).sketch_calculado)
+
+        result = percentiles(self.cpu.pk, 'nodo')
+        self.assertEqual(result['muestras'], 100)
+        # Mediana de 1..100 (rango inferior 50) con el error relativo del sketch
+        self.assertAlmostEqual(result['percentiles']['p50'], 50, delta=50 * 0.011)
+        self.assertEqual(EstadisticaRecursos.objects.get(periodo=closed).uso_maximo, 100)
+
+    def test_recompute_replaces_rows(self):
+        periodo = self._periodo(-3, -2)
+        self._samples(-2.5, [10, 20])
+        compute_period_statistics(periodo)
+        self.assertEqual(compute_period_statistics(periodo), 1)
+        self.assertEqual(EstadisticaRecursos.objects.filter(periodo=periodo).count(), 1)
+
+    def test_samples_are_read_from_primary(self):
+        self._periodo(-3, -2)
+        self._samples(-2.5, [10])
+        router = AnalyticsReplicaRouter()
+        databases = dict(settings.DATABASES, replica=settings.DATABASES['default'])
+        reads = []
+
+        def load(*args):
+            reads.append(router.db_for_read(AuditoriaRecursosDetalle))
+            return [], np.array([], dtype=np.int64), np.array([])
+
+        with override_settings(DATABASES=databases), mock.patch('submodulos.rollups.load_samples', side_effect=load):
+            self.assertEqual(router.db_for_read(AuditoriaRecursosDetalle), 'replica')
+            rollup_pending()
+        self.assertEqual(reads, ['default'])
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class RecordTests(SimpleTestCase):
+
+    QEMU = {'vmid': 100, 'name': 'web', 'status': 'running', 'cpu': 0.25, 'cpus': 2, 'mem': 1024,
+            'maxmem': 4096, 'uptime': 60, 'pid': 4242, 'qmpstatus': 'running', 'running-qemu': '9.0.2'}
+
+    def test_unknown_fields_are_kept_in_extra(self):
+        vm = GuestRecord.from_api(self.QEMU, 'pve1', 'qemu')
+        self.assertEqual((vm.vmid, vm.node, vm.type, vm.cpus, vm.lock), (100, 'pve1', 'qemu', 2.0, None))
+        self.assertEqual(vm.extra, {'pid': 4242, 'qmpstatus': 'running', 'running-qemu': '9.0.2'})
+        self.assertEqual((vm['pid'], vm.get('qmpstatus'), vm.get('swap', 0)), (4242, 'running', 0))
+        self.assertIn('pid', vm)
+        self.assertNotIn('swap', vm)
+        with self.assertRaises(KeyError):
+            vm['swap']
+        # Sin campos desconocidos no se crea diccionario
+        self.assertIsNone(GuestRecord.from_api({'vmid': 101, 'status': 'stopped'}, 'pve1', 'qemu').extra)
+
+    def test_parse_guests_skips_non_guest_resources(self):
+        resources = [dict(self.QEMU, node='pve1', type='qemu', id='qemu/100'),
+                     {'id': 'storage/pve1/local', 'type': 'storage', 'node': 'pve1'},
+                     {'id': 'node/pve1', 'type': 'node', 'node': 'pve1', 'status': 'online'}]
+        guests = parse_guests(resources)
+        self.assertEqual([g.vmid for g in guests], [100])
+        self.assertEqual(guests[0].extra['id'], 'qemu/100')
+
+    def test_to_dict_is_flat_and_records_stay_off_the_payload_path(self):
+        vm = GuestRecord.from_api(self.QEMU, 'pve1', 'qemu')
+        expected = vm.to_dict()
+        self.assertNotIn('extra', expected)
+        self.assertEqual(expected['pid'], 4242)
+        self.assertEqual(pickle.loads(pickle.dumps(vm)), vm)
+        # Las respuestas de API se construyen con diccionarios, no con registros
+        for fmt in ('json', 'msgpack'):
+            with self.assertRaises(TypeError):
+                encode({'data': [vm]}, fmt)
+
+    def test_api_vms_serves_proxmox_dicts(self):
+        from . import views
+        proxmox = mock.Mock()
+        proxmox.nodes.get.return_value = [{'node': 'pve1'}]
+        proxmox.nodes.return_value.qemu.get.return_value = [dict(self.QEMU)]
+        proxmox.nodes.return_value.lxc.get.return_value = [{'vmid': 200, 'name': 'ct', 'status': 'stopped'}]
+        request = RequestFactory().get('/')
+        request.user = mock.Mock(is_authenticated=True)
+        cache.clear()
+        with mock.patch.object(views, 'get_proxmox_connection', return_value=proxmox):
+            vms = json.loads(views.api_get_vms(request).content)['data']
+        self.assertEqual(vms, [dict(self.QEMU, node='pve1', type='qemu'),
+                               {'vmid': 200, 'name': 'ct', 'status': 'stopped', 'node': 'pve1', 'type': 'lxc'}])
+
+    def test_api_nodes_builds_copies_with_status(self):
+        from . import views
+        listed = [{'node': 'pve1', 'status': 'online', 'cpu': 0.1, 'maxcpu': 8, 'uptime': 5,
+                   'ssl_fingerprint': 'AA:BB', 'level': ''}]
+        proxmox = mock.Mock()
+        proxmox.nodes.get.return_value = listed
+        proxmox.nodes.return_value.status.get.return_value = {
+            'cpu': 0.5, 'uptime': 99, 'memory': {'total': 8, 'used': 3, 'free': 5}}
+        request = RequestFactory().get('/')
+        request.user = mock.Mock(is_authenticated=True)
+        with mock.patch.object(views, 'get_proxmox_connection', return_value=proxmox):
+            response = views.api_get_nodes(request)
+        node = json.loads(response.content)['data'][0]
+        self.assertEqual((node['cpu'], node['uptime'], node['memory']['used']), (0.5, 99, 3))
+        self.assertEqual(node['ssl_fingerprint'], 'AA:BB')
+        self.assertEqual(listed[0]['cpu'], 0.1)
+        self.assertEqual(parse_nodes(listed)[0], NodeRecord.from_api(listed[0]))
+
+
+class RebalancerTests(TestCase):
+
+    GIB = 1 << 30
+
+    def _resources(self):
+        nodes = [{'type': 'node', 'node': 'pve1', 'status': 'online', 'cpu': 0.9, 'maxcpu': 8,
+                  'mem': 14 * self.GIB, 'maxmem': 16 * self.GIB},
+                 {'type': 'node', 'node': 'pve2', 'status': 'online', 'cpu': 0.1, 'maxcpu': 8,
+                  'mem': 2 * self.GIB, 'maxmem': 16 * self.GIB}]
+        guests = [{'type': 'qemu', 'node': 'pve1', 'vmid': vmid, 'name': f'vm{vmid}', 'status': 'running',
+                   'cpu': 0.5, 'maxcpu': 4, 'mem': 3 * self.GIB, 'maxmem': 4 * self.GIB}
+                  for vmid in (100, 101, 102, 103)]
+        storages = [{'type': 'storage', 'node': node, 'storage': storage, 'shared': shared, 'status': 'available'}
+                    for node in ('pve1', 'pve2') for storage, shared in (('local-lvm', 0), ('ceph', 1))]
+        return nodes + guests + storages
+
+    def test_plan_moves_load_to_the_idle_node(self):
+        resources = self._resources()
+        plan = plan_migrations([NodeRecord.from_api(r) for r in resources if r['type'] == 'node'],
+                               parse_guests(resources), dict(_rebalancer_settings(), max_moves=5))
+        self.assertTrue(plan['moves'])
+        self.assertTrue(all(move['source'] == 'pve1' and move['target'] == 'pve2' for move in plan['moves']))
+        self.assertLess(plan['peak_after'], plan['peak_before'])
+
+    def test_unknown_configs_and_local_disks_are_not_moved(self):
+        configs = {100: {'config': {'scsi0': 'local-lvm:vm-100-disk-0,size=32G'}},
+                   101: {'config': {'scsi0': 'ceph:vm-101-disk-0,size=32G', 'ide2': 'none,media=cdrom'}}}
+        fetched = {102: {'scsi0': 'ceph:vm-102-disk-0,size=32G', 'hostpci0': '0000:01:00.0'}}
+
+        def get_config(node, vmid, vm_type):
+            if vmid not in fetched:
+                raise ConnectionError('sin respuesta')
+            return fetched[vmid]
+
+        store = mock.Mock(cached_configs=lambda vmids: {v: configs[v] for v in vmids if v in configs},
+                          get_config=mock.Mock(side_effect=get_config))
+        with mock.patch('submodulos.rebalancer.config_store', store):
+            plan = Rebalancer(config=dict(_rebalancer_settings(), max_moves=5)).plan(self._resources())
+            # Solo la 101 está en almacenamiento compartido y sin dispositivos del host
+            self.assertEqual({move['vmid'] for move in plan['moves']}, {101})
+            self.assertEqual(sorted(c.args[1] for c in store.get_config.call_args_list), [102, 103])
+
+            allowed = Rebalancer(config=dict(_rebalancer_settings(), max_moves=5, with_local_disks=True))
+            self.assertEqual({move['vmid'] for move in allowed.plan(self._resources())['moves']}, {100, 101})
+
+    def test_plan_api_rejects_non_positive_max_moves(self):
+        from . import views
+        for value in ('0', '-3', 'x'):
+            request = RequestFactory().get('/', {'max_moves': value})
+            request.user = mock.Mock(is_authenticated=True)
+            with mock.patch.object(views.rebalancer, 'plan') as plan:
+                response = views.api_rebalance_plan(request)
+            self.assertFalse(json.loads(response.content)['success'])
+            plan.assert_not_called()
+
+    def test_plan_uses_recent_audited_cpu(self):
+        servidor = ProxmoxServer.objects.create(name='pve', hostname='pve', username='root@pam', password='x')
+        nodo = Nodo.objects.create(proxmox_server=servidor, nombre='pve1', hostname='pve1', ip_address='10.0.0.1')
+        cpu = TipoRecurso.objects.create(nombre='CPU', unidad_medida='%')
+        recurso = RecursoFisico.objects.create(nodo=nodo, tipo_recurso=cpu, nombre='cpu',
+                                               capacidad_total=100, capacidad_disponible=100)
+        so = SistemaOperativo.objects.create(nombre='Debian', version='12', tipo='linux', arquitectura='x86_64')
+        now = timezone.now()
+        periodo = AuditoriaPeriodo.objects.create(fecha_inicio=now - timedelta(days=1), fecha_fin=now + timedelta(days=1))
+        for vmid in (100, 101):
+            vm = MaquinaVirtual.objects.create(nodo=nodo, sistema_operativo=so, nombre=f'vm{vmid}',
+                                               hostname=f'vm{vmid}', vmid=vmid)
+            # La muestra al 100% queda fuera de la ventana
+            for minutes, value in ((-5, 5), (-10, 15), (-120, 100)):
+                cabecera = AuditoriaRecursosCabecera.objects.create(maquina_virtual=vm, periodo=periodo)
+                AuditoriaRecursosCabecera.objects.filter(pk=cabecera.pk).update(
+                    fecha_registro=now + timedelta(minutes=minutes))
+                AuditoriaRecursosDetalle.objects.create(auditoria_cabecera=cabecera, recurso=recurso,
+                                                        consumo_actual=value, porcentaje_uso=value)
+
+        # pve1 muestra un pico pasajero de las VMs 100 (100%) y 101 (70%); de media usan un 10%
+        resources = [r for r in self._resources() if r['type'] != 'node' or r['node'] == 'pve2']
+        resources.append({'type': 'node', 'node': 'pve1', 'status': 'online', 'cpu': 0.9, 'maxcpu': 8,
+                          'mem': 2 * self.GIB, 'maxmem': 16 * self.GIB})
+        for resource in resources:
+            if resource['type'] == 'qemu':
+                resource.update(mem=self.GIB // 4, cpu={100: 1.0, 101: 0.7}.get(resource['vmid'], 0.0))
+        store = mock.Mock(cached_configs=lambda vmids: {v: {'config': {'scsi0': f'ceph:vm-{v}-disk-0'}}
+                                                        for v in vmids})
+        with mock.patch('submodulos.rebalancer.config_store', store):
+            plan = Rebalancer(config=dict(_rebalancer_settings(), max_moves=5)).plan(resources)
+            self.assertEqual(plan['before'], {'pve1': 0.15, 'pve2': 0.125})
+            self.assertEqual(plan['moves'], [])
+
+            instant = Rebalancer(config=dict(_rebalancer_settings(), max_moves=5, cpu_window=0)).plan(resources)
+            self.assertEqual(instant['before']['pve1'], 0.9)
+            self.assertTrue(instant['moves'])
+
+
+class FakeAgentProxmox:
+    """
+    Sustituto de proxmoxer para `nodes(n).qemu(v).agent('network-get-interfaces').get()`
+
+    `behaviour` indica por vmid una IP, 'hang' (no responde hasta `release`) o una excepción.
+    """
+
+    def __init__(self, behaviour, delay=0.0):
+        self.behaviour = behaviour
+        self.delay = delay
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.in_flight = {}
+        self.peak = {}
+        self.total_peak = 0
+
+    def nodes(self, node):
+        fake = self
+
+        class Call:
+            def qemu(self, vmid):
+                self.vmid = vmid
+                return self
+
+            def agent(self, command):
+                return self
+
+            def get(self):
+                return fake._answer(node, self.vmid)
+
+        return Call()
+
+    def _answer(self, node, vmid):
+        with self.lock:
+            self.in_flight[node] = self.in_flight.get(node, 0) + 1
+            self.peak[node] = max(self.peak.get(node, 0), self.in_flight[node])
+            self.total_peak = max(self.total_peak, sum(self.in_flight.values()))
+        try:
+            time.sleep(self.delay)
+            outcome = self.behaviour[vmid]
+            if outcome == 'hang':
+                self.release.wait(10)
+                raise TimeoutError('Read timed out')
+            if isinstance(outcome, Exception):
+                raise outcome
+            return {'result': [{'name': 'eth0', 'ip-addresses': [{'ip-address': outcome}]}]}
+        finally:
+            with self.lock:
+                self.in_flight[node] -= 1
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class IPDiscoveryTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _discovery(self, proxmox, **config):
+        discovery = IPDiscovery(proxmox=proxmox, config=dict(_ip_discovery_settings(), **config))
+        self.addCleanup(proxmox.release.set)
+        return discovery
+
+    @staticmethod
+    def _resources(vmids_by_node):
+        return [{'type': 'qemu', 'status': 'running', 'node': node, 'vmid': vmid}
+                for node, vmids in vmids_by_node.items() for vmid in vmids]
+
+    def test_hanging_agents_do_not_extend_the_sweep(self):
+        proxmox = FakeAgentProxmox({100: 'hang', 101: 'hang', 102: '10.0.0.2',
+                                    103: Exception('QEMU guest agent is not running'),
+                                    200: 'hang', 201: '10.0.0.21'})
+        discovery = self._discovery(proxmox, per_node_concurrency=4)
+        with mock.patch.object(discovery, 'write_ips', return_value=0) as write_ips:
+            started = time.monotonic()
+            stats = discovery.sweep(self._resources({'pve1': [100, 101, 102, 103], 'pve2': [200, 201]}),
+                                    deadline=0.3)
+        self.assertLess(time.monotonic() - started, 1.5)
+        self.assertEqual(stats['found'], 2)
+        self.assertEqual(stats['no_agent'], 4)
+        self.assertEqual(write_ips.call_args.args[0], {102: '10.0.0.2', 201: '10.0.0.21'})
+
+        # Los agentes que seguían colgados al llegar el límite quedan aplazados como el que falló
+        self.assertEqual(set(cache.get_many([f'{BACKOFF_PREFIX}{v}' for v in (100, 101, 103, 200)])),
+                         {f'{BACKOFF_PREFIX}{v}' for v in (100, 101, 103, 200)})
+        self.assertEqual(cache.get(f'{IP_CACHE_PREFIX}102'), '10.0.0.2')
+        targets, fresh, deferred = discovery.select_targets(
+            self._resources({'pve1': [100, 101, 102, 103], 'pve2': [200, 201]}))
+        self.assertEqual((targets, deferred), ([], 4))
+
+    def test_unstarted_queries_are_not_marked_dead(self):
+        proxmox = FakeAgentProxmox({100: 'hang', 101: '10.0.0.1', 102: '10.0.0.2'})
+        discovery = self._discovery(proxmox, per_node_concurrency=1)
+        with mock.patch.object(discovery, 'write_ips', return_value=0):
+            stats = discovery.sweep(self._resources({'pve1': [100, 101, 102]}), deadline=0.2)
+        # El único hueco del nodo se queda colgado en la 100: las otras dos no llegan a consultarse
+        self.assertEqual((stats['no_agent'], stats['unfinished']), (1, 2))
+        self.assertIsNotNone(cache.get(f'{BACKOFF_PREFIX}100'))
+        self.assertIsNone(cache.get(f'{BACKOFF_PREFIX}101'))
+
+    def test_per_node_concurrency_is_capped(self):
+        vmids = {'pve1': range(100, 112), 'pve2': range(200, 212), 'pve3': range(300, 312)}
+        proxmox = FakeAgentProxmox({vmid: f'10.0.{vmid // 100}.{vmid % 100}'
+                                    for node_vmids in vmids.values() for vmid in node_vmids}, delay=0.02)
+        discovery = self._discovery(proxmox, per_node_concurrency=2, max_workers=64)
+        with mock.patch.object(discovery, 'write_ips', return_value=0):
+            stats = discovery.sweep(self._resources(vmids), deadline=5)
+        self.assertEqual(stats['found'], 36)
+        self.assertEqual(proxmox.peak, {'pve1': 2, 'pve2': 2, 'pve3': 2})
+        # Los nodos se consultan en paralelo entre sí
+        self.assertGreater(proxmox.total_peak, 2)
+
+
+class FakeStorageProxmox:
+    """Sustituto de proxmoxer para `nodes(n).storage(s).content.get()` que anota cada escaneo"""
+
+    def __init__(self, content, down=()):
+        self.content = content
+        self.down = set(down)
+        self.scans = []
+
+    def nodes(self, node):
+        fake = self
+
+        class Storage:
+            def storage(self, storage):
+                self.name = storage
+                self.content = self
+                return self
+
+            def get(self):
+                fake.scans.append((node, self.name))
+                if node in fake.down:
+                    raise ConnectionError(f'{node} no responde')
+                return fake.content[self.name]
+
+        return Storage()
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class StorageIndexTests(SimpleTestCase):
+
+    CONTENT = {
+        'ceph': [{'volid': 'ceph:vm-100-disk-0', 'content': 'images', 'size': 10, 'vmid': 100},
+                 {'volid': 'ceph:vm-100-disk-1', 'content': 'images', 'size': 5, 'vmid': 100},
+                 {'volid': 'ceph:vm-999-disk-0', 'content': 'images', 'size': 7, 'vmid': 999}],
+        'local': [{'volid': 'local:iso/debian.iso', 'content': 'iso', 'size': 1}],
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.storages = [{'type': 'storage', 'node': node, 'storage': storage, 'shared': int(storage == 'ceph'),
+                          'status': 'available', 'disk': 100, 'maxdisk': 1000}
+                         for node in ('pve1', 'pve2', 'pve3') for storage in ('ceph', 'local')]
+        self.guests = [{'type': 'qemu', 'node': 'pve1', 'vmid': 100}]
+        service = mock.Mock(get_cluster_resources=lambda kind: self.storages if kind == 'storage' else self.guests)
+        store = mock.Mock(cached_configs=lambda vmids: {
+            100: {'config': {'scsi0': 'ceph:vm-100-disk-0,size=10G', 'unused0': 'ceph:vm-100-disk-1'}}})
+        for target, value in (('proxmox_service', service), ('config_store', store)):
+            patcher = mock.patch(f'submodulos.storage_index.{target}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_shared_storage_is_scanned_once_and_unchanged_usage_skips(self):
+        proxmox = FakeStorageProxmox(self.CONTENT)
+        index = StorageIndex(proxmox=proxmox, config=_storage_index_settings())
+        stats = index.refresh()
+        self.assertEqual(stats['storages'], 4)
+        self.assertEqual(sum(1 for _, storage in proxmox.scans if storage == 'ceph'), 1)
+        self.assertEqual(sorted(node for node, storage in proxmox.scans if storage == 'local'),
+                         ['pve1', 'pve2', 'pve3'])
+
+        # Mismo uso en cluster/resources: no se vuelve a pedir el contenido
+        proxmox.scans.clear()
+        self.assertEqual(index.refresh()['scanned'], 0)
+        self.assertEqual(proxmox.scans, [])
+
+        self.storages[0] = dict(self.storages[0], disk=150)
+        self.assertEqual(index.refresh()['scanned'], 1)
+        self.assertEqual(proxmox.scans, [('pve1', 'ceph')])
+
+    def test_shared_storage_falls_back_to_the_next_node(self):
+        proxmox = FakeStorageProxmox(self.CONTENT, down={'pve1'})
+        index = StorageIndex(proxmox=proxmox, config=_storage_index_settings())
+        stats = index.refresh()
+        self.assertEqual((stats['scanned'], stats['failed']), (3, 1))
+        self.assertEqual([node for node, storage in proxmox.scans if storage == 'ceph'], ['pve1', 'pve2'])
+        ceph = next(entry for entry in index.summary() if entry['storage'] == 'ceph')
+        self.assertEqual(ceph['volumes'], 3)
+        self.assertNotIn('pve1/local', [entry['storage'] for entry in index.summary()])
+
+    def test_orphans_are_classified(self):
+        index = StorageIndex(proxmox=FakeStorageProxmox(self.CONTENT), config=_storage_index_settings())
+        index.refresh()
+        orphans = {orphan['volid']: orphan['reason'] for orphan in index.orphans()}
+        self.assertEqual(orphans, {'ceph:vm-999-disk-0': 'vm_missing', 'ceph:vm-100-disk-1': 'unused'})
+        self.assertEqual(len(index.volumes_for_vm(100)), 2)
+        ceph = next(entry for entry in index.summary() if entry['storage'] == 'ceph')
+        self.assertEqual(ceph['orphaned_bytes'], 12)
+
+
+class _ApiPath:
+    """Ruta de proxmoxer: cada atributo o llamada añade un segmento"""
+
+    def __init__(self, fake, path=()):
+        self._fake = fake
+        self._path = path
+
+    def __getattr__(self, name):
+        return _ApiPath(self._fake, self._path + (name,))
+
+    def __call__(self, *segments):
+        return _ApiPath(self._fake, self._path + tuple(str(s) for s in segments))
+
+    def get(self, **params):
+        return self._fake.request('get', self._path, params)
+
+    def post(self, **params):
+        return self._fake.request('post', self._path, params)
+
+    def delete(self, **params):
+        return self._fake.request('delete', self._path, params)
+
+
+class FakeSnapshotProxmox:
+    """
+    Proxmox simulado para las tareas de instantánea
+
+    Cada operación devuelve un UPID que termina pasados `duration` segundos con
+    el resultado de `outcomes[(vmid, snapname)]` u `outcomes[vmid]` ('OK' por
+    defecto): un exitstatus, 'never' (no termina) o una excepción al enviarla.
+    Una tarea cuenta como en curso hasta que se consulta ya terminada.
+    """
+
+    def __init__(self, outcomes=None, duration=0.03):
+        self.outcomes = outcomes or {}
+        self.duration = duration
+        self.lock = threading.Lock()
+        self.tasks = {}
+        self.active = {}
+        self.peak = {}
+        self.intervals = []
+
+    def nodes(self, node):
+        return _ApiPath(self, ('nodes', node))
+
+    def request(self, method, path, params):
+        if path[2] == 'tasks':
+            return self._status(path[3])
+        vmid = int(path[3])
+        snapname = params['snapname'] if method == 'post' and path[-1] == 'snapshot' else path[5]
+        outcome = self.outcomes.get((vmid, snapname), self.outcomes.get(vmid, 'OK'))
+        if isinstance(outcome, Exception):
+            raise outcome
+        with self.lock:
+            upid = f'UPID:{path[1]}:{len(self.tasks)}'
+            self.tasks[upid] = (path[1], vmid, time.monotonic(), outcome)
+            self.active[path[1]] = self.active.get(path[1], 0) + 1
+            self.peak[path[1]] = max(self.peak.get(path[1], 0), self.active[path[1]])
+        return upid
+
+    def _status(self, upid):
+        node, vmid, started, outcome = self.tasks[upid]
+        if outcome == 'never' or time.monotonic() - started < self.duration:
+            return {'status': 'running'}
+        with self.lock:
+            if not any(interval[0] == upid for interval in self.intervals):
+                self.active[node] -= 1
+                self.intervals.append((upid, vmid, started, time.monotonic()))
+        return {'status': 'stopped', 'exitstatus': outcome}
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class BulkSnapshotTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def _runner(self, proxmox, **config):
+        config = dict(_snapshot_settings(), task_poll_interval=0.005, **config)
+        return BulkSnapshotRunner(proxmox=proxmox, inventory=mock.Mock(), config=config)
+
+    def test_node_slots_and_per_vm_order(self):
+        proxmox = FakeSnapshotProxmox()
+        targets = [{'node': node, 'vmid': vmid, 'vm_type': 'qemu', 'snapname': f'snap{i}'}
+                   for node, vmids in (('pve1', range(100, 106)), ('pve2', range(200, 203)))
+                   for vmid in vmids for i in range(1, 3 if vmid in (100, 200) else 2)]
+        results = self._runner(proxmox, per_node_concurrency=2).run('delete', targets)
+
+        self.assertEqual([r['status'] for r in results], ['ok'] * len(targets))
+        self.assertEqual(proxmox.peak, {'pve1': 2, 'pve2': 2})
+        # Las dos operaciones de la 100 y de la 200 no se solapan
+        for vmid in (100, 200):
+            first, second = sorted((start, end) for _, v, start, end in proxmox.intervals if v == vmid)
+            self.assertLessEqual(first[1], second[0])
+
+    def test_task_status_is_mapped(self):
+        proxmox = FakeSnapshotProxmox({101: 'snapshot feature is not available', 102: 'never',
+                                       103: ConnectionError('sin respuesta'), 300: 'never'})
+        runner = self._runner(proxmox, task_timeout=0.1)
+        targets = [{'node': 'pve1', 'vmid': vmid, 'vm_type': 'qemu', 'snapname': 'nightly'}
+                   for vmid in (100, 101, 102, 103)]
+        statuses = {r['vmid']: r['status'] for r in runner.run('create', targets)}
+        self.assertEqual(statuses, {100: 'ok', 101: 'error', 102: 'timeout', 103: 'error'})
+
+        # Con un solo hueco ocupado hasta el límite, la segunda VM no llega a empezar
+        runner = self._runner(proxmox, per_node_concurrency=1)
+        targets = [{'node': 'pve3', 'vmid': vmid, 'vm_type': 'lxc', 'snapname': 'nightly'} for vmid in (300, 301)]
+        results = runner.run('create', targets, deadline=0.1)
+        self.assertEqual([(r['vmid'], r['status'], r['upid'] is None) for r in results],
+                         [(300, 'timeout', False), (301, 'skipped', True)])
+
+    def test_rotation_keeps_the_newest_snapshots(self):
+        snapshots = [{'name': f'auto{day}', 'snaptime': day} for day in (3, 1, 4, 2)] + [
+            {'name': 'manual', 'snaptime': 0}]
+        entries = {vmid: {'node': 'pve1', 'vm_type': 'qemu', 'snapshots': snapshots} for vmid in (100, 101)}
+        runner = self._runner(FakeSnapshotProxmox({101: 'snapshot feature is not available'}))
+
+        plan = runner.plan_rotation({100: entries[100]}, 'auto', keep=2)
+        self.assertEqual([t['snapname'] for t in plan], ['auto1', 'auto2'])
+
+        result = runner.rotate('auto', keep=2, entries=entries)
+        self.assertEqual({r['vmid']: r['status'] for r in result['create']}, {100: 'ok', 101: 'error'})
+        # Solo se rota donde se creó la nueva instantánea, que cuenta entre las que se conservan
+        self.assertEqual([(t['vmid'], t['snapname'], t['status']) for t in result['delete']],
+                         [(100, 'auto1', 'ok'), (100, 'auto2', 'ok'), (100, 'auto3', 'ok')])
+
+
+class FakeClock:
+    """Reloj manual para el módulo de sharding (time.time); el resto del módulo time es el real"""
+
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+        self.monotonic = time.monotonic
+        self.sleep = time.sleep
+
+    def time(self):
+        return self.now
+
+
+@skipIf(fakeredis is None, 'fakeredis no está instalado')
+class ShardedCollectorTests(SimpleTestCase):
+
+    NODES = {node_key(nodo): nodo for nodo in (
+        mock.Mock(proxmox_server_id=server, nombre=f'pve{i}') for server in (1, 2) for i in range(15))}
+
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        self.clock = FakeClock()
+        patcher = mock.patch('submodulos.sharding.time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.collected = []
+
+    def _worker(self, worker_id, **config):
+        def collect(nodos, config):
+            self.collected.extend((self.clock.now // 60, worker_id, node_key(nodo)) for nodo in nodos)
+
+        worker = ShardedCollector(worker_id, collect=collect, redis=self.redis,
+                                  config=dict(_collector_settings(), interval=60, virtual_nodes=64, **config))
+        worker.nodes = lambda: self.NODES
+        self.addCleanup(worker._executor.shutdown)
+        return worker
+
+    @staticmethod
+    def _tick(worker):
+        claimed = worker.tick()
+        if worker._running is not None:
+            worker._running.result(5)
+        return claimed
+
+    def _collected_in_slot(self):
+        slot = self.clock.now // 60
+        return [(worker, key) for s, worker, key in self.collected if s == slot]
+
+    def test_each_node_is_collected_once_per_slot(self):
+        workers = [self._worker(name) for name in ('a', 'b', 'c')]
+        for worker in workers:
+            worker.heartbeat()
+        for _ in range(3):
+            for worker in workers:
+                self._tick(worker)
+
+        keys = [key for _, key in self._collected_in_slot()]
+        self.assertEqual(sorted(keys), sorted(self.NODES))
+        self.assertEqual(len({worker for worker, _ in self._collected_in_slot()}), 3)
+        # Un worker con un anillo desfasado que se cree dueño de todo no gana ninguna reclamación
+        self.assertEqual(workers[1].claim(list(self.NODES), int(self.clock.now // 60)), [])
+
+        # En el intervalo siguiente cada nodo se vuelve a recolectar, de nuevo una sola vez
+        self.clock.now += 60
+        for worker in workers:
+            self._tick(worker)
+        self.assertEqual(sorted(key for _, key in self._collected_in_slot()), sorted(self.NODES))
+
+    def test_leader_fails_over_after_lease_ttl(self):
+        a, b, c = (self._worker(name, lease_ttl=0.2) for name in ('a', 'b', 'c'))
+        for worker in (a, b, c):
+            worker.heartbeat()
+        # 'a' publica el anillo como líder y muere sin recolectar ni abandonar el grupo
+        self.assertTrue(a.elect())
+        self.assertEqual(a.publish_ring()['members'], ['a', 'b', 'c'])
+        for worker in (b, c):
+            self._tick(worker)
+        self.assertFalse(b.is_leader())
+        owned_by_a = set(self.NODES) - {key for _, key in self._collected_in_slot()}
+        self.assertTrue(owned_by_a)
+
+        # Sin latido de 'a' durante lease_ttl: el lease caduca y otro worker toma el relevo
+        time.sleep(0.3)
+        self.clock.now += 1
+        c.heartbeat()
+        for worker in (b, c):
+            self._tick(worker)
+        self.assertTrue(b.is_leader() or c.is_leader())
+        self.assertEqual(b.ring(), {'epoch': 2, 'members': ['b', 'c']})
+        # Los nodos de 'a' se recolectan en el mismo intervalo y ninguno dos veces
+        collected = [key for _, key in self._collected_in_slot()]
+        self.assertEqual(sorted(collected), sorted(self.NODES))
+        self.assertTrue(owned_by_a <= {key for worker, key in self._collected_in_slot() if worker in ('b', 'c')})
+
+    def test_ring_moves_only_the_joining_or_leaving_share(self):
+        keys = [f'{server}/pve{i}' for server in range(4) for i in range(250)]
+        before = HashRing(['a', 'b', 'c'], 128)
+        joined = HashRing(['a', 'b', 'c', 'd'], 128)
+        moved = [key for key in keys if before.owner(key) != joined.owner(key)]
+        # Solo se mueven nodos hacia el worker nuevo, alrededor de 1/4 del total
+        self.assertTrue(all(joined.owner(key) == 'd' for key in moved))
+        self.assertAlmostEqual(len(moved) / len(keys), 0.25, delta=0.1)
+
+        left = HashRing(['a', 'c'], 128)
+        moved = [key for key in keys if before.owner(key) != left.owner(key)]
+        self.assertEqual({before.owner(key) for key in moved}, {'b'})
+        self.assertEqual(len(moved), len(before.assign(keys)['b']))
+
+        # El líder publica una época nueva al entrar y al salir un worker
+        a, d = self._worker('a'), self._worker('d')
+        self._tick(a)
+        d.heartbeat()
+        self.assertEqual(a.publish_ring(), {'epoch': 2, 'members': ['a', 'd']})
+        self.assertEqual(sum(a.status()['workers'].values()), len(self.NODES))
+        d.leave()
+        self.assertEqual(a.publish_ring(), {'epoch': 3, 'members': ['a']})
+
+    def test_default_collect_keys_metrics_by_server_and_node(self):
+        nodos = [mock.Mock(proxmox_server_id=server, nombre='pve1', ip_address=f'10.0.{server}.1')
+                 for server in (1, 2)]
+        with mock.patch('submodulos.sharding.collect_node_metrics', return_value={}) as collect, \
+                mock.patch('submodulos.sharding.cache_node_metrics'):
+            default_collect(nodos, dict(_collector_settings(), guest_audit=False))
+        self.assertEqual(collect.call_args.args[0], {'1/pve1': '10.0.1.1', '2/pve1': '10.0.2.1'})
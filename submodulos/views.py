@@ -3,8 +3,30 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
 from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_http_methods
 from proxmoxer import ProxmoxAPI
 import json
+import logging
+
+from .config_store import config_store
+from .console import create_console_session
+from .forecasting import get_cached_forecasts
+from .governor import governor
+from .rebalancer import rebalancer
+from .records import parse_guests, parse_nodes
+from .responses import bump_version, cached_payload_response, payload_response
+from .rollups import DEFAULT_QUANTILES, percentiles
+from .scheduler import scheduler
+from .search import search_index, start_background_refresh
+from .snapshots import snapshot_inventory
+from .storage_index import storage_index
+from .task_feed import task_feed
+
+logger = logging.getLogger(__name__)
+
+# Segundos que se reutiliza una respuesta de inventario aunque no haya cambios
+API_CACHE_TIMEOUT = 15
 
 def get_proxmox_connection():
     """
@@ -16,7 +38,7 @@ def get_proxmox_connection():
         password=settings.PROXMOX_PASSWORD,
         verify_ssl=settings.PROXMOX_VERIFY_SSL
     )
-    return proxmox
+    return governor.govern(proxmox)
 
 @login_required
 def dashboard(request):
@@ -27,25 +49,17 @@ def dashboard(request):
     
     try:
         # Obtener todos los nodos
-        nodes = proxmox.nodes.get()
+        nodes = parse_nodes(proxmox.nodes.get())
         
         # Obtener todas las VMs
         vms = []
         for node in nodes:
-            node_name = node['node']
+            node_name = node.node
             # Obtener VMs (QEMU)
-            qemu_vms = proxmox.nodes(node_name).qemu.get()
-            for vm in qemu_vms:
-                vm['node'] = node_name
-                vm['type'] = 'qemu'
-                vms.append(vm)
+            vms.extend(parse_guests(proxmox.nodes(node_name).qemu.get(), node_name, 'qemu'))
             
             # Obtener LXC containers
-            lxc_containers = proxmox.nodes(node_name).lxc.get()
-            for container in lxc_containers:
-                container['node'] = node_name
-                container['type'] = 'lxc'
-                vms.append(container)
+            vms.extend(parse_guests(proxmox.nodes(node_name).lxc.get(), node_name, 'lxc'))
                 
         # Obtener resumen del cluster
         cluster_status = None
@@ -55,10 +69,14 @@ def dashboard(request):
             # Si no es un cluster, simplemente pasamos
             pass
             
+        # Pronósticos de agotamiento (solo se leen de caché)
+        forecasts = get_cached_forecasts()
+
         return render(request, 'dashboard.html', {
             'nodes': nodes,
             'vms': vms,
-            'cluster_status': cluster_status
+            'cluster_status': cluster_status,
+            'forecasts': forecasts['pronosticos'][:10] if forecasts else []
         })
     except Exception as e:
         messages.error(request, f"Error al conectar con Proxmox: {str(e)}")
@@ -79,14 +97,10 @@ def node_detail(request, node_name):
         node_status = proxmox.nodes(node_name).status.get()
         
         # Obtener VMs en este nodo
-        qemu_vms = proxmox.nodes(node_name).qemu.get()
-        for vm in qemu_vms:
-            vm['type'] = 'qemu'
+        qemu_vms = parse_guests(proxmox.nodes(node_name).qemu.get(), node_name, 'qemu')
             
         # Obtener contenedores LXC en este nodo
-        lxc_containers = proxmox.nodes(node_name).lxc.get()
-        for container in lxc_containers:
-            container['type'] = 'lxc'
+        lxc_containers = parse_guests(proxmox.nodes(node_name).lxc.get(), node_name, 'lxc')
             
         # Combinar VMs y contenedores
         vms = qemu_vms + lxc_containers
@@ -134,17 +148,24 @@ def vm_detail(request, node_name, vmid, vm_type=None):
         # Obtener estado actual
         if vm_type == 'qemu':
             vm_status = proxmox.nodes(node_name).qemu(vmid).status.current.get()
-            vm_config = proxmox.nodes(node_name).qemu(vmid).config.get()
         else:  # 'lxc'
             vm_status = proxmox.nodes(node_name).lxc(vmid).status.current.get()
-            vm_config = proxmox.nodes(node_name).lxc(vmid).config.get()
+
+        scheduler.watch(node_name, vmid)
+        scheduler.observe(node_name, vmid, vm_type, vm_status)
+
+        # La configuración se sirve desde el almacén y se revalida por digest
+        vm_config = config_store.get_config(node_name, vmid, vm_type)
         
-        # Obtener historial de tareas
-        tasks = proxmox.nodes(node_name).tasks.get(
-            vmid=vmid,
-            limit=10,
-            start=0
-        )
+        # Obtener historial de tareas (desde el índice si está sincronizado)
+        if task_feed.is_synced():
+            tasks = task_feed.tasks_for_vm(vmid, limit=10)
+        else:
+            tasks = proxmox.nodes(node_name).tasks.get(
+                vmid=vmid,
+                limit=10,
+                start=0
+            )
         
         return render(request, 'vm_detail.html', {
             'node_name': node_name,
@@ -152,6 +173,7 @@ def vm_detail(request, node_name, vmid, vm_type=None):
             'vm_type': vm_type,
             'vm_status': vm_status,
             'vm_config': vm_config,
+            'volumes': storage_index.volumes_for_vm(vmid),
             'tasks': tasks
         })
     except Exception as e:
@@ -204,6 +226,11 @@ def vm_action(request, node_name, vmid, action, vm_type=None):
             elif action == 'shutdown':
                 result = proxmox.nodes(node_name).lxc(vmid).status.shutdown.post()
         
+        # La acción cambia el estado y puede cambiar la configuración (p. ej. suspend/resume)
+        config_store.invalidate(vmid)
+        scheduler.invalidate(node_name, vmid)
+        bump_version('inventory')
+
         # Verificar el resultado
         if result is None:
             messages.error(request, f"Acción '{action}' no soportada para {vm_type}")
@@ -241,99 +268,184 @@ def vm_action(request, node_name, vmid, action, vm_type=None):
         else:
             return redirect('vm_detail', node_name=node_name, vmid=vmid)
 
+@login_required
+@require_http_methods(['GET', 'POST'])
+def vm_console(request, node_name, vmid, vm_type='qemu'):
+    """
+    Abre una consola noVNC (VNC) o xterm.js (terminal) de una VM o contenedor.
+
+    El GET solo sirve la página; el ticket de consola se pide a Proxmox en el
+    POST que hace la página al cargarse (con token CSRF), de modo que un enlace
+    o una precarga del navegador no abren sesiones de consola.
+    """
+    kind = request.GET.get('kind', 'vnc' if vm_type == 'qemu' else 'term')
+    if kind not in ('vnc', 'term'):
+        kind = 'vnc'
+
+    if request.method == 'GET':
+        return render(request, 'console.html', {
+            'node_name': node_name,
+            'vmid': vmid,
+            'vm_type': vm_type,
+            'kind': kind,
+        })
+
+    try:
+        console = create_console_session(request.user, node_name, vmid, vm_type, kind)
+    except Exception as e:
+        logger.error(f"Error al abrir la consola de {vmid} en {node_name}: {str(e)}")
+        return JsonResponse({
+            'success': False,
+            'message': f"Error al abrir la consola: {str(e)}"
+        }, status=502)
+
+    ws_scheme = 'wss' if request.is_secure() else 'ws'
+    return JsonResponse({
+        'success': True,
+        'ticket': console['ticket'],
+        'ws_url': f"{ws_scheme}://{request.get_host()}/console/ws/{console['token']}/"
+    })
+
+@login_required
+def activity(request):
+    """
+    Muestra la actividad reciente de todo el cluster desde el índice de tareas.
+    """
+    node_filter = request.GET.get('node')
+    user_filter = request.GET.get('user')
+
+    if node_filter:
+        tasks = task_feed.tasks_for_node(node_filter, limit=100)
+    elif user_filter:
+        tasks = task_feed.tasks_for_user(user_filter, limit=100)
+    else:
+        tasks = task_feed.recent(limit=100)
+
+    return render(request, 'activity.html', {
+        'tasks': tasks,
+        'node_filter': node_filter,
+        'user_filter': user_filter,
+        'synced': task_feed.is_synced()
+    })
+
+def _search_guests(query, limit):
+    """Busca sobre el índice vigente; un hilo en segundo plano lo mantiene sincronizado"""
+    start_background_refresh()
+    return [dict(doc, score=score) for score, doc in search_index.search(query, limit=limit)]
+
+@login_required
+def search(request):
+    """
+    Busca VMs y contenedores por nombre, vmid, etiquetas, IP o descripción.
+    """
+    query = request.GET.get('q', '').strip()
+    results = _search_guests(query, 100) if query else []
+
+    return render(request, 'search.html', {
+        'query': query,
+        'results': results
+    })
+
 # API endpoints
 @login_required
 def api_get_nodes(request):
     """
     API endpoint para obtener información de todos los nodos.
     """
-    proxmox = get_proxmox_connection()
-    
-    try:
-        nodes = proxmox.nodes.get()
-        
-        # Añadir información adicional a cada nodo
-        for node in nodes:
-            node_name = node['node']
+    def build():
+        proxmox = get_proxmox_connection()
+        nodes = []
+
+        # Los diccionarios de Proxmox se serializan directamente: los registros
+        # ahorran memoria pero serializarlos cuesta más que un diccionario
+        for node in proxmox.nodes.get():
             try:
-                status = proxmox.nodes(node_name).status.get()
-                node['cpu'] = status.get('cpu', 0)
-                node['memory'] = {
-                    'total': status.get('memory', {}).get('total', 0),
-                    'used': status.get('memory', {}).get('used', 0),
-                    'free': status.get('memory', {}).get('free', 0)
-                }
-                node['uptime'] = status.get('uptime', 0)
+                status = proxmox.nodes(node['node']).status.get()
+                memory = status.get('memory', {})
+                node = dict(node, cpu=status.get('cpu', 0), uptime=status.get('uptime', 0), memory={
+                    'total': memory.get('total', 0),
+                    'used': memory.get('used', 0),
+                    'free': memory.get('free', 0)
+                })
             except:
-                # Si hay error al obtener el estado, continuar con el siguiente nodo
+                # Si hay error al obtener el estado, se devuelve el nodo tal como viene del listado
                 pass
-                
-        return JsonResponse({
+            nodes.append(node)
+
+        return {
             'success': True,
             'data': nodes
-        })
+        }
+
+    try:
+        return cached_payload_response(request, 'inventory', build, variant='nodes', timeout=API_CACHE_TIMEOUT)
     except Exception as e:
-        return JsonResponse({
+        return payload_response({
             'success': False,
             'message': str(e)
-        })
+        }, request)
 
 @login_required
 def api_get_vms(request):
     """
     API endpoint para obtener información de todas las VMs.
     """
-    proxmox = get_proxmox_connection()
     node_filter = request.GET.get('node')
-    
-    try:
+
+    def build():
+        proxmox = get_proxmox_connection()
         nodes = proxmox.nodes.get()
         vms = []
-        
+
         for node in nodes:
             node_name = node['node']
-            
+
             # Si hay un filtro de nodo y este nodo no coincide, saltar
             if node_filter and node_name != node_filter:
                 continue
-                
+
             # Obtener VMs (QEMU)
             try:
-                qemu_vms = proxmox.nodes(node_name).qemu.get()
-                for vm in qemu_vms:
-                    vm['node'] = node_name
-                    vm['type'] = 'qemu'
-                    vms.append(vm)
+                vms.extend(dict(vm, node=node_name, type='qemu') for vm in proxmox.nodes(node_name).qemu.get())
             except:
                 # Si hay error, continuar con el siguiente tipo
                 pass
-            
+
             # Obtener contenedores LXC
             try:
-                lxc_containers = proxmox.nodes(node_name).lxc.get()
-                for container in lxc_containers:
-                    container['node'] = node_name
-                    container['type'] = 'lxc'
-                    vms.append(container)
+                vms.extend(dict(ct, node=node_name, type='lxc') for ct in proxmox.nodes(node_name).lxc.get())
             except:
                 # Si hay error, continuar con el siguiente nodo
                 pass
-                
-        return JsonResponse({
+
+        return {
             'success': True,
             'data': vms
-        })
+        }
+
+    try:
+        return cached_payload_response(request, 'inventory', build, variant=f'vms:{node_filter or ""}',
+                                       timeout=API_CACHE_TIMEOUT)
     except Exception as e:
-        return JsonResponse({
+        return payload_response({
             'success': False,
             'message': str(e)
-        })
+        }, request)
 
 @login_required
 def api_vm_status(request, node_name, vmid):
     """
     API endpoint para obtener el estado de una VM.
     """
+    # Mientras alguien consulta el estado, el planificador sondea la VM con más frecuencia
+    scheduler.watch(node_name, vmid)
+    cached = scheduler.get_status(node_name, vmid)
+    if cached is not None:
+        return payload_response({
+            'success': True,
+            'data': cached
+        }, request)
+
     proxmox = get_proxmox_connection()
     
     try:
@@ -347,10 +459,10 @@ def api_vm_status(request, node_name, vmid):
                 proxmox.nodes(node_name).lxc(vmid).status.current.get()
                 vm_type = 'lxc'
             except:
-                return JsonResponse({
+                return payload_response({
                     'success': False,
                     'message': f"No se encontró VM con ID {vmid} en el nodo {node_name}"
-                })
+                }, request)
         
         # Obtener estado actual
         if vm_type == 'qemu':
@@ -360,13 +472,226 @@ def api_vm_status(request, node_name, vmid):
             
         # Añadir información de tipo
         vm_status['type'] = vm_type
+        scheduler.observe(node_name, vmid, vm_type, vm_status)
             
-        return JsonResponse({
+        return payload_response({
             'success': True,
             'data': vm_status
-        })
+        }, request)
     except Exception as e:
-        return JsonResponse({
+        return payload_response({
             'success': False,
             'message': str(e)
-        })
\ No newline at end of file
+        }, request)
+
+@login_required
+def api_percentiles(request):
+    """
+    API endpoint para obtener percentiles de uso combinando los sketches de las estadísticas.
+
+    Parámetros: tipo_recurso, tipo_entidad, entidad (repetible), desde, hasta y q (repetible, 0-1).
+    """
+    try:
+        tipo_recurso = int(request.GET['tipo_recurso'])
+        entidades = [int(e) for e in request.GET.getlist('entidad')] or None
+        quantiles = tuple(float(q) for q in request.GET.getlist('q')) or DEFAULT_QUANTILES
+    except (KeyError, ValueError):
+        return payload_response({
+            'success': False,
+            'message': "Parámetros no válidos: se requiere tipo_recurso numérico"
+        }, request)
+    if any(not 0 <= q <= 1 for q in quantiles):
+        return payload_response({
+            'success': False,
+            'message': "Los cuantiles deben estar entre 0 y 1"
+        }, request)
+
+    desde = parse_datetime(request.GET['desde']) if request.GET.get('desde') else None
+    hasta = parse_datetime(request.GET['hasta']) if request.GET.get('hasta') else None
+    return payload_response({
+        'success': True,
+        'data': percentiles(tipo_recurso, request.GET.get('tipo_entidad', 'nodo'), entidades,
+                            desde=desde, hasta=hasta, quantiles=quantiles)
+    }, request)
+
+@login_required
+def api_rebalance_plan(request):
+    """
+    API endpoint para obtener (sin ejecutarlo) el plan de migraciones que equilibra los nodos.
+    """
+    try:
+        max_moves = int(request.GET['max_moves']) if request.GET.get('max_moves') else None
+    except ValueError:
+        max_moves = 0
+    if max_moves is not None and max_moves < 1:
+        return payload_response({
+            'success': False,
+            'message': "Parámetros no válidos: max_moves debe ser un entero mayor que 0"
+        }, request)
+
+    def build():
+        return {
+            'success': True,
+            'data': rebalancer.plan(max_moves=max_moves)
+        }
+
+    try:
+        return cached_payload_response(request, 'inventory', build, variant=f'rebalance:{max_moves or ""}',
+                                       timeout=API_CACHE_TIMEOUT)
+    except Exception as e:
+        return payload_response({
+            'success': False,
+            'message': str(e)
+        }, request)
+
+@login_required
+def api_forecasts(request):
+    """
+    API endpoint para obtener los pronósticos de agotamiento de recursos.
+    """
+    forecasts = get_cached_forecasts()
+    if forecasts is None:
+        return payload_response({
+            'success': False,
+            'message': "Los pronósticos aún no se han calculado"
+        }, request)
+
+    tipo_entidad = request.GET.get('tipo_entidad')
+
+    def build():
+        data = forecasts['pronosticos']
+        if tipo_entidad:
+            data = [f for f in data if f['tipo_entidad'] == tipo_entidad]
+        return {
+            'success': True,
+            'calculado': forecasts['calculado'],
+            'data': data
+        }
+
+    # Los pronósticos solo cambian al recalcularse, así que su fecha es la versión
+    return cached_payload_response(request, 'forecasts', build, variant=tipo_entidad or '',
+                                   version=forecasts['calculado'], timeout=3600)
+
+@login_required
+def api_search(request):
+    """
+    API endpoint para la búsqueda aproximada de VMs y contenedores (?q=&limit=).
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 20)), 200))
+    except ValueError:
+        limit = 20
+
+    query = request.GET.get('q', '').strip()
+    return payload_response({
+        'success': True,
+        'query': query,
+        'data': _search_guests(query, limit) if query else []
+    }, request)
+
+@login_required
+def api_vm_volumes(request, vmid):
+    """
+    API endpoint para obtener los volúmenes de una VM en todos los almacenamientos.
+    """
+    return payload_response({
+        'success': True,
+        'data': storage_index.volumes_for_vm(vmid)
+    }, request)
+
+@login_required
+def api_vm_snapshots(request, vmid):
+    """
+    API endpoint para obtener las instantáneas de una VM desde el inventario.
+    """
+    snapshots = snapshot_inventory.snapshots_for(vmid)
+    if snapshots is None:
+        return payload_response({
+            'success': False,
+            'message': f"La VM {vmid} no está en el inventario de instantáneas"
+        }, request)
+
+    return payload_response({
+        'success': True,
+        'data': snapshots
+    }, request)
+
+@login_required
+def api_storage(request):
+    """
+    API endpoint para obtener el resumen del índice de almacenamiento.
+    """
+    return payload_response({
+        'success': True,
+        'data': storage_index.summary()
+    }, request)
+
+@login_required
+def api_storage_orphans(request):
+    """
+    API endpoint para obtener los volúmenes huérfanos (?storage=<clave>).
+    """
+    return payload_response({
+        'success': True,
+        'data': storage_index.orphans(request.GET.get('storage'))
+    }, request)
+
+@login_required
+def api_tasks(request):
+    """
+    API endpoint para obtener tareas del índice por nodo, VM o usuario.
+    """
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 50)), 500))
+    except ValueError:
+        limit = 50
+
+    vmid, node, user = request.GET.get('vmid'), request.GET.get('node'), request.GET.get('user')
+
+    def build():
+        if vmid:
+            tasks = task_feed.tasks_for_vm(vmid, limit=limit)
+        elif node:
+            tasks = task_feed.tasks_for_node(node, limit=limit)
+        elif user:
+            tasks = task_feed.tasks_for_user(user, limit=limit)
+        else:
+            tasks = task_feed.recent(limit=limit)
+        return {
+            'success': True,
+            'cursor': task_feed.get_cursor(),
+            'data': tasks
+        }
+
+    # El feed cambia la versión de 'inventory' cada vez que escribe tareas
+    variant = f'tasks:{vmid or ""}:{node or ""}:{user or ""}:{limit}'
+    return cached_payload_response(request, 'inventory', build, variant=variant, timeout=API_CACHE_TIMEOUT)
+
+@login_required
+def api_vm_config_history(request, vmid):
+    """
+    API endpoint para obtener el historial de configuraciones de una VM
+    y las diferencias entre dos versiones (?from=<id>&to=<id>).
+    """
+    try:
+        from_id = int(request.GET['from']) if 'from' in request.GET else None
+        to_id = int(request.GET['to']) if 'to' in request.GET else None
+    except ValueError:
+        return payload_response({
+            'success': False,
+            'message': "Los parámetros 'from' y 'to' deben ser IDs de versión"
+        }, request)
+
+    versions = [{
+        'id': version.pk,
+        'version': version.version,
+        'node': version.nodo,
+        'digest': version.digest,
+        'fecha_registro': version.fecha_registro.isoformat()
+    } for version in config_store.history(vmid)]
+
+    return payload_response({
+        'success': True,
+        'data': versions,
+        'diff': config_store.diff(vmid, from_id, to_id)
+    }, request)